@@ -0,0 +1,188 @@
+# ========================
+# ANTI-SPAM: JANELA DESLIZANTE
+# ========================
+# Uma deque por membro com (instante, canal, mensagem) de cada mensagem:
+# registrar() põe no fim e tira do começo o que saiu da janela (O(1)
+# amortizado, sem recriar listas), e quem estourou o limite tem as mensagens da
+# janela à mão para a limpeza, em qualquer canal. Quem parou de falar
+# sai da tabela pela varredura periódica (e por uma varredura imediata quando a
+# tabela dobra de tamanho desde a anterior), então um raid de contas que postam
+# uma vez não fica na memória. Cada deque tem tamanho máximo, e a contagem
+# satura nele (bem acima de qualquer limite de mensagens razoável).
+#
+# Só é usado no loop do bot, então não tem trava.
+import re
+import sys
+from collections import deque
+
+MAX_POR_MEMBRO = 256
+# Tupla de 3 + float + dois snowflakes (ints de 64 bits)
+_BYTES_ENTRADA = sys.getsizeof((0.0, 0, 0)) + sys.getsizeof(0.0) + 2 * sys.getsizeof(2 ** 62)
+
+
+class RastreadorTaxa:
+    def __init__(self, intervalo: float = 5.0, max_por_membro: int = MAX_POR_MEMBRO):
+        self.intervalo = intervalo
+        self.max_por_membro = max_por_membro
+        self._janelas = {}
+        self.entradas = 0
+        self._proxima_varredura = 4096
+        self.pico_membros = 0
+        self.registrados = 0
+        self.varreduras = 0
+        self.removidos_varredura = 0
+
+    def __len__(self):
+        return len(self._janelas)
+
+    def registrar(self, uid: int, agora: float, intervalo: float = None,
+                  canal_id: int = 0, mensagem_id: int = 0) -> int:
+        # Quantas mensagens o membro mandou dentro da janela, contando esta
+        if intervalo is not None:
+            self.intervalo = intervalo
+        janela = self._janelas.get(uid)
+        if janela is None:
+            if len(self._janelas) >= self._proxima_varredura:
+                self.varrer(agora)
+            janela = self._janelas[uid] = deque(maxlen=self.max_por_membro)
+            if len(self._janelas) > self.pico_membros:
+                self.pico_membros = len(self._janelas)
+        if len(janela) < self.max_por_membro:
+            self.entradas += 1
+        janela.append((agora, canal_id, mensagem_id))
+        limite = agora - self.intervalo
+        while janela and janela[0][0] <= limite:
+            janela.popleft()
+            self.entradas -= 1
+        self.registrados += 1
+        return len(janela)
+
+    def varrer(self, agora: float) -> int:
+        # Remove quem não tem nenhuma mensagem dentro da janela
+        limite = agora - self.intervalo
+        parados = [uid for uid, janela in self._janelas.items() if not janela or janela[-1][0] <= limite]
+        for uid in parados:
+            self.entradas -= len(self._janelas.pop(uid))
+        self.varreduras += 1
+        self.removidos_varredura += len(parados)
+        self._proxima_varredura = max(2 * len(self._janelas), 4096)
+        return len(parados)
+
+    def retirar(self, uid: int) -> dict:
+        # Tira o membro da tabela e devolve {canal_id: [mensagem_id, ...]} da
+        # janela; a contagem dele recomeça do zero
+        janela = self._janelas.pop(uid, None)
+        por_canal = {}
+        if janela is None:
+            return por_canal
+        self.entradas -= len(janela)
+        for _, canal_id, mensagem_id in janela:
+            if mensagem_id:
+                por_canal.setdefault(canal_id, []).append(mensagem_id)
+        return por_canal
+
+    def bytes_estimados(self) -> int:
+        # Tabela + deques + entradas guardadas (aproximado; percorre todos). Chamado
+        # pelo Flask: list() copia os valores de uma vez, sem iterar o dict vivo
+        return (sys.getsizeof(self._janelas)
+                + sum(map(sys.getsizeof, list(self._janelas.values())))
+                + self.entradas * _BYTES_ENTRADA)
+
+    def estatisticas(self) -> dict:
+        return {
+            "membros": len(self._janelas),
+            "entradas": self.entradas,
+            "pico_membros": self.pico_membros,
+            "bytes_estimados": self.bytes_estimados(),
+            "mensagens_registradas": self.registrados,
+            "varreduras": self.varreduras,
+            "removidos_varredura": self.removidos_varredura
+        }
+
+
+# ========================
+# COMANDOS IGNORADOS: PREFIXOS COMPILADOS
+# ========================
+# A lista de comandos vira uma única regex ancorada no começo, montada a partir
+# de uma trie dos prefixos em minúsculas ("$h", "$mu" e "$mmi" viram
+# "\$(?:h|m(?:mi|u))"), então o teste percorre só o começo da mensagem em vez
+# de comparar com cada comando. Mesma regra de antes: a mensagem em minúsculas
+# e sem espaços nas pontas começa com algum comando. Prefixo que contém outro
+# ("$wa" e "$w") não acrescenta nada.
+_FIM = ""
+
+
+class PrefixosIgnorados:
+    def __init__(self, comandos=()):
+        self.compilar(comandos)
+
+    def compilar(self, comandos):
+        prefixos = {c.lower() for c in comandos}
+        self.total = len(prefixos)
+        if not prefixos:
+            self._regex = None
+        elif "" in prefixos:
+            # Comando vazio: como o startswith(""), casa com tudo
+            self._regex = re.compile("")
+        else:
+            trie = {}
+            for prefixo in prefixos:
+                no = trie
+                for letra in prefixo:
+                    no = no.setdefault(letra, {})
+                no[_FIM] = True
+            self._regex = re.compile(_regex_da_trie(trie), re.DOTALL)
+        return self
+
+    def corresponde(self, conteudo: str) -> bool:
+        if self._regex is None:
+            return False
+        return self._regex.match(conteudo.lower().strip()) is not None
+
+
+def _regex_da_trie(no: dict) -> str:
+    # Um prefixo que termina aqui já basta: não precisa descer mais
+    if _FIM in no:
+        return ""
+    ramos = [re.escape(letra) + _regex_da_trie(filho) for letra, filho in sorted(no.items())]
+    if len(ramos) == 1:
+        return ramos[0]
+    return "(?:" + "|".join(ramos) + ")"
+
+
+# ========================
+# CARGOS ISENTOS: IDS EM CACHE POR SERVIDOR
+# ========================
+# A config guarda nomes de cargo; aqui eles viram, uma vez por servidor, um
+# frozenset com os IDs dos cargos que têm esses nomes. O teste por mensagem é
+# só a interseção com os IDs do membro. O cache é por (servidor, regra) e cai
+# inteiro quando um cargo do servidor é criado, apagado ou renomeado, ou quando
+# a lista de nomes muda.
+class CargosIsentos:
+    def __init__(self):
+        self._cache = {}
+        self.resolucoes = 0
+
+    def ids(self, guild, regra: str, nomes) -> frozenset:
+        chave = (guild.id, regra)
+        ids = self._cache.get(chave)
+        if ids is None:
+            nomes = set(nomes)
+            ids = self._cache[chave] = frozenset(r.id for r in guild.roles if r.name in nomes)
+            self.resolucoes += 1
+        return ids
+
+    def isento(self, member, regra: str, nomes) -> bool:
+        guild = getattr(member, "guild", None)
+        if guild is None:
+            return False
+        # member._roles: IDs dos cargos que o discord.py já guarda no membro
+        return not self.ids(guild, regra, nomes).isdisjoint(getattr(member, "_roles", ()))
+
+    def invalidar(self, guild_id: int = None, regra: str = None):
+        if guild_id is None and regra is None:
+            self._cache.clear()
+            return
+        for chave in [c for c in self._cache
+                      if (guild_id is None or c[0] == guild_id) and (regra is None or c[1] == regra)]:
+            del self._cache[chave]
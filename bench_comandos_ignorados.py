@@ -0,0 +1,85 @@
+# Compara o teste de comando ignorado do anti-spam: o laço antigo (lower +
+# startswith para cada comando da config) com o PrefixosIgnorados compilado.
+# Usa a lista padrão da config e mensagens misturadas (comandos do Mudae,
+# texto comum e mensagens longas), e confere que os dois dão o mesmo resultado.
+#
+# Uso: python bench_comandos_ignorados.py [--mensagens 200000] [--comandos-extras 0]
+import argparse
+import random
+import string
+import time
+
+from antispam import PrefixosIgnorados
+
+COMANDOS_PADRAO = [
+    "$w", "$wa", "$wg", "$h", "$ha", "$hg",
+    "$W", "$WA", "$WG", "$H", "$HA", "$HG",
+    "$tu", "$TU", "$dk", "$mmi", "$vote", "$rolls", "$k", "$mu",
+    "$daily", "$Daily", "$rep", "$Rep", "$rep+", "$Rep+",
+    "$bitesthedust", "$kb", "$Kb", "$l", "$L", "$ldk", "$Ldk",
+]
+
+
+def laco_antigo(conteudo: str, comandos: list) -> bool:
+    conteudo_lower = conteudo.lower().strip()
+    for comando in comandos:
+        if conteudo_lower.startswith(comando.lower()):
+            return True
+        if conteudo_lower == comando.lower():
+            return True
+    return False
+
+
+def gerar_mensagens(quantidade: int, comandos: list, semente: int = 7) -> list:
+    rnd = random.Random(semente)
+    frases = ["bom dia pessoal", "alguém pro raid?", "kkkkkkk", "$$$ promoção", "$ x", "!play musica",
+              "o preço tá quanto?", "valeu demais!!"]
+    mensagens = []
+    for _ in range(quantidade):
+        sorteio = rnd.random()
+        if sorteio < 0.4:
+            comando = rnd.choice(comandos)
+            mensagens.append(rnd.choice(["", " "]) + rnd.choice([comando, comando.upper()]) +
+                             rnd.choice(["", " @alguem", " personagem"]))
+        elif sorteio < 0.9:
+            mensagens.append(rnd.choice(frases))
+        else:
+            mensagens.append("".join(rnd.choices(string.ascii_letters + " $", k=rnd.randrange(50, 500))))
+    return mensagens
+
+
+def medir(funcao, mensagens: list) -> tuple:
+    inicio = time.perf_counter()
+    resultados = [funcao(m) for m in mensagens]
+    return resultados, (time.perf_counter() - inicio) / len(mensagens) * 1e9
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Comandos ignorados: laço antigo x prefixos compilados")
+    parser.add_argument("--mensagens", type=int, default=200_000)
+    parser.add_argument("--comandos-extras", type=int, default=0,
+                        help="comandos aleatórios somados à lista padrão (simula listas grandes)")
+    args = parser.parse_args()
+
+    rnd = random.Random(1)
+    comandos = COMANDOS_PADRAO + ["$" + "".join(rnd.choices(string.ascii_lowercase, k=rnd.randrange(2, 8)))
+                                  for _ in range(args.comandos_extras)]
+    mensagens = gerar_mensagens(args.mensagens, comandos)
+
+    inicio = time.perf_counter()
+    compilado = PrefixosIgnorados(comandos)
+    compilar_us = (time.perf_counter() - inicio) * 1e6
+
+    antigo, antigo_ns = medir(lambda m: laco_antigo(m, comandos), mensagens)
+    novo, novo_ns = medir(compilado.corresponde, mensagens)
+    divergencias = sum(a != b for a, b in zip(antigo, novo))
+
+    print(f"📊 {len(mensagens):,} mensagens, {len(comandos)} comandos ({compilado.total} distintos em minúsculas), "
+          f"{sum(antigo):,} ignoradas")
+    print(f"⏱️ laço antigo: {antigo_ns:.0f}ns/mensagem | compilado: {novo_ns:.0f}ns/mensagem "
+          f"({antigo_ns / novo_ns:.1f}x) | compilar: {compilar_us:.0f}µs")
+    print(f"{'✅' if not divergencias else '❌'} divergências: {divergencias}")
+
+
+if __name__ == "__main__":
+    main()
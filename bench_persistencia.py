@@ -0,0 +1,187 @@
+# Benchmark da persistência contra o emulador local do GitHub (github_local.py).
+# Reproduz uma sequência gravada de operações (XP do on_message, entradas/saídas
+# da fila e resgates de fidelidade) com o mesmo caminho de gravação do bot:
+# diário local + gravação adiada + BackendGitHub.
+#
+# Uso: python bench_persistencia.py [--duracao 20] [--ops-por-segundo 200] [--latencia-ms 80]
+#      [--formato json|gzip|binario] [--trace ops.jsonl] [--gravar-trace ops.jsonl]
+import argparse
+import asyncio
+import json
+import os
+import random
+import tempfile
+import time
+
+from github_local import iniciar_servidor
+from persistencia import BackendGitHub, ClienteGitHub, Diario, FORMATOS_SNAPSHOT, GerenciadorPersistencia
+
+
+def gerar_trace(duracao: float, ops_por_segundo: float, membros: int, semente: int = 7) -> list:
+    # Mistura aproximada de um servidor movimentado: quase tudo é XP por mensagem
+    rnd = random.Random(semente)
+    ativos = [str(10 ** 17 + i) for i in range(membros)]
+    trace, t = [], 0.0
+    while t < duracao:
+        t += rnd.expovariate(ops_por_segundo)
+        sorteio = rnd.random()
+        if sorteio < 0.90:
+            op = "xp"
+        elif sorteio < 0.94:
+            op = "fila_entrar"
+        elif sorteio < 0.98:
+            op = "fila_sair"
+        else:
+            op = "resgate"
+        trace.append({"t": round(t, 4), "op": op, "uid": rnd.choice(ativos)})
+    return trace
+
+
+def dados_iniciais(membros: int) -> dict:
+    xp = {str(10 ** 17 + i): (i * 37) % 50_000 for i in range(membros)}
+    return {
+        "xp": xp,
+        "nivel": {uid: max(int((v / 100) ** 0.6) + 1, 1) for uid, v in xp.items()},
+        "fila": {"nome": "Fila de Serviços", "configuracoes": {"tamanho_maximo": 50, "aberta": True},
+                 "entradas": [], "historico": []},
+        "fidelidade": {uid: {"pontos": 500, "ultimo_pedido_ts": 0, "historico": [], "cupons": []}
+                       for uid in list(xp)[:max(membros // 20, 1)]},
+        "logs": [],
+        "config": {"taxa_xp": 3},
+    }
+
+
+def percentil(valores: list, p: float) -> float:
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    return ordenados[min(int(round(p * (len(ordenados) - 1))), len(ordenados) - 1)]
+
+
+async def executar(args, trace: list):
+    servidor, _ = iniciar_servidor(porta=0, latencia_ms=args.latencia_ms, variacao_ms=args.variacao_ms,
+                                   limite_hora=args.limite_hora, taxa_conflito=args.taxa_conflito)
+    metricas_servidor = servidor.RequestHandlerClass.metricas
+    url = f"http://127.0.0.1:{servidor.server_address[1]}/repos/bench/dados"
+    backend = BackendGitHub(ClienteGitHub(url, "bench", "main"), "data.json", "data", formato=args.formato)
+    await backend.carregar()
+
+    pasta = tempfile.mkdtemp(prefix="bench_persistencia_")
+    diario = Diario(os.path.join(pasta, "diario.jsonl"))
+    dados = dados_iniciais(args.membros)
+    latencias = []
+
+    async def gravar(mensagem, alterados):
+        inicio = time.perf_counter()
+        seq = diario.seq
+        dados["_diario_seq"] = seq
+        alterados = set(alterados) | {("_diario_seq",)}
+        ok = await backend.salvar(dados, alterados, mensagem)
+        if ok:
+            latencias.append((time.perf_counter() - inicio) * 1000)
+            diario.compactar(seq)
+        return ok
+
+    persistencia = GerenciadorPersistencia(gravar, intervalo=args.intervalo, max_alteracoes=args.max_alteracoes)
+    # Primeira gravação: cria os fragmentos no emulador (fora da medição)
+    await gravar("Carga inicial", {("*",)})
+    latencias.clear()
+    bytes_antes = metricas_servidor["bytes_recebidos"]
+    requisicoes_antes = metricas_servidor["requisicoes"]
+    persistencia.iniciar()
+
+    inicio = time.perf_counter()
+    proxima_fila = 0
+    for evento in trace:
+        if args.ops_por_segundo:
+            espera = evento["t"] - (time.perf_counter() - inicio)
+            if espera > 0:
+                await asyncio.sleep(espera)
+        uid, op = evento["uid"], evento["op"]
+        if op == "xp":
+            dados["xp"][uid] = dados["xp"].get(uid, 0) + 15
+            diario.registrar("set", ("xp", uid), dados["xp"][uid])
+            caminhos = [("xp", uid)]
+            nivel = max(int((dados["xp"][uid] / 100) ** 0.6) + 1, 1)
+            if nivel != dados["nivel"].get(uid):
+                dados["nivel"][uid] = nivel
+                diario.registrar("set", ("nivel", uid), nivel)
+                caminhos.append(("nivel", uid))
+            persistencia.marcar_alterado("XP", caminhos)
+        elif op == "fila_entrar":
+            proxima_fila += 1
+            dados["fila"]["entradas"].append({"id": str(proxima_fila), "uid": uid, "timestamp": evento["t"]})
+            diario.registrar("set", ("fila",), dados["fila"])
+            persistencia.marcar_alterado("Fila", [("fila",)])
+        elif op == "fila_sair" and dados["fila"]["entradas"]:
+            dados["fila"]["historico"].append(dados["fila"]["entradas"].pop(0))
+            diario.registrar("set", ("fila",), dados["fila"])
+            persistencia.marcar_alterado("Fila", [("fila",)])
+        elif op == "resgate":
+            perfil = dados["fidelidade"].setdefault(uid, {"pontos": 500, "historico": [], "cupons": []})
+            perfil["pontos"] -= 100
+            perfil["cupons"].append({"token": f"ZNK-{len(perfil['cupons'])}", "criado_em_ts": evento["t"]})
+            diario.registrar("set", ("fidelidade", uid), perfil)
+            # Como no bot: resgate grava na hora
+            await persistencia.gravar_agora("Resgate de fidelidade", [("fidelidade", uid)])
+    await persistencia.parar()
+    duracao = time.perf_counter() - inicio
+
+    stats = backend.estatisticas()
+    await backend.fechar()
+    servidor.shutdown()
+    return {
+        "operacoes": len(trace),
+        "duracao_s": duracao,
+        "gravacoes": len(latencias),
+        "gravacoes_por_s": len(latencias) / duracao if duracao else 0.0,
+        "p50_ms": percentil(latencias, 0.50),
+        "p99_ms": percentil(latencias, 0.99),
+        "max_ms": max(latencias, default=0.0),
+        "bytes_payload": stats["bytes_enviados"],
+        "bytes_enviados_http": metricas_servidor["bytes_recebidos"] - bytes_antes,
+        "requisicoes": metricas_servidor["requisicoes"] - requisicoes_antes,
+        "conflitos": sum(stats["conflitos_por_fragmento"].values()),
+        "conflitos_injetados": metricas_servidor["conflitos_injetados"],
+        "limite_restante": stats["limite_restante"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark da persistência contra o emulador do GitHub")
+    parser.add_argument("--duracao", type=float, default=20.0, help="segundos de trace gerado")
+    parser.add_argument("--ops-por-segundo", type=float, default=200.0, help="0 = o mais rápido possível")
+    parser.add_argument("--membros", type=int, default=10_000)
+    parser.add_argument("--formato", choices=FORMATOS_SNAPSHOT, default="json")
+    parser.add_argument("--intervalo", type=float, default=2.0, help="janela da gravação adiada")
+    parser.add_argument("--max-alteracoes", type=int, default=50)
+    parser.add_argument("--latencia-ms", type=float, default=80.0)
+    parser.add_argument("--variacao-ms", type=float, default=20.0)
+    parser.add_argument("--limite-hora", type=int, default=5000)
+    parser.add_argument("--taxa-conflito", type=float, default=0.0)
+    parser.add_argument("--trace", help="arquivo JSONL com as operações a reproduzir")
+    parser.add_argument("--gravar-trace", help="salva o trace gerado neste arquivo")
+    args = parser.parse_args()
+
+    if args.trace:
+        with open(args.trace, "r", encoding="utf-8") as f:
+            trace = [json.loads(linha) for linha in f if linha.strip()]
+    else:
+        trace = gerar_trace(args.duracao, args.ops_por_segundo or 200.0, args.membros)
+    if args.gravar_trace:
+        with open(args.gravar_trace, "w", encoding="utf-8") as f:
+            f.writelines(json.dumps(e) + "\n" for e in trace)
+
+    r = asyncio.run(executar(args, trace))
+    print(f"📊 {r['operacoes']:,} operações em {r['duracao_s']:.1f}s "
+          f"(formato {args.formato}, latência {args.latencia_ms:.0f}±{args.variacao_ms:.0f}ms)")
+    print(f"💾 gravações: {r['gravacoes']} ({r['gravacoes_por_s']:.2f}/s)")
+    print(f"⏱️ latência por gravação: p50 {r['p50_ms']:.1f}ms | p99 {r['p99_ms']:.1f}ms | máx {r['max_ms']:.1f}ms")
+    print(f"📦 enviados: {r['bytes_payload']:,} bytes de snapshot, {r['bytes_enviados_http']:,} bytes em HTTP "
+          f"({r['requisicoes']} requisições)")
+    print(f"🔀 conflitos: {r['conflitos']} (injetados: {r['conflitos_injetados']}) | "
+          f"limite restante: {r['limite_restante']}")
+
+
+if __name__ == "__main__":
+    main()
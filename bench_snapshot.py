@@ -0,0 +1,52 @@
+# Mede tamanho e tempo de codificação/decodificação dos formatos de snapshot.
+# Uso: python bench_snapshot.py [membros ...]   (padrão: 10000 100000 1000000)
+import random
+import sys
+import time
+
+from persistencia import FORMATOS_SNAPSHOT, codificar_snapshot, decodificar_snapshot
+
+
+def gerar_dados(membros: int, semente: int = 42) -> dict:
+    rnd = random.Random(semente)
+    ids = rnd.sample(range(10 ** 17, 10 ** 18), membros)
+    xp = {str(uid): rnd.randint(0, 250_000) for uid in ids}
+    nivel = {uid: max(int((v / 100) ** 0.6) + 1, 1) for uid, v in xp.items()}
+    fidelidade = {str(uid): {"nome": f"cliente{i}", "pedidos": rnd.randint(0, 20)}
+                  for i, uid in enumerate(ids[:max(membros // 100, 1)])}
+    logs = [{"data": "01/01/2026 12:00:00", "tipo": "xp", "mensagem": f"evento {i}"} for i in range(1000)]
+    return {"xp": xp, "nivel": nivel, "fidelidade": fidelidade, "logs": logs,
+            "xp_config": {"taxa": 10}, "_diario_seq": 12345}
+
+
+def medir(dados: dict, formato: str, repeticoes: int):
+    melhor_cod = melhor_dec = float("inf")
+    for _ in range(repeticoes):
+        t0 = time.perf_counter()
+        raw = codificar_snapshot(dados, formato)
+        t1 = time.perf_counter()
+        volta = decodificar_snapshot(raw)
+        t2 = time.perf_counter()
+        melhor_cod = min(melhor_cod, t1 - t0)
+        melhor_dec = min(melhor_dec, t2 - t1)
+    if volta != dados:
+        raise SystemExit(f"❌ Formato {formato} não preservou os dados")
+    return len(raw), melhor_cod * 1000, melhor_dec * 1000
+
+
+def main():
+    tamanhos = [int(a) for a in sys.argv[1:]] or [10_000, 100_000, 1_000_000]
+    for membros in tamanhos:
+        dados = gerar_dados(membros)
+        repeticoes = 3 if membros <= 100_000 else 1
+        print(f"\n📊 {membros:,} membros")
+        print(f"{'formato':<10}{'bytes':>14}{'codificar ms':>15}{'decodificar ms':>17}")
+        base = None
+        for formato in FORMATOS_SNAPSHOT:
+            tamanho, cod, dec = medir(dados, formato, repeticoes)
+            base = base or tamanho
+            print(f"{formato:<10}{tamanho:>14,}{cod:>15.1f}{dec:>17.1f}   ({tamanho / base:.0%} do json)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+# Compara a memória do XP em dicts no formato JSON (`dados["xp"]`/`dados["nivel"]`,
+# chave str) com o ArmazemXP (arrays int64/int32 ordenados por id), mais o
+# ranking, e mede o custo de consulta e de exportar para a gravação.
+#
+# Uso: python bench_xp_memoria.py [--membros 100000 1000000]
+import argparse
+import random
+import time
+import tracemalloc
+
+from sortedcontainers import SortedList
+
+from niveis import ArmazemXP, CurvaNivel, MotorXP, RankingXP
+
+
+def gerar(membros: int, semente: int = 7):
+    rnd = random.Random(semente)
+    curva = CurvaNivel()
+    # Snowflakes reais: ~18 dígitos, espalhados
+    ids = rnd.sample(range(10 ** 17, 10 ** 18), membros)
+    xp = {str(uid): rnd.randrange(0, 200_000) for uid in ids}
+    nivel = {uid: curva.nivel_de(valor) for uid, valor in xp.items()}
+    return xp, nivel
+
+
+def medir(construir):
+    # Bytes alocados (e ainda vivos) pela estrutura que construir() devolve
+    tracemalloc.start()
+    antes = tracemalloc.get_traced_memory()[0]
+    objeto = construir()
+    depois = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return objeto, depois - antes
+
+
+def rodar(membros: int):
+    xp, nivel = gerar(membros)
+    pares = [(int(uid), valor) for uid, valor in xp.items()]
+    r = {"membros": membros}
+
+    # Chaves e valores recriados para não contar objetos compartilhados com `xp`
+    _, r["dicts_json"] = medir(lambda: ({str(int(k)): int(str(v)) for k, v in xp.items()},
+                                        {str(int(k)): int(str(v)) for k, v in nivel.items()}))
+    _, r["dicts_int"] = medir(lambda: ({int(k): int(str(v)) for k, v in xp.items()},
+                                       {int(k): int(str(v)) for k, v in nivel.items()}))
+    armazem, r["armazem"] = medir(lambda: _armazem(xp, nivel))
+    _, r["ranking_tuplas"] = medir(lambda: SortedList((-v, uid) for uid, v in pares))
+    _, r["ranking_compacto"] = medir(lambda: _ranking(pares))
+
+    amostra = [int(uid) for uid in random.Random(1).sample(list(xp), min(membros, 100_000))]
+    dict_int = {int(k): v for k, v in xp.items()}
+    inicio = time.perf_counter()
+    for uid in amostra:
+        dict_int.get(uid)
+    r["consulta_dict_us"] = (time.perf_counter() - inicio) / len(amostra) * 1e6
+    inicio = time.perf_counter()
+    for uid in amostra:
+        armazem.xp[armazem.slot(uid)]
+    r["consulta_armazem_us"] = (time.perf_counter() - inicio) / len(amostra) * 1e6
+
+    motor = MotorXP(CurvaNivel())
+    motor.carregar(xp, nivel)
+    inicio = time.perf_counter()
+    for uid in amostra:
+        motor.adicionar(uid, 5)
+    r["adicionar_us"] = (time.perf_counter() - inicio) / len(amostra) * 1e6
+    inicio = time.perf_counter()
+    motor.exportar()
+    r["exportar_ms"] = (time.perf_counter() - inicio) * 1000
+    return r
+
+
+def _armazem(xp, nivel):
+    armazem = ArmazemXP()
+    armazem.carregar_json(xp, nivel)
+    return armazem
+
+
+def _ranking(pares):
+    ranking = RankingXP()
+    ranking.reconstruir(pares)
+    return ranking
+
+
+def mb(valor: int) -> str:
+    return f"{valor / 2 ** 20:8.1f} MB"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memória do XP: dicts JSON x arrays compactos")
+    parser.add_argument("--membros", type=int, nargs="+", default=[100_000, 1_000_000])
+    args = parser.parse_args()
+
+    for membros in args.membros:
+        r = rodar(membros)
+        print(f"\n📊 {membros:,} membros")
+        print(f"   dicts xp+nivel (chave str):  {mb(r['dicts_json'])}  ({r['dicts_json'] / membros:.0f} B/membro)")
+        print(f"   dicts xp+nivel (chave int):  {mb(r['dicts_int'])}  ({r['dicts_int'] / membros:.0f} B/membro)")
+        print(f"   ArmazemXP (arrays):          {mb(r['armazem'])}  ({r['armazem'] / membros:.0f} B/membro)")
+        print(f"   ranking em tuplas:           {mb(r['ranking_tuplas'])}  "
+              f"({r['ranking_tuplas'] / membros:.0f} B/membro)")
+        print(f"   ranking compacto:            {mb(r['ranking_compacto'])}  "
+              f"({r['ranking_compacto'] / membros:.0f} B/membro)")
+        print(f"⏱️ consulta: dict {r['consulta_dict_us']:.2f}µs | armazém {r['consulta_armazem_us']:.2f}µs | "
+              f"adicionar no motor {r['adicionar_us']:.2f}µs")
+        print(f"💾 exportar tudo para JSON (gravação completa): {r['exportar_ms']:.0f}ms")
+
+
+if __name__ == "__main__":
+    main()
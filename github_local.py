@@ -0,0 +1,333 @@
+# Emulador local (em memória) das rotas da API do GitHub usadas pelo bot:
+# Contents API (GET/PUT de arquivo, listagem de pasta, ETag/If-None-Match, 409
+# por SHA desatualizado) e Git Data API (blobs, trees, commits, refs), com
+# latência configurável, cabeçalhos X-RateLimit-* e conflitos injetados.
+# Uso: python github_local.py [--porta 8787] [--latencia-ms 80] [--limite-hora 5000]
+# e no bot: GITHUB_API_URL=http://127.0.0.1:8787 GITHUB_TOKEN=qualquer
+import argparse
+import base64
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+
+def _sha_git(tipo: str, conteudo: bytes) -> str:
+    return hashlib.sha1(f"{tipo} {len(conteudo)}\0".encode() + conteudo).hexdigest()
+
+
+class RepositorioLocal:
+    # Trees guardadas "achatadas" ({caminho completo: sha do blob}); basta para
+    # base_tree + caminhos com "/" como o bot usa
+
+    def __init__(self, branch: str = "main"):
+        self.trava = threading.Lock()
+        self.blobs = {}
+        self.trees = {}
+        self.commits = {}
+        self.refs = {}
+        tree = self._gravar_tree({})
+        self.refs[branch] = self._gravar_commit("Commit inicial", tree, [])
+
+    def _gravar_tree(self, arquivos: dict) -> str:
+        sha = _sha_git("tree", json.dumps(sorted(arquivos.items())).encode())
+        self.trees[sha] = dict(arquivos)
+        return sha
+
+    def _gravar_commit(self, mensagem: str, tree: str, pais: list) -> str:
+        sha = _sha_git("commit", json.dumps([mensagem, tree, pais, len(self.commits)]).encode())
+        self.commits[sha] = {"sha": sha, "message": mensagem, "tree": {"sha": tree},
+                             "parents": [{"sha": p} for p in pais]}
+        return sha
+
+    def _descende_de(self, commit: str, ancestral: str) -> bool:
+        pendentes = [commit]
+        while pendentes:
+            atual = pendentes.pop()
+            if atual == ancestral:
+                return True
+            pendentes.extend(p["sha"] for p in self.commits[atual]["parents"])
+        return False
+
+    def arquivos_do_branch(self, branch: str) -> dict:
+        commit = self.commits[self.refs[branch]]
+        return self.trees[commit["tree"]["sha"]]
+
+    # Contents API
+    def ler_arquivo(self, branch: str, caminho: str):
+        with self.trava:
+            arquivos = self.arquivos_do_branch(branch)
+            sha = arquivos.get(caminho)
+            if sha is None:
+                prefixo = caminho.rstrip("/") + "/"
+                itens = [{"name": c[len(prefixo):], "path": c, "sha": s, "type": "file", "size": len(self.blobs[s])}
+                         for c, s in sorted(arquivos.items()) if c.startswith(prefixo) and "/" not in c[len(prefixo):]]
+                if itens:
+                    return 200, itens
+                return 404, {"message": "Not Found"}
+            conteudo = base64.b64encode(self.blobs[sha]).decode()
+            return 200, {"path": caminho, "sha": sha, "encoding": "base64", "content": conteudo}
+
+    def gravar_arquivo(self, branch: str, caminho: str, corpo: dict):
+        conteudo = base64.b64decode(corpo.get("content", ""))
+        with self.trava:
+            arquivos = dict(self.arquivos_do_branch(branch))
+            atual = arquivos.get(caminho)
+            if atual is not None and not corpo.get("sha"):
+                return 422, {"message": "Invalid request. \"sha\" wasn't supplied."}
+            if atual is not None and corpo["sha"] != atual:
+                return 409, {"message": f"{caminho} does not match {corpo['sha']}"}
+            sha = _sha_git("blob", conteudo)
+            self.blobs[sha] = conteudo
+            arquivos[caminho] = sha
+            tree = self._gravar_tree(arquivos)
+            commit = self._gravar_commit(corpo.get("message", ""), tree, [self.refs[branch]])
+            self.refs[branch] = commit
+            return (200 if atual else 201), {"content": {"path": caminho, "sha": sha},
+                                             "commit": self.commits[commit]}
+
+    # Git Data API
+    def ler_ref(self, branch: str):
+        with self.trava:
+            if branch not in self.refs:
+                return 404, {"message": "Not Found"}
+            return 200, {"ref": f"refs/heads/{branch}", "object": {"sha": self.refs[branch], "type": "commit"}}
+
+    def ler_commit(self, sha: str):
+        with self.trava:
+            if sha not in self.commits:
+                return 404, {"message": "Not Found"}
+            return 200, self.commits[sha]
+
+    def criar_blob(self, corpo: dict):
+        if corpo.get("encoding") == "base64":
+            conteudo = base64.b64decode(corpo.get("content", ""))
+        else:
+            conteudo = corpo.get("content", "").encode("utf-8")
+        sha = _sha_git("blob", conteudo)
+        with self.trava:
+            self.blobs[sha] = conteudo
+        return 201, {"sha": sha}
+
+    def criar_tree(self, corpo: dict):
+        with self.trava:
+            base = corpo.get("base_tree")
+            if base and base not in self.trees:
+                return 422, {"message": "base_tree not found"}
+            arquivos = dict(self.trees.get(base, {}))
+            for entrada in corpo.get("tree", []):
+                if entrada.get("sha") is None:
+                    arquivos.pop(entrada["path"], None)
+                elif entrada["sha"] not in self.blobs:
+                    return 422, {"message": f"blob {entrada['sha']} not found"}
+                else:
+                    arquivos[entrada["path"]] = entrada["sha"]
+            return 201, {"sha": self._gravar_tree(arquivos)}
+
+    def criar_commit(self, corpo: dict):
+        with self.trava:
+            if corpo.get("tree") not in self.trees or any(p not in self.commits for p in corpo.get("parents", [])):
+                return 422, {"message": "tree or parent not found"}
+            sha = self._gravar_commit(corpo.get("message", ""), corpo["tree"], corpo.get("parents", []))
+            return 201, self.commits[sha]
+
+    def atualizar_ref(self, branch: str, corpo: dict):
+        with self.trava:
+            novo = corpo.get("sha")
+            if branch not in self.refs or novo not in self.commits:
+                return 422, {"message": "Reference does not exist"}
+            if not corpo.get("force") and not self._descende_de(novo, self.refs[branch]):
+                return 422, {"message": "Update is not a fast forward"}
+            self.refs[branch] = novo
+            return 200, {"ref": f"refs/heads/{branch}", "object": {"sha": novo, "type": "commit"}}
+
+
+class LimiteTaxa:
+    # Janela fixa de uma hora como a do GitHub; respostas 304 não contam
+
+    def __init__(self, limite: int):
+        self.limite = limite
+        self.usados = 0
+        self.reinicio = time.time() + 3600
+        self._trava = threading.Lock()
+
+    def _virar_janela(self):
+        if time.time() >= self.reinicio:
+            self.usados = 0
+            self.reinicio = time.time() + 3600
+
+    def esgotado(self) -> bool:
+        with self._trava:
+            self._virar_janela()
+            return self.usados >= self.limite
+
+    def consumir(self):
+        with self._trava:
+            self._virar_janela()
+            self.usados += 1
+
+    def cabecalhos(self) -> dict:
+        with self._trava:
+            return {
+                "X-RateLimit-Limit": str(self.limite),
+                "X-RateLimit-Remaining": str(max(self.limite - self.usados, 0)),
+                "X-RateLimit-Used": str(self.usados),
+                "X-RateLimit-Reset": str(int(self.reinicio)),
+                "X-RateLimit-Resource": "core",
+            }
+
+
+_ROTA_REPO = re.compile(r"^/repos/[^/]+/[^/]+/(?P<resto>.*)$")
+
+
+class ManipuladorGitHub(BaseHTTPRequestHandler):
+    repositorio: RepositorioLocal = None
+    branch_padrao = "main"
+    latencia_ms = 0.0
+    variacao_ms = 0.0
+    # Probabilidade de recusar um PUT/PATCH como se outro processo tivesse gravado antes
+    taxa_conflito = 0.0
+    limite: LimiteTaxa = None
+    sorteio = random.Random(0)
+    # Contadores para benchmarks
+    metricas = None
+
+    def log_message(self, formato, *args):
+        pass
+
+    def _responder(self, status: int, corpo):
+        dados = json.dumps(corpo).encode()
+        etag = None
+        if self.command == "GET" and status == 200:
+            # Como no GitHub: ETag do corpo da resposta e 304 se o cliente já o tiver
+            etag = f'"{hashlib.sha1(dados).hexdigest()}"'
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                for nome, valor in self.limite.cabecalhos().items():
+                    self.send_header(nome, valor)
+                self.end_headers()
+                return
+        self.limite.consumir()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(dados)))
+        if etag:
+            self.send_header("ETag", etag)
+        for nome, valor in self.limite.cabecalhos().items():
+            self.send_header(nome, valor)
+        self.end_headers()
+        self.wfile.write(dados)
+
+    def _corpo(self) -> dict:
+        tamanho = int(self.headers.get("Content-Length") or 0)
+        with self.repositorio.trava:
+            self.metricas["bytes_recebidos"] += tamanho
+        return json.loads(self.rfile.read(tamanho) or b"{}")
+
+    def _conflito_injetado(self) -> bool:
+        if self.taxa_conflito and self.sorteio.random() < self.taxa_conflito:
+            with self.repositorio.trava:
+                self.metricas["conflitos_injetados"] += 1
+            return True
+        return False
+
+    def _despachar(self, metodo: str):
+        if self.latencia_ms or self.variacao_ms:
+            time.sleep(max(self.latencia_ms + self.sorteio.uniform(-self.variacao_ms, self.variacao_ms), 0) / 1000)
+        with self.repositorio.trava:
+            self.metricas["requisicoes"] += 1
+        if self.limite.esgotado():
+            return self._responder(403, {"message": "API rate limit exceeded"})
+        url = urlparse(self.path)
+        casamento = _ROTA_REPO.match(url.path)
+        if not casamento:
+            return self._responder(404, {"message": "Not Found"})
+        resto = casamento.group("resto")
+        repo = self.repositorio
+        branch = parse_qs(url.query).get("ref", [self.branch_padrao])[0]
+
+        if resto.startswith("contents/"):
+            caminho = resto[len("contents/"):]
+            if metodo == "GET":
+                return self._responder(*repo.ler_arquivo(branch, caminho))
+            if metodo == "PUT":
+                corpo = self._corpo()
+                if corpo.get("sha") and self._conflito_injetado():
+                    return self._responder(409, {"message": f"{caminho} does not match {corpo['sha']}"})
+                return self._responder(*repo.gravar_arquivo(corpo.get("branch", self.branch_padrao), caminho, corpo))
+        elif metodo == "GET" and resto.startswith("git/ref/heads/"):
+            return self._responder(*repo.ler_ref(resto[len("git/ref/heads/"):]))
+        elif metodo == "GET" and resto.startswith("git/commits/"):
+            return self._responder(*repo.ler_commit(resto[len("git/commits/"):]))
+        elif metodo == "POST" and resto == "git/blobs":
+            return self._responder(*repo.criar_blob(self._corpo()))
+        elif metodo == "POST" and resto == "git/trees":
+            return self._responder(*repo.criar_tree(self._corpo()))
+        elif metodo == "POST" and resto == "git/commits":
+            return self._responder(*repo.criar_commit(self._corpo()))
+        elif metodo == "PATCH" and resto.startswith("git/refs/heads/"):
+            corpo = self._corpo()
+            if self._conflito_injetado():
+                return self._responder(422, {"message": "Update is not a fast forward"})
+            return self._responder(*repo.atualizar_ref(resto[len("git/refs/heads/"):], corpo))
+        self._responder(404, {"message": "Not Found"})
+
+    def do_GET(self):
+        self._despachar("GET")
+
+    def do_PUT(self):
+        self._despachar("PUT")
+
+    def do_POST(self):
+        self._despachar("POST")
+
+    def do_PATCH(self):
+        self._despachar("PATCH")
+
+
+def iniciar_servidor(host: str = "127.0.0.1", porta: int = 8787, branch: str = "main", latencia_ms: float = 0.0,
+                     variacao_ms: float = 0.0, limite_hora: int = 5000, taxa_conflito: float = 0.0, semente: int = 0):
+    # Sobe o emulador numa thread e devolve (servidor, repositorio); porta 0 escolhe uma livre.
+    # As métricas ficam em servidor.RequestHandlerClass.metricas.
+    repositorio = RepositorioLocal(branch)
+    manipulador = type("Manipulador", (ManipuladorGitHub,), {
+        "repositorio": repositorio,
+        "branch_padrao": branch,
+        "latencia_ms": latencia_ms,
+        "variacao_ms": variacao_ms,
+        "taxa_conflito": taxa_conflito,
+        "limite": LimiteTaxa(limite_hora),
+        "sorteio": random.Random(semente),
+        "metricas": {"requisicoes": 0, "bytes_recebidos": 0, "conflitos_injetados": 0},
+    })
+    servidor = ThreadingHTTPServer((host, porta), manipulador)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor, repositorio
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Emulador local da API do GitHub")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--porta", type=int, default=8787)
+    parser.add_argument("--branch", default="main")
+    parser.add_argument("--latencia-ms", type=float, default=0.0, help="atraso fixo por requisição")
+    parser.add_argument("--variacao-ms", type=float, default=0.0, help="variação aleatória (+/-) do atraso")
+    parser.add_argument("--limite-hora", type=int, default=5000, help="requisições por hora antes do 403")
+    parser.add_argument("--taxa-conflito", type=float, default=0.0, help="chance de recusar PUT/PATCH (0 a 1)")
+    args = parser.parse_args()
+    servidor, _ = iniciar_servidor(args.host, args.porta, args.branch, args.latencia_ms, args.variacao_ms,
+                                   args.limite_hora, args.taxa_conflito)
+    print(f"🧪 Emulador do GitHub em http://{args.host}:{servidor.server_address[1]} (branch {args.branch})")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        servidor.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,16 @@
 import os
 import json
-import base64
 import re
 import requests
 import time
 import secrets
 import hashlib
 from io import BytesIO
-from threading import Thread
+from threading import Thread, Lock
 from datetime import datetime, timezone, timedelta
 from functools import wraps
 import asyncio
+import heapq
 from flask import Flask, render_template_string, request, redirect, url_for, session, jsonify
 import discord
 from discord import app_commands
@@ -18,6 +18,9 @@ from discord.ext import commands
 from discord import ui, Interaction, ButtonStyle
 from PIL import Image, ImageDraw, ImageFont
 import uuid
+from persistencia import GerenciadorPersistencia, ClienteGitHub, Diario, BackendGitHub, BackendSQLite, CacheSnapshot
+from niveis import AnaliseXP, CooldownXP, CurvaNivel, FilaEfeitosNivel, MotorXP
+from antispam import CargosIsentos, PrefixosIgnorados, RastreadorTaxa
 
 # ========================
 # CONFIGURAÇÃO DO AMBIENTE
@@ -27,20 +30,53 @@ GITHUB_TOKEN = os.getenv("GITHUB_TOKEN")
 GITHUB_USER = os.getenv("GITHUB_USER", "pobonsanto-byte")
 GITHUB_REPO = os.getenv("GITHUB_REPO", "imune-bot-data")
 DATA_FILE = os.getenv("DATA_FILE", "data.json")
+# Pasta com um arquivo por domínio (xp, fila, fidelidade, credenciais, config, logs)
+DATA_SHARDS_DIR = os.getenv("DATA_SHARDS_DIR", os.path.splitext(DATA_FILE)[0])
+# Formato dos arquivos enviados: "json" (compacto), "gzip" ou "binario"; a leitura detecta sozinha
+SNAPSHOT_FORMATO = os.getenv("SNAPSHOT_FORMATO", "json").lower()
 BRANCH = os.getenv("GITHUB_BRANCH", "main")
 PORT = int(os.getenv("PORT", 8080))
 GUILD_ID = os.getenv("GUILD_ID")
 
+# Gravação adiada: no máximo uma gravação por intervalo (segundos) ou a cada N alterações
+PERSISTENCIA_INTERVALO = float(os.getenv("PERSISTENCIA_INTERVALO", 30))
+PERSISTENCIA_MAX_ALTERACOES = int(os.getenv("PERSISTENCIA_MAX_ALTERACOES", 50))
+# Diário local das alterações, reaplicado sobre o snapshot ao iniciar
+DIARIO_ARQUIVO = os.getenv("DIARIO_ARQUIVO", "diario.jsonl")
+# Onde os dados ficam: "github" (arquivo JSON no repositório) ou "sqlite" (banco local em WAL)
+ARMAZENAMENTO = os.getenv("ARMAZENAMENTO", "github").lower()
+SQLITE_ARQUIVO = os.getenv("SQLITE_ARQUIVO", "dados.db")
+# De quantos em quantos segundos o XP acumulado em memória vai para o diário/snapshot
+XP_SINCRONIZAR_SEGUNDOS = float(os.getenv("XP_SINCRONIZAR_SEGUNDOS", 5))
+# Análise do XP no painel: janela dos maiores ganhos e fração do XP total que
+# precisa se movimentar para o resultado guardado ser recalculado
+XP_ANALISE_JANELA_HORAS = float(os.getenv("XP_ANALISE_JANELA_HORAS", 24))
+XP_ANALISE_LIMIAR = float(os.getenv("XP_ANALISE_LIMIAR", 0.01))
+# Efeitos de subida de nível (anúncio e cargo): tamanho da fila e janela de agrupamento
+EFEITOS_NIVEL_FILA = int(os.getenv("EFEITOS_NIVEL_FILA", 1000))
+EFEITOS_NIVEL_JANELA = float(os.getenv("EFEITOS_NIVEL_JANELA", 3))
+# Ritmo base da reconciliação de cargos por nível (edições de membro por segundo)
+RECONCILIACAO_EDICOES_POR_SEGUNDO = max(float(os.getenv("RECONCILIACAO_EDICOES_POR_SEGUNDO", 1)), 0.01)
+# De quantos em quantos segundos o anti-spam esquece quem parou de mandar mensagens
+ANTISPAM_VARREDURA_SEGUNDOS = float(os.getenv("ANTISPAM_VARREDURA_SEGUNDOS", 30))
+# Logs: quantos ficam no snapshot e de quantos em quantos os antigos vão para o arquivo histórico
+LOGS_EM_MEMORIA = max(int(os.getenv("LOGS_EM_MEMORIA", 500)), 1)
+LOGS_LOTE_ARQUIVO = max(int(os.getenv("LOGS_LOTE_ARQUIVO", 200)), 1)
+# Cópia local do último snapshot do GitHub para subir sem baixar tudo; vazio desativa
+CACHE_SNAPSHOT_DIR = os.getenv("CACHE_SNAPSHOT_DIR", "cache_snapshot")
+
 # Configurações do site
 CLIENT_ID = os.getenv("CLIENT_ID")
 CLIENT_SECRET = os.getenv("CLIENT_SECRET")
 REDIRECT_URI = os.getenv("REDIRECT_URI", "https://seu-site.onrender.com/callback")
 SECRET_KEY = os.getenv("SECRET_KEY", secrets.token_hex(32))
 
-if not BOT_TOKEN or not GITHUB_TOKEN:
+if not BOT_TOKEN or (ARMAZENAMENTO == "github" and not GITHUB_TOKEN):
     raise SystemExit("Defina BOT_TOKEN e GITHUB_TOKEN nas variáveis de ambiente.")
 
-GITHUB_API_CONTENT = f"https://api.github.com/repos/{GITHUB_USER}/{GITHUB_REPO}/contents/{DATA_FILE}"
+# Trocar GITHUB_API_URL permite apontar para o emulador local (github_local.py)
+GITHUB_API_URL = os.getenv("GITHUB_API_URL", "https://api.github.com").rstrip("/")
+GITHUB_API_REPO = f"{GITHUB_API_URL}/repos/{GITHUB_USER}/{GITHUB_REPO}"
 
 # ========================
 # Sistema de ações
@@ -48,6 +84,7 @@ GITHUB_API_CONTENT = f"https://api.github.com/repos/{GITHUB_USER}/{GITHUB_REPO}/
 acoes_fila_bot = []
 processador_acoes_task = None
 processador_acoes_rodando = False
+reconciliacao_task = None
 
 # ========================
 # FLASK APP
@@ -63,7 +100,17 @@ intents.message_content = True
 intents.members = True
 intents.reactions = True
 
-bot = commands.Bot(command_prefix="/", intents=intents)
+
+class BotRoccia(commands.Bot):
+    async def close(self):
+        # Grava o que ainda estiver pendente antes de desconectar
+        sincronizar_xp()
+        await persistencia.parar()
+        await backend.fechar()
+        await super().close()
+
+
+bot = BotRoccia(command_prefix="/", intents=intents)
 tree = bot.tree
 
 # ========================
@@ -104,6 +151,7 @@ dados = {
         "limite_mensagens": 5,
         "intervalo_segundos": 5,
         "tempo_mute_minutos": 2,
+        "modo_mute": "timeout",
         "remover_xp": True,
         "xp_penalidade": 50,
         "deletar_mensagens": True,
@@ -170,7 +218,12 @@ dados = {
     "credenciais": {}  # { "uid": { "hash": "sha256(salt+senha)", "salt": "..." } }
 }
 
-mensagens_recentes = {}
+rastreador_spam = RastreadorTaxa()
+comandos_ignorados = PrefixosIgnorados(dados["anti_spam"]["comandos_ignorados"])
+cargos_isentos = CargosIsentos()
+CARGOS_ISENTOS_LINKS = ("Administrador", "Moderador")
+MODOS_MUTE = ("timeout", "cargo")
+TIMEOUT_MAXIMO_MINUTOS = 28 * 24 * 60  # limite do Discord
 
 # ==========================================
 # CONFIGURAÇÃO DO SISTEMA DE FIDELIDADE (dinâmico)
@@ -246,134 +299,520 @@ def agora_br():
     return datetime.now(timezone.utc).astimezone(timezone(timedelta(hours=-3)))
 
 
-def _gh_headers():
-    return {"Authorization": f"token {GITHUB_TOKEN}", "Accept": "application/vnd.github.v3+json"}
+def criar_backend():
+    if ARMAZENAMENTO == "sqlite":
+        return BackendSQLite(SQLITE_ARQUIVO, logs_em_memoria=LOGS_EM_MEMORIA)
+    return BackendGitHub(ClienteGitHub(GITHUB_API_REPO, GITHUB_TOKEN, BRANCH), DATA_FILE, DATA_SHARDS_DIR,
+                         formato=SNAPSHOT_FORMATO,
+                         cache=CacheSnapshot(CACHE_SNAPSHOT_DIR) if CACHE_SNAPSHOT_DIR else None)
+
+
+backend = criar_backend()
+diario = Diario(DIARIO_ARQUIVO)
+
+
+def garantir_campos_obrigatorios():
+    if "fila" not in dados:
+        dados["fila"] = {
+            "nome": "Fila de Serviços",
+            "configuracoes": {"tamanho_maximo": 50, "aberta": True},
+            "entradas": [],
+            "historico": []
+        }
+    numerar_logs()
+    if "botoes_cargos" not in dados:
+        dados["botoes_cargos"] = {}
+    if "cargos_nivel" not in dados:
+        dados["cargos_nivel"] = {}
+    if "canais_links_bloqueados" not in dados:
+        dados["canais_links_bloqueados"] = []
+    if "links_fila" not in dados:
+        dados["links_fila"] = {"discord_convite": "", "botoes_precos": []}
+    if "anti_spam" not in dados:
+        dados["anti_spam"] = {
+            "ativado": True,
+            "limite_mensagens": 5,
+            "intervalo_segundos": 5,
+            "tempo_mute_minutos": 2,
+            "modo_mute": "timeout",
+            "remover_xp": True,
+            "xp_penalidade": 50,
+            "deletar_mensagens": True,
+            "cargos_ignorados": ["Administrador", "Moderador", "Staff", "Dono"],
+            "comandos_ignorados": [
+                "$w", "$wa", "$wg", "$h", "$ha", "$hg",
+                "$W", "$WA", "$WG", "$H", "$HA", "$HG",
+                "$tu", "$TU", "$dk", "$mmi", "$vote", "$rolls", "$k", "$mu"
+            ]
+        }
+    if "config" not in dados:
+        dados["config"] = {
+            "canal_boas_vindas": None,
+            "mensagem_boas_vindas": "Olá {member}, seja bem-vindo(a)!",
+            "fundo_boas_vindas": "",
+            "taxa_xp": 3,
+            "canal_levelup": None,
+            "canal_logs": None,
+            "canal_perfil": None,
+            "canal_rank": None,
+            "pix_link": ""
+        }
+    if "botoes_precos" not in dados.get("links_fila", {}):
+        dados["links_fila"]["botoes_precos"] = []
+    if "recompensas_fidelidade" not in dados:
+        dados["recompensas_fidelidade"] = [
+            {"id": "quests_60", "nome": "1 Dia de Quests Diárias Grátis", "pontos": 60, "tipo": "servico",
+             "desconto": 0},
+            {"id": "desafio_100", "nome": "Desafio Rápido Grátis (Portinha/Hologramas)", "pontos": 100,
+             "tipo": "servico", "desconto": 0},
+            {"id": "cupom_5", "nome": "Cupom de R$ 5,00", "pontos": 100, "tipo": "cupom", "desconto": 5.0},
+            {"id": "analise_200", "nome": "1 Análise de Conta / Companion Quest Grátis", "pontos": 200,
+             "tipo": "servico", "desconto": 0},
+            {"id": "cupom_10", "nome": "Cupom de R$ 10,00", "pontos": 200, "tipo": "cupom", "desconto": 10.0},
+            {"id": "build_400", "nome": "1 Build Completa de Personagem Grátis", "pontos": 400,
+             "tipo": "servico", "desconto": 0},
+            {"id": "cupom_20", "nome": "Cupom de R$ 20,00", "pontos": 400, "tipo": "cupom", "desconto": 20.0}
+        ]
+    if "credenciais" not in dados:
+        dados["credenciais"] = {}
+    if "mutes_pendentes" not in dados:
+        dados["mutes_pendentes"] = {}
 
 
-def carregar_dados_github():
+def reaplicar_diario():
+    # Reaplica as alterações que ficaram só no diário (queda antes da última gravação)
     try:
-        r = requests.get(GITHUB_API_CONTENT, headers=_gh_headers(), params={"ref": BRANCH}, timeout=15)
-        if r.status_code == 200:
-            js = r.json()
-            conteudo_b64 = js.get("content", "")
-            if conteudo_b64:
-                raw = base64.b64decode(conteudo_b64)
-                carregado = json.loads(raw.decode("utf-8"))
-                dados.update(carregado)
-                # Garantir campos obrigatórios
-                if "fila" not in dados:
-                    dados["fila"] = {
-                        "nome": "Fila de Serviços",
-                        "configuracoes": {"tamanho_maximo": 50, "aberta": True},
-                        "entradas": [],
-                        "historico": []
-                    }
-                if "botoes_cargos" not in dados:
-                    dados["botoes_cargos"] = {}
-                if "cargos_nivel" not in dados:
-                    dados["cargos_nivel"] = {}
-                if "canais_links_bloqueados" not in dados:
-                    dados["canais_links_bloqueados"] = []
-                if "links_fila" not in dados:
-                    dados["links_fila"] = {"discord_convite": "", "botoes_precos": []}
-                if "anti_spam" not in dados:
-                    dados["anti_spam"] = {
-                        "ativado": True,
-                        "limite_mensagens": 5,
-                        "intervalo_segundos": 5,
-                        "tempo_mute_minutos": 2,
-                        "remover_xp": True,
-                        "xp_penalidade": 50,
-                        "deletar_mensagens": True,
-                        "cargos_ignorados": ["Administrador", "Moderador", "Staff", "Dono"],
-                        "comandos_ignorados": [
-                            "$w", "$wa", "$wg", "$h", "$ha", "$hg",
-                            "$W", "$WA", "$WG", "$H", "$HA", "$HG",
-                            "$tu", "$TU", "$dk", "$mmi", "$vote", "$rolls", "$k", "$mu"
-                        ]
-                    }
-                if "config" not in dados:
-                    dados["config"] = {
-                        "canal_boas_vindas": None,
-                        "mensagem_boas_vindas": "Olá {member}, seja bem-vindo(a)!",
-                        "fundo_boas_vindas": "",
-                        "taxa_xp": 3,
-                        "canal_levelup": None,
-                        "canal_logs": None,
-                        "canal_perfil": None,
-                        "canal_rank": None,
-                        "pix_link": ""
-                    }
-                if "botoes_precos" not in dados.get("links_fila", {}):
-                    dados["links_fila"]["botoes_precos"] = []
-                if "recompensas_fidelidade" not in dados:
-                    dados["recompensas_fidelidade"] = [
-                        {"id": "quests_60", "nome": "1 Dia de Quests Diárias Grátis", "pontos": 60, "tipo": "servico",
-                         "desconto": 0},
-                        {"id": "desafio_100", "nome": "Desafio Rápido Grátis (Portinha/Hologramas)", "pontos": 100,
-                         "tipo": "servico", "desconto": 0},
-                        {"id": "cupom_5", "nome": "Cupom de R$ 5,00", "pontos": 100, "tipo": "cupom", "desconto": 5.0},
-                        {"id": "analise_200", "nome": "1 Análise de Conta / Companion Quest Grátis", "pontos": 200,
-                         "tipo": "servico", "desconto": 0},
-                        {"id": "cupom_10", "nome": "Cupom de R$ 10,00", "pontos": 200, "tipo": "cupom", "desconto": 10.0},
-                        {"id": "build_400", "nome": "1 Build Completa de Personagem Grátis", "pontos": 400,
-                         "tipo": "servico", "desconto": 0},
-                        {"id": "cupom_20", "nome": "Cupom de R$ 20,00", "pontos": 400, "tipo": "cupom", "desconto": 20.0}
-                    ]
-                if "credenciais" not in dados:
-                    dados["credenciais"] = {}
-                print("✅ Dados carregados do GitHub.")
-                return True
-        else:
-            print(f"⚠️ GitHub GET retornou {r.status_code} — iniciando com dados limpos.")
+        seq_snapshot = dados.get("_diario_seq", 0)
+        aplicadas = diario.reaplicar(dados, desde=lambda caminho: backend.seq_do_caminho(caminho, seq_snapshot))
     except Exception as e:
-        print(f"❌ Erro ao carregar dados do GitHub: {e}")
-    return False
+        print(f"❌ Erro ao ler o diário local: {e}")
+        return 0
+    if aplicadas:
+        garantir_campos_obrigatorios()
+        print(f"♻️ {aplicadas} alterações recuperadas do diário local.")
+        persistencia.marcar_alterado(f"Recuperação do diário ({aplicadas} alterações)")
+    return aplicadas
+
+
+async def carregar_dados_github():
+    # Carrega do backend configurado (GitHub por padrão) e reaplica o diário local
+    carregado = False
+    try:
+        salvos = await backend.carregar()
+        if salvos is not None:
+            dados.update(salvos)
+            garantir_campos_obrigatorios()
+            print(f"✅ Dados carregados ({backend.nome}).")
+            carregado = True
+            if backend.migracao_pendente:
+                persistencia.marcar_alterado("Migração do formato de armazenamento")
+    except Exception as e:
+        print(f"❌ Erro ao carregar dados ({backend.nome}): {e}")
+    reaplicar_diario()
+    carregar_motor_xp()
+    aplicar_config_xp()
+    aplicar_config_anti_spam()
+    if backend.verificacao_pendente:
+        asyncio.create_task(verificar_dados_carregados())
+    return carregado
+
+
+async def verificar_dados_carregados():
+    # Os dados vieram do cache local: confere com o GitHub e troca o que mudou por fora.
+    # Enquanto não confere, o backend não grava (as alterações ficam no diário).
+    espera = 5
+    while backend.verificacao_pendente:
+        sincronizar_xp()
+        try:
+            substituidas = await backend.verificar(dados)
+        except Exception as e:
+            print(f"⚠️ Falha ao conferir o cache com o GitHub: {e}; nova tentativa em {espera}s")
+            await asyncio.sleep(espera)
+            espera = min(espera * 2, 300)
+            continue
+        if substituidas:
+            garantir_campos_obrigatorios()
+            reaplicar_diario()
+            if "xp" in substituidas or "nivel" in substituidas:
+                carregar_motor_xp()
+            # O diário pode ter recriado as chaves com só parte dos membros
+            dados.pop("xp", None)
+            dados.pop("nivel", None)
+            if "config" in substituidas:
+                aplicar_config_xp()
+            aplicar_config_anti_spam()
+            print(f"🔄 Cache local desatualizado; recarregado do GitHub: {', '.join(sorted(substituidas))}")
+        else:
+            print("✅ Cache local conferido com o GitHub.")
 
 
-def salvar_dados_github(mensagem="Atualização do bot"):
+async def _gravar_dados_github(mensagem="Atualização do bot", alterados=None):
     try:
-        r = requests.get(GITHUB_API_CONTENT, headers=_gh_headers(), params={"ref": BRANCH}, timeout=15)
-        sha = None
-        if r.status_code == 200:
-            sha = r.json().get("sha")
-
-        conteudo = json.dumps(dados, ensure_ascii=False, indent=2).encode("utf-8")
-        payload = {
-            "message": f"{mensagem} @ {agora_br().isoformat()}",
-            "content": base64.b64encode(conteudo).decode("utf-8"),
-            "branch": BRANCH
-        }
-        if sha:
-            payload["sha"] = sha
-
-        put = requests.put(GITHUB_API_CONTENT, headers=_gh_headers(), json=payload, timeout=30)
-        if put.status_code in (200, 201):
-            print("✅ Dados salvos no GitHub.")
+        # Tudo que está no diário até aqui já foi aplicado em `dados`
+        seq = diario.seq
+        dados["_diario_seq"] = seq
+        alterados = set(alterados or [("*",)])
+        alterados.add(("_diario_seq",))
+        lote_logs = separar_logs_para_arquivo()
+        exportado = exportar_xp(alterados)
+        ok = False
+        try:
+            ok = await backend.salvar(dados, alterados, f"{mensagem} @ {agora_br().isoformat()}",
+                                      arquivo_logs=lote_logs)
+        finally:
+            if not ok:
+                devolver_logs(lote_logs)
+            if exportado:
+                dados.pop("xp", None)
+                dados.pop("nivel", None)
+        if ok:
+            print(f"✅ Dados salvos ({backend.nome}).")
+            if lote_logs:
+                print(f"🗄️ {len(lote_logs)} logs antigos enviados para o arquivo histórico.")
+            diario.compactar(seq)
             return True
-        else:
-            print(f"❌ Erro ao salvar no GitHub: {put.status_code}, {put.text[:400]}")
     except Exception as e:
-        print(f"❌ Exception saving to GitHub: {e}")
+        print(f"❌ Erro ao salvar dados ({backend.nome}): {e}")
     return False
 
 
+persistencia = GerenciadorPersistencia(
+    _gravar_dados_github,
+    intervalo=PERSISTENCIA_INTERVALO,
+    max_alteracoes=PERSISTENCIA_MAX_ALTERACOES
+)
+# Marcado no on_ready quando carregar_dados_github() termina; eventos e ações
+# que chegam antes esperam ou são ignorados
+dados_carregados = asyncio.Event()
+
+
+def _normalizar_caminhos(caminhos):
+    # Cada caminho é uma chave de `dados` ("config") ou uma tupla (ex.: ("xp", uid))
+    return [c if isinstance(c, tuple) else (c,) for c in caminhos]
+
+
+def registrar_no_diario(*caminhos):
+    # O valor atual de cada caminho vai para o diário local
+    for caminho in _normalizar_caminhos(caminhos):
+        try:
+            diario.registrar_caminho(dados, caminho)
+        except Exception as e:
+            print(f"❌ Erro ao gravar no diário local: {e}")
+
+
+def salvar_dados_github(mensagem="Atualização do bot", *caminhos):
+    # Registra no diário o que mudou e marca os dados como alterados; o envio
+    # ao backend é agrupado em segundo plano
+    registrar_no_diario(*caminhos)
+    persistencia.marcar_alterado(mensagem, _normalizar_caminhos(caminhos))
+    return True
+
+
+def salvar_dados_agora(mensagem="Atualização do bot", *caminhos):
+    # Para caminhos críticos (cupons, cadastros): grava imediatamente tudo que estiver pendente.
+    # Chamado pelas rotas do Flask; a gravação roda no loop do bot.
+    registrar_no_diario(*caminhos)
+    return persistencia.salvar_agora(mensagem, _normalizar_caminhos(caminhos))
+
+
+# Logs: dados["logs"] guarda só os registros recentes. Cada gravação que encontra um
+# lote cheio acima de LOGS_EM_MEMORIA tira os mais antigos do anel e os manda
+# para o arquivo histórico (por data) junto com o snapshot. Logar nunca
+# dispara gravação: o registro vai para o diário e segue com a próxima.
+_trava_logs = Lock()
+
+
+def numerar_logs():
+    # Logs antigos não têm "n" (sequência usada no arquivo histórico)
+    ultimo = 0
+    for registro in dados.get("logs", []):
+        if "n" not in registro:
+            registro["n"] = ultimo + 1
+        ultimo = registro["n"]
+
+
 def adicionar_log(entrada):
     ts = agora_br().isoformat()
-    dados.setdefault("logs", []).append({"ts": ts, "entrada": entrada})
+    with _trava_logs:
+        logs = dados.setdefault("logs", [])
+        registro = {"n": logs[-1].get("n", 0) + 1 if logs else 1, "ts": ts, "entrada": entrada}
+        logs.append(registro)
     try:
-        salvar_dados_github(f"log: {entrada}")
+        diario.registrar("append", ("logs",), registro)
+        persistencia.anexar([("logs",)])
     except Exception:
         pass
 
 
+def separar_logs_para_arquivo():
+    with _trava_logs:
+        logs = dados.get("logs", [])
+        excesso = len(logs) - LOGS_EM_MEMORIA
+        if excesso < LOGS_LOTE_ARQUIVO:
+            return []
+        lote = logs[:excesso]
+        del logs[:excesso]
+        return lote
+
+
+def devolver_logs(lote):
+    if lote:
+        with _trava_logs:
+            dados.setdefault("logs", [])[0:0] = lote
+
+
 def xp_por_mensagem():
     return 15
 
 
 def xp_para_nivel(xp):
-    nivel = int((xp / 100) ** 0.6) + 1
-    return max(nivel, 1)
+    return motor_xp.curva.nivel_de(xp)
+
+
+motor_xp = MotorXP(CurvaNivel(), janela=XP_ANALISE_JANELA_HORAS * 3600)
+analise_xp = AnaliseXP(limiar=XP_ANALISE_LIMIAR)
+cooldown_xp = CooldownXP()
+
+
+async def anunciar_subidas(canal_id, subidas):
+    canal = subidas[0][0].guild.get_channel(int(canal_id))
+    if not canal:
+        return
+    if len(subidas) == 1:
+        membro, nivel = subidas[0]
+        await canal.send(f"🎉 {membro.mention} subiu para o nível **{nivel}**!")
+        return
+    # Várias subidas no mesmo intervalo: uma mensagem (partida só no limite de 2000 caracteres)
+    texto = "🎉 Subiram de nível:"
+    for membro, nivel in subidas:
+        linha = f"\n• {membro.mention} → nível **{nivel}**"
+        if len(texto) + len(linha) > 2000:
+            await canal.send(texto)
+            texto = ""
+        texto += linha
+    await canal.send(texto)
+
+
+async def aplicar_cargos_nivel(membro, cargo_ids):
+    # Uma única edição do membro com todos os cargos novos
+    cargos = [c for c in (membro.guild.get_role(int(i)) for i in cargo_ids) if c and c not in membro.roles]
+    if cargos:
+        await membro.add_roles(*cargos, reason="Cargos por nível", atomic=False)
+
+
+efeitos_nivel = FilaEfeitosNivel(anunciar_subidas, aplicar_cargos_nivel,
+                                 tamanho=EFEITOS_NIVEL_FILA, janela=EFEITOS_NIVEL_JANELA)
+
+
+def curva_da_config():
+    try:
+        return CurvaNivel.de_config(dados.get("config", {}).get("curva_nivel"))
+    except (TypeError, ValueError) as e:
+        print(f"⚠️ Curva de nível inválida na config ({e}); usando a padrão")
+        return CurvaNivel()
+
+
+def aplicar_config_xp():
+    config = dados.get("config", {})
+    motor_xp.trocar_curva(curva_da_config())
+    cooldown_xp.configurar(config.get("xp_cooldown_segundos", 0))
+
+
+def renivelar_todos(motivo):
+    # Nível de todo mundo recalculado numa passada e gravado como um lote de XP
+    mudaram = motor_xp.renivelar()
+    print(f"📈 Re-nivelamento ({motivo}): {mudaram} membros mudaram de nível")
+    sincronizar_xp()
+    if mudaram and dados.get("cargos_nivel"):
+        agendar_reconciliacao(1, f"re-nivelamento ({motivo})")
+    return mudaram
+
+
+def apos_mesclagem(base, remoto):
+    # O backend mesclou em `dados` o que outro processo gravou: o motor recebe o
+    # mesmo delta de XP, e o que é compilado a partir da config é refeito
+    if "xp" in remoto or "nivel" in remoto:
+        motor_xp.aplicar_mesclagem(base.get("xp", {}), remoto.get("xp", {}),
+                                   base.get("nivel", {}), remoto.get("nivel", {}))
+    if remoto.get("config") != base.get("config"):
+        aplicar_config_xp()
+    if remoto.get("anti_spam") != base.get("anti_spam"):
+        aplicar_config_anti_spam()
+
+
+backend.ao_mesclar = apos_mesclagem
+
+
+def carregar_motor_xp():
+    # O XP mora no motor; dados["xp"]/["nivel"] só voltam a existir durante uma gravação
+    motor_xp.carregar(dados.pop("xp", None), dados.pop("nivel", None))
+
+
+def exportar_xp(alterados):
+    # Monta dados["xp"]/["nivel"] no formato JSON só para esta gravação: inteiros
+    # se o backend vai ler a chave toda, senão só os membros alterados
+    if backend.le_inteira("xp", alterados) or backend.le_inteira("nivel", alterados):
+        uids = None
+    else:
+        uids = {int(c[1]) for c in alterados if c[0] in ("xp", "nivel") and len(c) > 1 and str(c[1]).isdigit()}
+        if not uids:
+            return False
+    dados["xp"], dados["nivel"] = motor_xp.exportar(uids)
+    return True
+
+
+def sincronizar_xp():
+    # Registra quem ganhou XP desde a última vez, com uma única escrita no
+    # diário e uma única alteração para a persistência
+    sujos = motor_xp.retirar_sujos()
+    if not sujos:
+        return 0
+    xp_json, nivel_json = motor_xp.exportar(sujos)
+    operacoes = [("set", ("xp", chave), valor) for chave, valor in xp_json.items()]
+    operacoes += [("set", ("nivel", chave), valor) for chave, valor in nivel_json.items()]
+    caminhos = [caminho for _, caminho, _ in operacoes]
+    try:
+        diario.registrar_varios(operacoes)
+    except Exception as e:
+        print(f"❌ Erro ao registrar XP no diário: {e}")
+    persistencia.marcar_alterado(f"XP de {len(sujos)} membros", caminhos)
+    return len(sujos)
+
+
+async def sincronizar_xp_periodicamente():
+    while True:
+        await asyncio.sleep(XP_SINCRONIZAR_SEGUNDOS)
+        try:
+            sincronizar_xp()
+        except Exception as e:
+            print(f"❌ Erro ao sincronizar XP: {e}")
+
+
+# ========================
+# RECONCILIAÇÃO DE CARGOS POR NÍVEL
+# ========================
+# Cargos de cargos_nivel só são dados na hora da subida; esta tarefa deixa cada
+# membro com os cargos de todos os níveis que já alcançou (e sem os de níveis
+# acima do dele), numa única edição por membro. Percorre o armazém de XP em
+# ordem de id com um cursor salvo em dados["reconciliacao_cargos"], então
+# continua de onde parou depois de reiniciar. Uma passada "incremental"
+# (nivel_minimo > 1) só olha quem já tem aquele nível.
+
+def estado_reconciliacao():
+    return dados.setdefault("reconciliacao_cargos", {"estado": "parado"})
+
+
+def tiers_cargos_nivel():
+    tiers = []
+    for nivel, cargo_id in dados.get("cargos_nivel", {}).items():
+        try:
+            tiers.append((int(nivel), int(cargo_id)))
+        except (TypeError, ValueError):
+            continue
+    return tiers
+
+
+def cargos_reconciliados(membro, nivel, tiers):
+    # Lista final de cargos do membro, ou None se já está certo
+    guild = membro.guild
+    gerenciados = {cargo_id for _, cargo_id in tiers}
+    desejados = {cargo_id for n, cargo_id in tiers if n <= nivel and guild.get_role(cargo_id)}
+    atuais = {r.id for r in membro.roles}
+    if desejados <= atuais and not (gerenciados - desejados) & atuais:
+        return None
+    novos = [r for r in membro.roles if not r.is_default() and (r.id not in gerenciados or r.id in desejados)]
+    novos += [guild.get_role(cargo_id) for cargo_id in desejados - atuais]
+    return novos
+
+
+def agendar_reconciliacao(nivel_minimo=1, motivo="manual"):
+    estado = estado_reconciliacao()
+    if estado.get("estado") in ("rodando", "pausado"):
+        # Já tem uma passada em andamento: outra roda em seguida, a partir do menor nível pedido
+        estado["proxima"] = min(estado.get("proxima") or nivel_minimo, nivel_minimo)
+    else:
+        estado.clear()
+        estado.update({
+            "estado": "rodando",
+            "motivo": motivo,
+            "nivel_minimo": nivel_minimo,
+            "cursor": 0,
+            "processados": 0,
+            "alterados": 0,
+            "falhas": 0,
+            "proxima": None,
+            "iniciado_em": agora_br().isoformat()
+        })
+    print(f"🪪 Reconciliação de cargos agendada a partir do nível {nivel_minimo} ({motivo})")
+    salvar_dados_github("Reconciliação de cargos agendada", "reconciliacao_cargos")
+    if estado["estado"] == "rodando":
+        iniciar_tarefa_reconciliacao()
+
+
+def iniciar_tarefa_reconciliacao():
+    global reconciliacao_task
+    if reconciliacao_task is None or reconciliacao_task.done():
+        reconciliacao_task = asyncio.create_task(executar_reconciliacao())
+
+
+def concluir_passada_reconciliacao(estado):
+    if estado.get("proxima"):
+        estado.update({"nivel_minimo": estado["proxima"], "cursor": 0, "proxima": None})
+        print(f"🪪 Reconciliação de cargos: nova passada a partir do nível {estado['nivel_minimo']}")
+    else:
+        estado["estado"] = "concluido"
+        estado["concluido_em"] = agora_br().isoformat()
+        print(f"✅ Reconciliação de cargos concluída: {estado.get('alterados', 0)} membros ajustados, "
+              f"{estado.get('falhas', 0)} falhas")
+    salvar_dados_github("Reconciliação de cargos: passada concluída", "reconciliacao_cargos")
+
+
+async def executar_reconciliacao():
+    intervalo_base = 1 / RECONCILIACAO_EDICOES_POR_SEGUNDO
+    intervalo = intervalo_base
+    while True:
+        estado = estado_reconciliacao()
+        if estado.get("estado") != "rodando":
+            return
+        guild = bot.get_guild(int(GUILD_ID)) if GUILD_ID else None
+        if not guild:
+            print("❌ Reconciliação de cargos: servidor não encontrado")
+            return
+        armazem = motor_xp.armazem
+        i = armazem.proximo_slot(estado.get("cursor", 0))
+        if i >= len(armazem):
+            concluir_passada_reconciliacao(estado)
+            continue
+        uid = armazem.ids[i]
+        nivel = motor_xp.nivel_do(uid)
+        membro = guild.get_member(uid) if nivel >= estado.get("nivel_minimo", 1) else None
+        novos = cargos_reconciliados(membro, nivel, tiers_cargos_nivel()) if membro and not membro.bot else None
+        if novos is not None:
+            inicio = time.monotonic()
+            try:
+                await membro.edit(roles=novos, reason=f"Reconciliação de cargos por nível (nível {nivel})")
+                estado["alterados"] = estado.get("alterados", 0) + 1
+            except discord.HTTPException as e:
+                if e.status == 429:
+                    # Limite estourado mesmo após as esperas do discord.py: desacelera e repete o membro
+                    intervalo = min(intervalo * 2, 60)
+                    print(f"⏳ Reconciliação de cargos: limite de taxa; próximo em {intervalo:.1f}s")
+                    await asyncio.sleep(intervalo)
+                    continue
+                estado["falhas"] = estado.get("falhas", 0) + 1
+                print(f"⚠️ Reconciliação de cargos: falha ao editar {membro}: {e}")
+            # O discord.py espera sozinho os 429 comuns: chamada demorada = perto do limite
+            if time.monotonic() - inicio > 1:
+                intervalo = min(intervalo * 2, 60)
+            else:
+                intervalo = max(intervalo_base, intervalo * 0.8)
+            await asyncio.sleep(intervalo)
+        else:
+            await asyncio.sleep(0)
+        estado["cursor"] = uid
+        estado["processados"] = estado.get("processados", 0) + 1
+        if estado["processados"] % 200 == 0:
+            salvar_dados_github("Progresso da reconciliação de cargos", "reconciliacao_cargos")
 
 
 def escape_html(texto):
@@ -392,49 +831,46 @@ def escape_html(texto):
 # FUNÇÕES ANTI-SPAM E IGNORADOS
 # ========================
 
+def aplicar_config_anti_spam():
+    # Recompila os comandos ignorados e esquece os cargos isentos resolvidos;
+    # chamar sempre que a config mudar
+    comandos_ignorados.compilar(dados.get("anti_spam", {}).get("comandos_ignorados", []))
+    cargos_isentos.invalidar(regra="anti_spam")
+
+
 def verificar_comando_ignorado(conteudo: str) -> bool:
-    conteudo_lower = conteudo.lower().strip()
-    comandos_ignorados = dados.get("anti_spam", {}).get("comandos_ignorados", [])
-    for comando in comandos_ignorados:
-        if conteudo_lower.startswith(comando.lower()):
-            return True
-        if conteudo_lower == comando.lower():
-            return True
-    return False
+    return comandos_ignorados.corresponde(conteudo)
 
 
 def verificar_cargo_ignorado(member: discord.Member) -> bool:
-    cargos_ignorados = dados.get("anti_spam", {}).get("cargos_ignorados", [])
-    cargos_membro = [role.name for role in member.roles]
-    for cargo_ignorado in cargos_ignorados:
-        if cargo_ignorado in cargos_membro:
-            return True
-    return False
+    return cargos_isentos.isento(member, "anti_spam", dados.get("anti_spam", {}).get("cargos_ignorados", []))
 
 
-def limpar_mensagens_antigas(user_id: int):
-    if user_id not in mensagens_recentes:
-        return
+def registrar_mensagem(message: discord.Message) -> int:
     intervalo = dados.get("anti_spam", {}).get("intervalo_segundos", 5)
-    agora = time.time()
-    mensagens_recentes[user_id] = [
-        ts for ts in mensagens_recentes[user_id]
-        if agora - ts < intervalo
-    ]
-    if not mensagens_recentes[user_id]:
-        del mensagens_recentes[user_id]
+    return rastreador_spam.registrar(message.author.id, time.monotonic(), intervalo,
+                                     message.channel.id, message.id)
 
 
-def registrar_mensagem(user_id: int) -> int:
-    agora = time.time()
-    if user_id not in mensagens_recentes:
-        mensagens_recentes[user_id] = []
-    mensagens_recentes[user_id].append(agora)
-    limpar_mensagens_antigas(user_id)
-    return len(mensagens_recentes.get(user_id, []))
+async def varrer_anti_spam_periodicamente():
+    while True:
+        await asyncio.sleep(ANTISPAM_VARREDURA_SEGUNDOS)
+        removidos = rastreador_spam.varrer(time.monotonic())
+        if removidos >= 1000:
+            print(f"🧹 Anti-spam: {removidos} membros inativos removidos da janela")
 
 
 async def aplicar_mute(member: discord.Member, duracao_minutos: int = 2):
+    if dados.get("anti_spam", {}).get("modo_mute", "timeout") == "timeout":
+        # Timeout nativo: uma chamada, e o próprio Discord encerra
+        try:
+            await member.timeout(timedelta(minutes=min(duracao_minutos, TIMEOUT_MAXIMO_MINUTOS)),
+                                 reason=f"Anti-spam: {duracao_minutos} minutos de timeout")
+            return True
+        except Exception as e:
+            print(f"❌ Erro ao aplicar timeout: {e}")
+            return False
+
     guild = member.guild
     mute_role = discord.utils.get(guild.roles, name="Muted")
     if not mute_role:
@@ -452,45 +888,135 @@ async def aplicar_mute(member: discord.Member, duracao_minutos: int = 2):
 
     try:
         await member.add_roles(mute_role, reason=f"Anti-spam: {duracao_minutos} minutos de mute")
-        async def remover_mute():
-            await asyncio.sleep(duracao_minutos * 60)
-            try:
-                await member.remove_roles(mute_role, reason="Fim do mute por spam")
-            except:
-                pass
-        asyncio.create_task(remover_mute())
+        agendar_desmute(guild.id, member.id, mute_role.id, time.time() + duracao_minutos * 60)
         return True
     except Exception as e:
         print(f"❌ Erro ao aplicar mute: {e}")
         return False
 
 
-async def deletar_mensagens_spam(member: discord.Member, channel: discord.TextChannel, quantidade: int):
+async def deletar_mensagens_spam(member: discord.Member):
+    # Apaga as mensagens da janela do anti-spam (todos os canais) com o bulk
+    # delete, até 100 por chamada. O bulk delete recusa mensagens com mais de 14
+    # dias; essas (e as de um lote que falhar) saem uma a uma. Devolve
+    # (apagadas, segundos).
     if not dados.get("anti_spam", {}).get("deletar_mensagens", True):
+        return 0, 0.0
+    inicio = time.perf_counter()
+    apagadas = 0
+    # Um minuto de folga para não mandar ao bulk uma que vença no caminho
+    limite_bulk = discord.utils.time_snowflake(datetime.now(timezone.utc) - timedelta(days=14) + timedelta(minutes=1))
+    for canal_id, ids in rastreador_spam.retirar(member.id).items():
+        canal = bot.get_channel(canal_id)
+        if canal is None:
+            continue
+        recentes = [discord.Object(id=i) for i in ids if i > limite_bulk]
+        uma_a_uma = [i for i in ids if i <= limite_bulk]
+        for i in range(0, len(recentes), 100):
+            lote = recentes[i:i + 100]
+            try:
+                # Com uma mensagem só o discord.py usa o delete comum
+                await canal.delete_messages(lote, reason="Anti-spam")
+                apagadas += len(lote)
+            except discord.NotFound:
+                pass
+            except discord.Forbidden:
+                print(f"⚠️ Anti-spam: sem permissão para apagar mensagens em #{canal}")
+                uma_a_uma.clear()
+                break
+            except discord.HTTPException as e:
+                print(f"⚠️ Anti-spam: bulk delete falhou em #{canal} ({e}); apagando uma a uma")
+                uma_a_uma.extend(m.id for m in lote)
+        for mensagem_id in uma_a_uma:
+            try:
+                await canal.get_partial_message(mensagem_id).delete()
+                apagadas += 1
+            except Exception:
+                pass
+    duracao = time.perf_counter() - inicio
+    if apagadas:
+        print(f"🧹 Anti-spam: {apagadas} mensagens de {member} apagadas em {duracao:.2f}s")
+    return apagadas, duracao
+
+
+# Mutes por cargo: a expiração fica em dados["mutes_pendentes"] (gravada junto
+# com o resto) e uma única tarefa tira os cargos na hora, na ordem de um heap.
+# Ao iniciar, os pendentes são recarregados e os que venceram com o bot fora do
+# ar saem na hora. Um novo mute do mesmo membro substitui o anterior; a entrada
+# velha no heap é descartada quando a expiração não bate mais.
+_fila_desmute = []
+_acordar_desmute = asyncio.Event()
+
+
+def agendar_desmute(guild_id: int, membro_id: int, cargo_id: int, expira_ts: float):
+    chave = f"{guild_id}:{membro_id}"
+    dados.setdefault("mutes_pendentes", {})[chave] = {
+        "guild_id": guild_id, "membro_id": membro_id, "cargo_id": cargo_id, "expira_ts": expira_ts
+    }
+    heapq.heappush(_fila_desmute, (expira_ts, chave))
+    salvar_dados_github("Mute por spam agendado", ("mutes_pendentes", chave))
+    _acordar_desmute.set()
+
+
+def encerrar_mute_pendente(chave: str):
+    if dados.get("mutes_pendentes", {}).pop(chave, None) is not None:
+        salvar_dados_github("Mute por spam encerrado", ("mutes_pendentes", chave))
+
+
+async def remover_mute_cargo(chave: str, mute: dict):
+    guild = bot.get_guild(mute["guild_id"])
+    if guild is None:
+        encerrar_mute_pendente(chave)
         return
+    cargo = guild.get_role(mute["cargo_id"])
     try:
-        async for msg in channel.history(limit=quantidade + 5):
-            if msg.author == member:
-                try:
-                    await msg.delete()
-                    await asyncio.sleep(0.5)
-                except:
-                    pass
-    except:
+        membro = guild.get_member(mute["membro_id"]) or await guild.fetch_member(mute["membro_id"])
+        if cargo is not None and cargo in membro.roles:
+            await membro.remove_roles(cargo, reason="Fim do mute por spam")
+    except discord.NotFound:
         pass
+    except discord.Forbidden:
+        print(f"⚠️ Sem permissão para tirar o mute de {mute['membro_id']} em {guild.name}")
+    except Exception as e:
+        # Falha passageira: tenta de novo em um minuto
+        print(f"⚠️ Falha ao tirar o mute de {mute['membro_id']}: {e}; nova tentativa em 60s")
+        mute["expira_ts"] = time.time() + 60
+        heapq.heappush(_fila_desmute, (mute["expira_ts"], chave))
+        return
+    encerrar_mute_pendente(chave)
+
+
+async def executar_desmutes():
+    pendentes = dados.get("mutes_pendentes", {})
+    _fila_desmute[:] = [(mute["expira_ts"], chave) for chave, mute in pendentes.items()]
+    heapq.heapify(_fila_desmute)
+    if pendentes:
+        vencidos = sum(1 for expira, _ in _fila_desmute if expira <= time.time())
+        print(f"🔇 {len(pendentes)} mutes por cargo pendentes recarregados ({vencidos} já vencidos)")
+    while True:
+        while _fila_desmute and _fila_desmute[0][0] <= time.time():
+            expira, chave = heapq.heappop(_fila_desmute)
+            mute = dados.get("mutes_pendentes", {}).get(chave)
+            if mute is None or mute["expira_ts"] != expira:
+                continue
+            try:
+                await remover_mute_cargo(chave, mute)
+            except Exception as e:
+                print(f"❌ Erro ao processar mute pendente {chave}: {e}")
+                encerrar_mute_pendente(chave)
+        _acordar_desmute.clear()
+        espera = _fila_desmute[0][0] - time.time() if _fila_desmute else 3600
+        try:
+            await asyncio.wait_for(_acordar_desmute.wait(), timeout=max(espera, 0))
+        except asyncio.TimeoutError:
+            pass
 
 
 async def remover_xp_por_spam(member: discord.Member):
     if not dados.get("anti_spam", {}).get("remover_xp", True):
         return False
-    uid = str(member.id)
     penalidade = dados.get("anti_spam", {}).get("xp_penalidade", 50)
-    xp_atual = dados.get("xp", {}).get(uid, 0)
-    novo_xp = max(0, xp_atual - penalidade)
-    dados["xp"][uid] = novo_xp
-    novo_nivel = xp_para_nivel(novo_xp)
-    dados["nivel"][uid] = novo_nivel
-    salvar_dados_github(f"Anti-spam: {penalidade} XP removido de {member.name}")
+    motor_xp.definir(member.id, max(0, motor_xp.xp_de(member.id) - penalidade))
     return True
 
 
@@ -509,7 +1035,7 @@ def obter_dados_fila():
 
 
 def salvar_fila():
-    return salvar_dados_github("Atualização da fila")
+    return salvar_dados_github("Atualização da fila", "fila")
 
 
 def adicionar_fila(nome_usuario: str, servico: str, jogo: str = "", usuario_id: str = None, uid: str = None):
@@ -646,7 +1172,7 @@ def obter_links_fila():
 
 def salvar_links_fila(discord_convite: str):
     dados["links_fila"]["discord_convite"] = discord_convite or ""
-    return salvar_dados_github("Links da fila atualizados")
+    return salvar_dados_github("Links da fila atualizados", "links_fila")
 
 
 def adicionar_botao_preco(nome: str, url: str):
@@ -654,14 +1180,14 @@ def adicionar_botao_preco(nome: str, url: str):
         return False
     dados["links_fila"].setdefault("botoes_precos", [])
     dados["links_fila"]["botoes_precos"].append({"nome": nome[:30], "url": url[:500]})
-    return salvar_dados_github(f"Botão de preço adicionado: {nome}")
+    return salvar_dados_github(f"Botão de preço adicionado: {nome}", "links_fila")
 
 
 def remover_botao_preco(index: int):
     botoes = dados["links_fila"].get("botoes_precos", [])
     if 0 <= index < len(botoes):
         removido = botoes.pop(index)
-        salvar_dados_github(f"Botão de preço removido: {removido['nome']}")
+        salvar_dados_github(f"Botão de preço removido: {removido['nome']}", "links_fila")
         return True
     return False
 
@@ -670,7 +1196,7 @@ def atualizar_botao_preco(index: int, nome: str, url: str):
     botoes = dados["links_fila"].get("botoes_precos", [])
     if 0 <= index < len(botoes):
         botoes[index] = {"nome": nome[:30], "url": url[:500]}
-        salvar_dados_github(f"Botão de preço atualizado: {nome}")
+        salvar_dados_github(f"Botão de preço atualizado: {nome}", "links_fila")
         return True
     return False
 
@@ -823,7 +1349,7 @@ async def executar_acao_bot_interno(acao):
 
             if dados_reacoes:
                 dados.setdefault("reacoes_cargos", {})[mensagem_id] = dados_reacoes
-                salvar_dados_github("Reação cargo via site")
+                salvar_dados_github("Reação cargo via site", ("reacoes_cargos", mensagem_id))
                 return True
             else:
                 try:
@@ -886,7 +1412,7 @@ async def executar_acao_bot_interno(acao):
                     if isinstance(item, PersistentRoleButton):
                         item.mensagem_id = enviado.id
                 dados.setdefault("botoes_cargos", {})[str(enviado.id)] = dicionario_botoes
-                salvar_dados_github("Botões de cargo via site")
+                salvar_dados_github("Botões de cargo via site", ("botoes_cargos", str(enviado.id)))
                 return True
             return False
 
@@ -902,7 +1428,7 @@ async def executar_acao_bot_interno(acao):
                 "admin": dados_acao.get('admin', 'Admin')
             }
             dados.setdefault("advertencias", {}).setdefault(str(membro.id), []).append(entrada)
-            salvar_dados_github(f"Advertência via site: {membro.display_name}")
+            salvar_dados_github(f"Advertência via site: {membro.display_name}", ("advertencias", str(membro.id)))
             return True
 
         elif tipo_acao == "configurar_boas_vindas":
@@ -913,16 +1439,29 @@ async def executar_acao_bot_interno(acao):
                 config["mensagem_boas_vindas"] = dados_acao['mensagem']
             if 'imagem_url' in dados_acao:
                 config["fundo_boas_vindas"] = dados_acao['imagem_url']
-            salvar_dados_github("Config boas-vindas atualizada")
+            salvar_dados_github("Config boas-vindas atualizada", "config")
             return True
 
         elif tipo_acao == "configurar_xp":
             config = dados.setdefault("config", {})
-            if 'taxa' in dados_acao:
+            renivelar = False
+            if 'taxa' in dados_acao and dados_acao['taxa'] != config.get("taxa_xp"):
                 config["taxa_xp"] = dados_acao['taxa']
+                renivelar = True
             if 'canal_id' in dados_acao:
                 config["canal_levelup"] = dados_acao['canal_id']
-            salvar_dados_github("Config XP atualizada")
+            if 'cooldown' in dados_acao:
+                config["xp_cooldown_segundos"] = dados_acao['cooldown']
+                cooldown_xp.configurar(dados_acao['cooldown'])
+            if 'curva' in dados_acao:
+                curva = CurvaNivel.de_config(dados_acao['curva'])
+                if curva != motor_xp.curva:
+                    config["curva_nivel"] = curva.para_config()
+                    motor_xp.trocar_curva(curva)
+                    renivelar = True
+            salvar_dados_github("Config XP atualizada", "config")
+            if renivelar:
+                renivelar_todos("config de XP alterada")
             return True
 
         elif tipo_acao == "configurar_comandos":
@@ -941,19 +1480,34 @@ async def executar_acao_bot_interno(acao):
                     config["canal_rank"] = None
                 else:
                     config["canal_rank"] = novo_canal_rank if novo_canal_rank else None
-            salvar_dados_github("Config canais de comandos atualizada")
+            salvar_dados_github("Config canais de comandos atualizada", "config")
             return True
 
         elif tipo_acao == "adicionar_cargo_nivel":
             dados.setdefault("cargos_nivel", {})[str(dados_acao['nivel'])] = dados_acao['cargo_id']
-            salvar_dados_github(f"Cargo para nível {dados_acao['nivel']} adicionado")
+            salvar_dados_github(f"Cargo para nível {dados_acao['nivel']} adicionado", "cargos_nivel")
+            # Quem já passou desse nível também recebe o cargo
+            agendar_reconciliacao(int(dados_acao['nivel']), f"cargo do nível {dados_acao['nivel']} adicionado")
+            return True
+
+        elif tipo_acao == "reconciliar_cargos_nivel":
+            estado = estado_reconciliacao()
+            if dados_acao.get('acao') == "pausar" and estado.get("estado") == "rodando":
+                estado["estado"] = "pausado"
+                salvar_dados_github("Reconciliação de cargos pausada", "reconciliacao_cargos")
+            elif dados_acao.get('acao') == "retomar" and estado.get("estado") == "pausado":
+                estado["estado"] = "rodando"
+                salvar_dados_github("Reconciliação de cargos retomada", "reconciliacao_cargos")
+                iniciar_tarefa_reconciliacao()
+            elif dados_acao.get('acao') == "iniciar":
+                agendar_reconciliacao(1, "manual")
             return True
 
         elif tipo_acao == "remover_cargo_nivel":
             nivel = str(dados_acao['nivel'])
             if nivel in dados.get("cargos_nivel", {}):
                 del dados["cargos_nivel"][nivel]
-                salvar_dados_github(f"Cargo do nível {nivel} removido")
+                salvar_dados_github(f"Cargo do nível {nivel} removido", "cargos_nivel")
             return True
 
         elif tipo_acao == "alternar_bloqueio_links":
@@ -963,7 +1517,7 @@ async def executar_acao_bot_interno(acao):
                 canais.remove(canal_id)
             else:
                 canais.append(canal_id)
-            salvar_dados_github(f"Bloqueio de links alternado no canal {canal_id}")
+            salvar_dados_github(f"Bloqueio de links alternado no canal {canal_id}", "canais_links_bloqueados")
             return True
 
         elif tipo_acao == "configurar_anti_spam":
@@ -976,6 +1530,8 @@ async def executar_acao_bot_interno(acao):
                 anti_spam["intervalo_segundos"] = dados_acao['intervalo_segundos']
             if 'tempo_mute_minutos' in dados_acao:
                 anti_spam["tempo_mute_minutos"] = dados_acao['tempo_mute_minutos']
+            if dados_acao.get('modo_mute') in MODOS_MUTE:
+                anti_spam["modo_mute"] = dados_acao['modo_mute']
             if 'remover_xp' in dados_acao:
                 anti_spam["remover_xp"] = dados_acao['remover_xp']
             if 'xp_penalidade' in dados_acao:
@@ -987,7 +1543,8 @@ async def executar_acao_bot_interno(acao):
             if 'comandos_ignorados' in dados_acao:
                 anti_spam["comandos_ignorados"] = [c.strip() for c in dados_acao['comandos_ignorados'].split(",") if
                                                    c.strip()]
-            salvar_dados_github("Config anti-spam atualizada")
+            aplicar_config_anti_spam()
+            salvar_dados_github("Config anti-spam atualizada", "anti_spam")
             return True
 
         else:
@@ -1008,6 +1565,7 @@ async def processar_acoes_bot_continuo():
     if not bot.is_ready():
         await bot.wait_until_ready()
         await asyncio.sleep(2)
+    await dados_carregados.wait()
     while processador_acoes_rodando and not bot.is_closed():
         try:
             if acoes_fila_bot:
@@ -1565,7 +2123,7 @@ def api_cliente_cadastrar():
     # Criar hash
     cred = hash_senha(senha)
     credenciais[uid] = cred
-    salvar_dados_github(f"Novo cadastro de cliente: {uid}")
+    salvar_dados_agora(f"Novo cadastro de cliente: {uid}", ("credenciais", uid))
     return jsonify({"sucesso": True, "mensagem": "Cadastro realizado com sucesso! Faça login."})
 
 
@@ -1664,7 +2222,7 @@ def api_fidelidade_resgatar():
         "expirado": False
     }
     perfil["cupons"].append(novo_cupom)
-    salvar_dados_github("Resgate de fidelidade")
+    salvar_dados_agora("Resgate de fidelidade", ("fidelidade", uid))
     return jsonify({
         "sucesso": True,
         "mensagem": f"Resgate concluído! Seu código de cupom gerado é: {token}",
@@ -1725,7 +2283,7 @@ def api_fidelidade_solicitar_servico():
         "status": "aguardando_aprovacao"
     }
     dados["pedidos_fidelidade_pendentes"].append(novo_pedido)
-    salvar_dados_github("Novo pedido de serviço solicitado")
+    salvar_dados_agora("Novo pedido de serviço solicitado", ("fidelidade", uid), "pedidos_fidelidade_pendentes")
     return jsonify({
         "sucesso": True,
         "mensagem": "Pedido enviado com sucesso! Aguarde a aprovação do Administrador."
@@ -1763,7 +2321,7 @@ def api_fidelidade_recompensas_adicionar():
         "desconto": desconto if tipo == "cupom" else 0
     }
     recs.append(nova)
-    salvar_dados_github(f"Recompensa adicionada: {nome}")
+    salvar_dados_github(f"Recompensa adicionada: {nome}", "recompensas_fidelidade")
     return jsonify({"sucesso": True, "mensagem": "Recompensa adicionada!", "recompensa": nova})
 
 
@@ -1779,7 +2337,7 @@ def api_fidelidade_recompensas_editar(recompensa_id):
             recs[i]["pontos"] = int(req.get("pontos", r["pontos"]))
             recs[i]["tipo"] = req.get("tipo", r["tipo"])
             recs[i]["desconto"] = float(req.get("desconto", r.get("desconto", 0))) if recs[i]["tipo"] == "cupom" else 0
-            salvar_dados_github(f"Recompensa editada: {recs[i]['nome']}")
+            salvar_dados_github(f"Recompensa editada: {recs[i]['nome']}", "recompensas_fidelidade")
             return jsonify({"sucesso": True, "mensagem": "Recompensa atualizada!", "recompensa": recs[i]})
     return jsonify({"sucesso": False, "mensagem": "Recompensa não encontrada"})
 
@@ -1792,7 +2350,7 @@ def api_fidelidade_recompensas_remover(recompensa_id):
     for i, r in enumerate(recs):
         if r["id"] == recompensa_id:
             recs.pop(i)
-            salvar_dados_github(f"Recompensa removida: {r['nome']}")
+            salvar_dados_github(f"Recompensa removida: {r['nome']}", "recompensas_fidelidade")
             return jsonify({"sucesso": True, "mensagem": "Recompensa removida!"})
     return jsonify({"sucesso": False, "mensagem": "Recompensa não encontrada"})
 
@@ -1837,7 +2395,7 @@ def api_fidelidade_admin_aprovar():
     }
     fila["entradas"].append(nova_entrada_fila)
     dados["pedidos_fidelidade_pendentes"] = [p for p in pendentes if p["id"] != pedido_id]
-    salvar_dados_github("Pedido aprovado e enviado para a fila")
+    salvar_dados_github("Pedido aprovado e enviado para a fila", "fila", "pedidos_fidelidade_pendentes")
     return jsonify({"sucesso": True, "mensagem": "Pedido aprovado e inserido na Fila com sucesso!"})
 
 
@@ -1849,7 +2407,7 @@ def api_fidelidade_admin_recusar():
     pedido_id = req.get("pedido_id")
     pendentes = dados.get("pedidos_fidelidade_pendentes", [])
     dados["pedidos_fidelidade_pendentes"] = [p for p in pendentes if p["id"] != pedido_id]
-    salvar_dados_github("Pedido recusado")
+    salvar_dados_github("Pedido recusado", "pedidos_fidelidade_pendentes")
     return jsonify({"sucesso": True, "mensagem": "Pedido recusado e removido."})
 
 
@@ -2038,6 +2596,7 @@ def api_fila_concluir():
                 "pontos": pontos_ganhos,
                 "data": time.strftime("%d/%m/%Y")
             })
+            salvar_dados_github("Pontos de fidelidade creditados", ("fidelidade", uid))
         sucesso, removido = concluir_servico(entrada_id)
         if sucesso:
             return jsonify({"sucesso": True, "mensagem": "Serviço concluído e pontos creditados ao cliente!"})
@@ -2080,7 +2639,7 @@ def api_fila_configuracoes():
         salvar_links_fila(req.get("discord_convite", ""))
     if "pix_link" in req:
         dados.setdefault("config", {})["pix_link"] = req["pix_link"]
-        salvar_dados_github("PIX link atualizado")
+        salvar_dados_github("PIX link atualizado", "config")
     return jsonify({"sucesso": True})
 
 
@@ -2181,6 +2740,7 @@ def api_anti_spam():
                 "limite_mensagens": anti_spam.get("limite_mensagens", 5),
                 "intervalo_segundos": anti_spam.get("intervalo_segundos", 5),
                 "tempo_mute_minutos": anti_spam.get("tempo_mute_minutos", 2),
+                "modo_mute": anti_spam.get("modo_mute", "timeout"),
                 "remover_xp": anti_spam.get("remover_xp", True),
                 "xp_penalidade": anti_spam.get("xp_penalidade", 50),
                 "deletar_mensagens": anti_spam.get("deletar_mensagens", True),
@@ -2194,10 +2754,61 @@ def api_anti_spam():
             }
         })
     req = request.json
+    for campo, nome in (("limite_mensagens", "Limite de mensagens"), ("intervalo_segundos", "Intervalo"),
+                        ("tempo_mute_minutos", "Tempo de mute")):
+        if campo in req:
+            try:
+                req[campo] = int(req[campo])
+            except (TypeError, ValueError):
+                req[campo] = 0
+            if req[campo] <= 0:
+                return jsonify({"sucesso": False, "mensagem": f"{nome} precisa ser maior que zero"})
     executar_acao_bot("configurar_anti_spam", **req)
     return jsonify({"sucesso": True, "mensagem": "Configuração anti-spam salva!"})
 
 
+@app.route("/api/persistencia")
+def api_persistencia():
+    if 'usuario' not in session:
+        return jsonify({"sucesso": False}), 401
+    return jsonify({
+        "sucesso": True,
+        "persistencia": persistencia.estatisticas(),
+        "armazenamento": backend.estatisticas(),
+        "diario": diario.estatisticas(),
+        "xp": motor_xp.estatisticas(),
+        "xp_cooldown": cooldown_xp.estatisticas(),
+        "efeitos_nivel": efeitos_nivel.estatisticas(),
+        "anti_spam": rastreador_spam.estatisticas()
+    })
+
+
+@app.route("/api/xp/analise")
+def api_xp_analise():
+    # Histograma de níveis, percentis, ativos e maiores ganhos; a cópia dos arrays
+    # é feita no loop do bot e o cálculo aqui, reaproveitado enquanto o XP pouco mudar
+    if 'usuario' not in session:
+        return jsonify({"sucesso": False}), 401
+    em_cache = analise_xp.valido(motor_xp)
+    if not em_cache:
+        async def fotografar():
+            return motor_xp.fotografia()
+
+        try:
+            foto = asyncio.run_coroutine_threadsafe(fotografar(), bot.loop).result(30)
+        except Exception as e:
+            return jsonify({"sucesso": False, "mensagem": f"Erro ao analisar XP: {e}"})
+        analise_xp.calcular(foto)
+    resultado = dict(analise_xp.resultado)
+    guild = bot.get_guild(int(GUILD_ID)) if GUILD_ID and bot.is_ready() else None
+    top = []
+    for item in resultado["top_ganhos"]:
+        membro = guild.get_member(int(item["uid"])) if guild else None
+        top.append({**item, "nome": membro.display_name if membro else f"Usuário {item['uid']}"})
+    resultado["top_ganhos"] = top
+    return jsonify({"sucesso": True, "em_cache": em_cache, **resultado})
+
+
 @app.route("/api/config/boasvindas", methods=["GET", "POST"])
 def api_config_boasvindas():
     if 'usuario' not in session:
@@ -2224,9 +2835,21 @@ def api_config_xp():
         return jsonify({
             "sucesso": True,
             "taxa": config.get("taxa_xp", 3),
-            "canal": config.get("canal_levelup", "")
+            "canal": config.get("canal_levelup", ""),
+            "cooldown": config.get("xp_cooldown_segundos", 0),
+            "curva": motor_xp.curva.para_config()
         })
     req = request.json
+    if "cooldown" in req:
+        try:
+            req["cooldown"] = max(int(req["cooldown"] or 0), 0)
+        except (TypeError, ValueError):
+            return jsonify({"sucesso": False, "mensagem": "Cooldown de XP inválido"})
+    if "curva" in req:
+        try:
+            req["curva"] = CurvaNivel.de_config(req["curva"]).para_config()
+        except (TypeError, ValueError) as e:
+            return jsonify({"sucesso": False, "mensagem": f"Curva de nível inválida: {e}"})
     executar_acao_bot("configurar_xp", **req)
     return jsonify({"sucesso": True, "mensagem": "Configuração salva!"})
 
@@ -2264,6 +2887,26 @@ def api_cargos_nivel():
         return jsonify({"sucesso": True, "mensagem": "Cargo removido!"})
 
 
+@app.route("/api/cargos/nivel/reconciliacao", methods=["GET", "POST"])
+def api_reconciliacao_cargos():
+    if 'usuario' not in session:
+        return jsonify({"sucesso": False}), 401
+    if request.method == "GET":
+        estado = dict(dados.get("reconciliacao_cargos") or {"estado": "parado"})
+        armazem = motor_xp.armazem
+        return jsonify({
+            "sucesso": True,
+            **estado,
+            "posicao": armazem.proximo_slot(estado.get("cursor", 0)),
+            "total": len(armazem)
+        })
+    acao = (request.json or {}).get("acao")
+    if acao not in ("iniciar", "pausar", "retomar"):
+        return jsonify({"sucesso": False, "mensagem": "Ação inválida"})
+    executar_acao_bot("reconciliar_cargos_nivel", acao=acao)
+    return jsonify({"sucesso": True, "mensagem": "Pedido enviado ao bot!"})
+
+
 @app.route("/api/config/links", methods=["GET", "POST"])
 def api_config_links():
     if 'usuario' not in session:
@@ -2305,7 +2948,7 @@ def api_comando_limpar_advertencias():
     membro_id = str(request.json.get('membro_id'))
     if membro_id in dados.get("advertencias", {}):
         dados["advertencias"].pop(membro_id)
-        salvar_dados_github(f"Advertências limpas: {membro_id}")
+        salvar_dados_github(f"Advertências limpas: {membro_id}", ("advertencias", membro_id))
         return jsonify({"sucesso": True, "mensagem": "✅ Advertências removidas!"})
     return jsonify({"sucesso": False, "mensagem": "❌ Membro sem advertências"})
 
@@ -2347,7 +2990,7 @@ def dashboard():
     historico = fila.get("historico", [])
     pix_link = config.get("pix_link", "")
 
-    total_usuarios_xp = len(dados.get("xp", {}))
+    total_usuarios_xp = motor_xp.armazem.com_xp
     total_advertencias = sum(len(w) for w in dados.get("advertencias", {}).values())
     total_fila = len(fila["entradas"])
     status_bot = "✅ Online" if bot.is_ready() else "❌ Offline"
@@ -2564,6 +3207,13 @@ def dashboard():
                             <label>Tempo de Mute (minutos)</label>
                             <input type="number" id="as-mute" class="form-control" value="{{ anti_spam.get('tempo_mute_minutos', 2) }}" min="1" max="60">
                         </div>
+                        <div class="form-group">
+                            <label>Tipo de Mute</label>
+                            <select id="as-modo-mute" class="form-control">
+                                <option value="timeout" {{ 'selected' if anti_spam.get('modo_mute', 'timeout') == 'timeout' else '' }}>Timeout do Discord</option>
+                                <option value="cargo" {{ 'selected' if anti_spam.get('modo_mute', 'timeout') == 'cargo' else '' }}>Cargo "Muted"</option>
+                            </select>
+                        </div>
                         <div class="form-group">
                             <label>Penalidade de XP</label>
                             <input type="number" id="as-xp-penalidade" class="form-control" value="{{ anti_spam.get('xp_penalidade', 50) }}" min="10" max="500">
@@ -2620,6 +3270,31 @@ def dashboard():
                         <label>Taxa de XP (1=fácil, 10=difícil)</label>
                         <input type="number" id="xp-taxa" class="form-control" min="1" max="10">
                     </div>
+                    <div class="form-group">
+                        <label>Cooldown de XP (segundos entre ganhos por membro, 0 = desligado)</label>
+                        <input type="number" id="xp-cooldown" class="form-control" min="0" step="1">
+                    </div>
+                    <div class="form-group">
+                        <label>Curva de Nível</label>
+                        <select id="xp-curva-tipo" class="form-control" onchange="atualizarCamposCurva()">
+                            <option value="potencia">Potência (int((xp / base) ^ expoente) + 1)</option>
+                            <option value="linear">Linear (um nível a cada N XP)</option>
+                            <option value="tabela">Tabela (XP de cada nível)</option>
+                        </select>
+                    </div>
+                    <div class="form-group" id="xp-curva-potencia">
+                        <label>Base / Expoente</label>
+                        <input type="number" id="xp-curva-base" class="form-control" min="1" max="1000000" step="1">
+                        <input type="number" id="xp-curva-expoente" class="form-control" min="0.2" max="1" step="0.05">
+                    </div>
+                    <div class="form-group" id="xp-curva-linear" style="display:none">
+                        <label>XP por nível</label>
+                        <input type="number" id="xp-curva-passo" class="form-control" min="1" step="1">
+                    </div>
+                    <div class="form-group" id="xp-curva-tabela" style="display:none">
+                        <label>XP mínimo do nível 2, 3, 4... (separado por vírgula)</label>
+                        <input type="text" id="xp-curva-limiares" class="form-control" placeholder="100, 300, 600, 1000">
+                    </div>
                     <div class="form-group">
                         <label>Canal de Level Up</label>
                         <select id="xp-canal" class="form-control"></select>
@@ -2639,6 +3314,21 @@ def dashboard():
                             <button onclick="adicionarCargoNivel()" class="btn btn-primary">➕ Adicionar</button>
                         </div>
                     </div>
+                    <div class="form-group">
+                        <label>Reconciliação (dar/tirar cargos de quem já está no nível)</label>
+                        <div id="reconciliacao-status"><p>Carregando...</p></div>
+                        <div style="display: flex; gap: 1rem;">
+                            <button onclick="acaoReconciliacao('iniciar')" class="btn btn-primary">🔄 Reconciliar todos</button>
+                            <button onclick="acaoReconciliacao('pausar')" class="btn btn-primary">⏸️ Pausar</button>
+                            <button onclick="acaoReconciliacao('retomar')" class="btn btn-primary">▶️ Retomar</button>
+                        </div>
+                    </div>
+                </div>
+                
+                <div class="card">
+                    <h2>📊 Análise de XP</h2>
+                    <div id="xp-analise"><p>Carregando...</p></div>
+                    <button onclick="carregarAnaliseXP()" class="btn btn-primary">🔄 Atualizar</button>
                 </div>
             </div>
             
@@ -3063,6 +3753,7 @@ def dashboard():
                 if (tabId === 'fila') carregarFila();
                 if (tabId === 'moderacao') carregarAdvertencias();
                 if (tabId === 'recompensas') carregarRecompensas();
+                if (tabId === 'xp') { carregarAnaliseXP(); carregarReconciliacao(); }
             }
 
             async function carregarDados() {
@@ -3104,6 +3795,14 @@ def dashboard():
                     
                     if (configXPdata.sucesso) {
                         document.getElementById('xp-taxa').value = configXPdata.taxa || 3;
+                        document.getElementById('xp-cooldown').value = configXPdata.cooldown || 0;
+                        const curva = configXPdata.curva || {};
+                        document.getElementById('xp-curva-tipo').value = curva.tipo || 'potencia';
+                        document.getElementById('xp-curva-base').value = curva.base || 100;
+                        document.getElementById('xp-curva-expoente').value = curva.expoente || 0.6;
+                        document.getElementById('xp-curva-passo').value = curva.passo || 250;
+                        document.getElementById('xp-curva-limiares').value = (curva.limiares || []).slice(1).join(', ');
+                        atualizarCamposCurva();
                         const xpCanal = document.getElementById('xp-canal');
                         if (xpCanal) xpCanal.value = configXPdata.canal || '';
                     }
@@ -3140,6 +3839,7 @@ def dashboard():
                         document.getElementById('as-limite').value = antiSpamData.config.limite_mensagens;
                         document.getElementById('as-intervalo').value = antiSpamData.config.intervalo_segundos;
                         document.getElementById('as-mute').value = antiSpamData.config.tempo_mute_minutos;
+                        document.getElementById('as-modo-mute').value = antiSpamData.config.modo_mute;
                         document.getElementById('as-xp-penalidade').value = antiSpamData.config.xp_penalidade;
                         document.getElementById('as-cargos').value = antiSpamData.config.cargos_ignorados;
                         document.getElementById('as-comandos').value = antiSpamData.config.comandos_ignorados;
@@ -3349,6 +4049,7 @@ def dashboard():
                     limite_mensagens: parseInt(document.getElementById('as-limite').value),
                     intervalo_segundos: parseInt(document.getElementById('as-intervalo').value),
                     tempo_mute_minutos: parseInt(document.getElementById('as-mute').value),
+                    modo_mute: document.getElementById('as-modo-mute').value,
                     xp_penalidade: parseInt(document.getElementById('as-xp-penalidade').value),
                     cargos_ignorados: document.getElementById('as-cargos').value,
                     comandos_ignorados: document.getElementById('as-comandos').value
@@ -3377,8 +4078,19 @@ def dashboard():
                 } catch(e) { showAlert('welcome-alert', 'Erro: ' + e.message, false); }
             }
             
+            function atualizarCamposCurva() {
+                const tipo = document.getElementById('xp-curva-tipo').value;
+                document.getElementById('xp-curva-potencia').style.display = tipo === 'potencia' ? '' : 'none';
+                document.getElementById('xp-curva-linear').style.display = tipo === 'linear' ? '' : 'none';
+                document.getElementById('xp-curva-tabela').style.display = tipo === 'tabela' ? '' : 'none';
+            }
+            
             async function salvarXP() {
-                const data = { taxa: parseInt(document.getElementById('xp-taxa').value), canal_id: document.getElementById('xp-canal').value };
+                const tipo = document.getElementById('xp-curva-tipo').value;
+                let curva = { tipo, base: parseFloat(document.getElementById('xp-curva-base').value), expoente: parseFloat(document.getElementById('xp-curva-expoente').value) };
+                if (tipo === 'linear') curva = { tipo, passo: parseInt(document.getElementById('xp-curva-passo').value) };
+                if (tipo === 'tabela') curva = { tipo, limiares: document.getElementById('xp-curva-limiares').value.split(',').map(v => parseInt(v)).filter(v => !isNaN(v)) };
+                const data = { taxa: parseInt(document.getElementById('xp-taxa').value), canal_id: document.getElementById('xp-canal').value, cooldown: parseInt(document.getElementById('xp-cooldown').value) || 0, curva };
                 try {
                     const resp = await fetch('/api/config/xp', {method: 'POST', headers: {'Content-Type': 'application/json'}, body: JSON.stringify(data)});
                     const result = await resp.json();
@@ -3448,6 +4160,66 @@ def dashboard():
                 } catch(e) { console.error(e); }
             }
             
+            let reconciliacaoTimer = null;
+            async function carregarReconciliacao() {
+                const container = document.getElementById('reconciliacao-status');
+                try {
+                    const resp = await fetch('/api/cargos/nivel/reconciliacao');
+                    const data = await resp.json();
+                    if (!data.sucesso) return;
+                    const nomes = {parado: 'Nunca executada', rodando: 'Em andamento', pausado: 'Pausada', concluido: 'Concluída'};
+                    const pct = data.total ? Math.min(100, Math.round(100 * data.posicao / data.total)) : 100;
+                    let html = `<p>${nomes[data.estado] || data.estado}`;
+                    if (data.estado !== 'parado') {
+                        html += ` — ${pct}% (${data.posicao}/${data.total}) | ${data.alterados || 0} ajustados | ${data.falhas || 0} falhas`;
+                        if (data.nivel_minimo > 1) html += ` | a partir do nível ${data.nivel_minimo}`;
+                        if (data.proxima) html += ' | outra passada na fila';
+                    }
+                    html += '</p>';
+                    container.innerHTML = html;
+                    clearTimeout(reconciliacaoTimer);
+                    if (data.estado === 'rodando') reconciliacaoTimer = setTimeout(carregarReconciliacao, 3000);
+                } catch(e) { container.innerHTML = '<p>Erro: ' + e.message + '</p>'; }
+            }
+            
+            async function acaoReconciliacao(acao) {
+                try {
+                    const resp = await fetch('/api/cargos/nivel/reconciliacao', {method: 'POST', headers: {'Content-Type': 'application/json'}, body: JSON.stringify({acao})});
+                    const result = await resp.json();
+                    showAlert('xp-alert', result.mensagem, result.sucesso);
+                    setTimeout(carregarReconciliacao, 1500);
+                } catch(e) { showAlert('xp-alert', 'Erro: ' + e.message, false); }
+            }
+            
+            async function carregarAnaliseXP() {
+                const container = document.getElementById('xp-analise');
+                try {
+                    const resp = await fetch('/api/xp/analise');
+                    const data = await resp.json();
+                    if (!data.sucesso) {
+                        container.innerHTML = `<p>${data.mensagem || 'Não foi possível carregar a análise.'}</p>`;
+                        return;
+                    }
+                    const p = data.percentis || {};
+                    let html = `<p>👥 ${data.membros} membros com XP | XP médio ${data.xp_medio} | máximo ${data.xp_maximo}</p>`;
+                    html += `<p>📈 Percentis: p25 ${p.p25 ?? '-'} | p50 ${p.p50 ?? '-'} | p75 ${p.p75 ?? '-'} | p90 ${p.p90 ?? '-'} | p99 ${p.p99 ?? '-'}</p>`;
+                    html += `<p>🟢 Ativos: 1h ${data.ativos['1h']} | 24h ${data.ativos['24h']} | 7d ${data.ativos['7d']} <small>(desde que o bot iniciou)</small></p>`;
+                    const maior = Math.max(1, ...data.histograma_niveis.map(([, qtd]) => qtd));
+                    html += '<h3>Membros por nível</h3><div style="display: flex; flex-direction: column; gap: 2px;">';
+                    for (const [nivel, qtd] of data.histograma_niveis) {
+                        html += `<div style="display: flex; align-items: center; gap: 0.5rem;"><span style="width: 70px;">Nível ${nivel}</span><div style="background: #00c8ff; height: 12px; width: ${Math.max(1, 300 * qtd / maior)}px;"></div><span>${qtd}</span></div>`;
+                    }
+                    html += '</div><h3>Maiores ganhos de XP</h3>';
+                    if (data.top_ganhos.length) {
+                        html += '<ol>' + data.top_ganhos.map(t => `<li>${t.nome}: +${t.ganho} XP</li>`).join('') + '</ol>';
+                    } else {
+                        html += '<p>Ninguém ganhou XP na janela ainda.</p>';
+                    }
+                    html += `<small>Calculado em ${data.calculo_ms}ms${data.em_cache ? ' (em cache)' : ''}</small>`;
+                    container.innerHTML = html;
+                } catch(e) { container.innerHTML = '<p>Erro: ' + e.message + '</p>'; }
+            }
+            
             async function adicionarCargoNivel() {
                 const nivel = document.getElementById('novo-nivel').value;
                 const cargoId = document.getElementById('novo-cargo').value;
@@ -3818,6 +4590,15 @@ def api_membro_advertencias():
 # FUNÇÃO PARA VERIFICAR CANAL PERMITIDO
 # ========================
 
+async def dados_prontos(interaction: discord.Interaction) -> bool:
+    # Antes da carga terminar, o que o comando lesse ou mudasse seria descartado
+    if dados_carregados.is_set():
+        return True
+    await interaction.response.send_message("⏳ O bot ainda está carregando os dados; tente de novo em instantes.",
+                                            ephemeral=True)
+    return False
+
+
 async def verificar_canal_permitido(interaction: discord.Interaction, comando: str) -> bool:
     config = dados.get("config", {})
     canal_permitido = config.get(f"canal_{comando}", None)
@@ -3835,6 +4616,8 @@ async def verificar_canal_permitido(interaction: discord.Interaction, comando: s
 @tree.command(name="perfil", description="Mostra o seu perfil com XP e nível")
 @app_commands.describe(membro="Membro para ver o perfil (opcional)")
 async def slash_perfil(interaction: discord.Interaction, membro: discord.Member = None):
+    if not await dados_prontos(interaction):
+        return
     if not await verificar_canal_permitido(interaction, "perfil"):
         config = dados.get("config", {})
         canal_permitido = config.get("canal_perfil")
@@ -3851,12 +4634,10 @@ async def slash_perfil(interaction: discord.Interaction, membro: discord.Member
     await interaction.response.defer(thinking=True)
 
     alvo = membro or interaction.user
-    uid = str(alvo.id)
-    xp = dados.get("xp", {}).get(uid, 0)
-    nivel = dados.get("nivel", {}).get(uid, xp_para_nivel(xp))
+    uid = alvo.id
+    nivel = motor_xp.nivel_do(uid)
 
-    ranking = sorted(dados.get("xp", {}).items(), key=lambda t: t[1], reverse=True)
-    pos = next((i + 1 for i, (u, _) in enumerate(ranking) if u == uid), len(ranking))
+    pos = motor_xp.posicao(uid)
 
     largura, altura = 900, 200
     img = Image.new("RGBA", (largura, altura), (0, 0, 0, 255))
@@ -3882,8 +4663,7 @@ async def slash_perfil(interaction: discord.Interaction, membro: discord.Member
     draw.text((largura - 220, 40), f"CLASSIFICAÇÃO #{pos}", font=font_s, fill=(0, 255, 255))
     draw.text((largura - 220, 80), f"NÍVEL {nivel}", font=font_s, fill=(255, 0, 255))
 
-    proximo_xp = 100 + nivel * 50
-    atual = xp % proximo_xp
+    atual, proximo_xp = motor_xp.progresso(uid)
     barra_total_w, barra_h = 560, 36
     x0, y0 = 160, 140
     raio = barra_h // 2
@@ -3914,6 +4694,8 @@ async def slash_perfil(interaction: discord.Interaction, membro: discord.Member
 
 @tree.command(name="rank", description="Mostra o ranking dos 10 maiores XP")
 async def slash_rank(interaction: discord.Interaction):
+    if not await dados_prontos(interaction):
+        return
     if not await verificar_canal_permitido(interaction, "rank"):
         config = dados.get("config", {})
         canal_permitido = config.get("canal_rank")
@@ -3929,12 +4711,12 @@ async def slash_rank(interaction: discord.Interaction):
 
     await interaction.response.defer()
 
-    ranking = sorted(dados.get("xp", {}).items(), key=lambda t: t[1], reverse=True)[:10]
+    ranking = motor_xp.ranking.top(10)
     linhas = []
     for i, (uid, xp) in enumerate(ranking, 1):
-        user = interaction.guild.get_member(int(uid))
+        user = interaction.guild.get_member(uid)
         nome = user.display_name if user else f"Usuário {uid}"
-        nivel = dados.get("nivel", {}).get(uid, xp_para_nivel(xp))
+        nivel = motor_xp.nivel_do(uid)
         linhas.append(f"{i}. **{nome}** — {xp} XP (Nível {nivel})")
 
     texto = "\n".join(linhas) if linhas else "Sem dados ainda."
@@ -3974,8 +4756,21 @@ async def on_ready():
     print(f"🤖 BOT INICIADO: {bot.user}")
     print(f"{'=' * 50}")
 
-    print("📂 Carregando dados do GitHub...")
-    carregar_dados_github()
+    if not persistencia.iniciado:
+        # Em reconexões os dados em memória são a versão mais nova; não recarregar
+        print("📂 Carregando dados do GitHub...")
+        await carregar_dados_github()
+        dados_carregados.set()
+        persistencia.iniciar()
+        asyncio.create_task(sincronizar_xp_periodicamente())
+        efeitos_nivel.iniciar()
+        asyncio.create_task(varrer_anti_spam_periodicamente())
+        asyncio.create_task(executar_desmutes())
+        if estado_reconciliacao().get("estado") == "rodando":
+            print("🪪 Retomando reconciliação de cargos por nível...")
+            iniciar_tarefa_reconciliacao()
+    # Numa reconexão completa os cargos podem ter mudado sem eventos
+    cargos_isentos.invalidar()
 
     print("⚙️ Sincronizando comandos slash...")
     try:
@@ -4183,10 +4978,31 @@ async def on_raw_reaction_remove(payload: discord.RawReactionActionEvent):
         await member.remove_roles(role, reason="Reaction role")
 
 
+# Cargos isentos do anti-spam/links são resolvidos por ID; qualquer mudança de
+# cargo no servidor pode mudar quais IDs têm os nomes da config
+@bot.event
+async def on_guild_role_create(role: discord.Role):
+    cargos_isentos.invalidar(role.guild.id)
+
+
+@bot.event
+async def on_guild_role_delete(role: discord.Role):
+    cargos_isentos.invalidar(role.guild.id)
+
+
+@bot.event
+async def on_guild_role_update(antes: discord.Role, depois: discord.Role):
+    if antes.name != depois.name:
+        cargos_isentos.invalidar(depois.guild.id)
+
+
 @bot.event
 async def on_message(message: discord.Message):
     if message.author.bot:
         return
+    # XP/anti-spam aplicados antes da carga seriam sobrescritos por ela
+    if not dados_carregados.is_set():
+        return
 
     conteudo = message.content.strip()
     anti_spam_config = dados.get("anti_spam", {})
@@ -4199,7 +5015,7 @@ async def on_message(message: discord.Message):
 
     if anti_spam_config.get("ativado", True):
         if not verificar_cargo_ignorado(message.author):
-            quantidade = registrar_mensagem(message.author.id)
+            quantidade = registrar_mensagem(message)
             limite = anti_spam_config.get("limite_mensagens", 5)
 
             if quantidade > limite:
@@ -4207,8 +5023,9 @@ async def on_message(message: discord.Message):
                 sucesso = await aplicar_mute(message.author, duracao)
 
                 if sucesso:
+                    apagadas, tempo_limpeza = 0, 0.0
                     if anti_spam_config.get("deletar_mensagens", True):
-                        await deletar_mensagens_spam(message.author, message.channel, quantidade)
+                        apagadas, tempo_limpeza = await deletar_mensagens_spam(message.author)
 
                     xp_removido = False
                     if anti_spam_config.get("remover_xp", True):
@@ -4223,7 +5040,7 @@ async def on_message(message: discord.Message):
                             f"⚠️ {message.author.mention}, você foi mutado por **{duracao} minutos** por spam!{xp_msg}")
 
                     adicionar_log(
-                        f"anti_spam: {message.author.name} mutado por {duracao} min | {quantidade} msgs em {anti_spam_config.get('intervalo_segundos', 5)}s | XP removido: {xp_removido}")
+                        f"anti_spam: {message.author.name} mutado por {duracao} min | {quantidade} msgs em {anti_spam_config.get('intervalo_segundos', 5)}s | XP removido: {xp_removido} | {apagadas} msgs apagadas em {tempo_limpeza:.2f}s")
 
                 return
 
@@ -4231,8 +5048,7 @@ async def on_message(message: discord.Message):
     if message.channel.id in canais_bloqueados:
         url_pattern = r"https?://[^\s]+"
         if re.search(url_pattern, conteudo):
-            cargos_ignorados = {"Administrador", "Moderador"}
-            if not any(r.name in cargos_ignorados for r in message.author.roles):
+            if not cargos_isentos.isento(message.author, "links", CARGOS_ISENTOS_LINKS):
                 try:
                     await message.delete()
                     await message.channel.send(f"⚠️ {message.author.mention}, links não são permitidos aqui!")
@@ -4240,39 +5056,21 @@ async def on_message(message: discord.Message):
                     pass
                 return
 
-    dados.setdefault("xp", {})
-    dados.setdefault("nivel", {})
+    # Dentro do cooldown a mensagem não ganha XP nem passa por nível/cargo
+    if not cooldown_xp.liberar(message.author.id, time.monotonic()):
+        await bot.process_commands(message)
+        return
 
     taxa_xp = dados.get("config", {}).get("taxa_xp", 3)
     ganho_xp = max(1, xp_por_mensagem() // taxa_xp)
-    dados["xp"][str(message.author.id)] = dados["xp"].get(str(message.author.id), 0) + ganho_xp
-
-    xp_atual = dados["xp"][str(message.author.id)]
-    nivel_atual = xp_para_nivel(xp_atual)
-    nivel_anterior = dados["nivel"].get(str(message.author.id), 1)
-
-    if nivel_atual > nivel_anterior:
-        dados["nivel"][str(message.author.id)] = nivel_atual
-
-        canal_levelup_id = dados.get("config", {}).get("canal_levelup")
-        if canal_levelup_id:
-            canal = message.guild.get_channel(int(canal_levelup_id))
-            if canal:
-                await canal.send(f"🎉 {message.author.mention} subiu para o nível **{nivel_atual}**!")
-
-        cargo_id = dados.get("cargos_nivel", {}).get(str(nivel_atual))
-        if cargo_id:
-            cargo = message.guild.get_role(int(cargo_id))
-            if cargo:
-                try:
-                    await message.author.add_roles(cargo, reason=f"Nível {nivel_atual}")
-                except:
-                    pass
-
-    try:
-        salvar_dados_github("XP update")
-    except:
-        pass
+    # O motor só devolve nível quando o limiar do próximo é cruzado; o XP vai
+    # para o diário/snapshot em lote (sincronizar_xp)
+    nivel_atual = motor_xp.adicionar(message.author.id, ganho_xp)
+    if nivel_atual is not None:
+        # Anúncio e cargo saem pela fila de efeitos, sem segurar a próxima mensagem
+        efeitos_nivel.publicar(message.author, nivel_atual,
+                               dados.get("config", {}).get("canal_levelup"),
+                               dados.get("cargos_nivel", {}).get(str(nivel_atual)))
 
     await bot.process_commands(message)
 
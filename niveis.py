@@ -0,0 +1,665 @@
+# ========================
+# MOTOR DE XP
+# ========================
+# XP e nível ficam em arrays compactos com chave int (id do membro), sem str()
+# nem potência fracionária por mensagem: o XP é comparado com o limiar do
+# próximo nível (um índice na tabela da curva) e o nível só é recalculado
+# quando esse limiar é cruzado. Nada é guardado por membro além dos arrays.
+# O formato JSON (`dados["xp"]`/`dados["nivel"]`, chave str) só existe na
+# fronteira com a persistência: carregar() e exportar().
+#
+# Só é usado no loop do bot, então não tem trava.
+import asyncio
+import heapq
+import math
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter
+from itertools import compress
+from operator import add
+
+from sortedcontainers import SortedList
+
+
+# ========================
+# CURVA DE NÍVEL
+# ========================
+# Tabela de limiares (XP mínimo de cada nível) calculada uma vez; nível e
+# progresso dentro do nível saem de busca binária. Configurável em
+# config["curva_nivel"]:
+#   {"tipo": "potencia", "base": 100, "expoente": 0.6}  -> int((xp/base)**expoente) + 1
+#   {"tipo": "linear", "passo": 250}                     -> xp // passo + 1
+#   {"tipo": "tabela", "limiares": [0, 100, 300, ...]}   -> limiares[n-1] = XP do nível n
+# A curva acaba em NIVEL_MAXIMO ou no último nível com XP até XP_MAXIMO (acima
+# disso o float da fórmula já não distingue um XP do seguinte). Base >= 1 e
+# expoente <= 1 garantem que um XP a mais nunca pula nível.
+TIPOS_CURVA = ("potencia", "linear", "tabela")
+NIVEIS_PRECALCULADOS = 200
+NIVEL_MAXIMO = 10_000
+XP_MAXIMO = 2 ** 53
+BASE_LIMITES = (1, 1_000_000)
+EXPOENTE_LIMITES = (0.2, 1.0)
+
+
+class CurvaNivel:
+    def __init__(self, tipo="potencia", base=100, expoente=0.6, passo=250, limiares=None):
+        if tipo not in TIPOS_CURVA:
+            raise ValueError(f"tipo de curva desconhecido: {tipo}")
+        self.tipo = tipo
+        self.base = float(base)
+        self.expoente = float(expoente)
+        self.passo = int(passo)
+        if tipo == "potencia":
+            if not BASE_LIMITES[0] <= self.base <= BASE_LIMITES[1]:
+                raise ValueError(f"base precisa estar entre {BASE_LIMITES[0]} e {BASE_LIMITES[1]}")
+            if not EXPOENTE_LIMITES[0] <= self.expoente <= EXPOENTE_LIMITES[1]:
+                raise ValueError(f"expoente precisa estar entre {EXPOENTE_LIMITES[0]} e {EXPOENTE_LIMITES[1]}")
+        if tipo == "linear" and not 0 < self.passo <= XP_MAXIMO // NIVEL_MAXIMO:
+            raise ValueError(f"passo precisa estar entre 1 e {XP_MAXIMO // NIVEL_MAXIMO}")
+        self.completa = tipo == "tabela"
+        if tipo == "tabela":
+            limiares = [int(v) for v in (limiares or [])]
+            if not limiares or limiares[0] != 0:
+                limiares = [0] + limiares
+            if any(b <= a for a, b in zip(limiares, limiares[1:])):
+                raise ValueError("limiares precisam ser crescentes")
+            if len(limiares) > NIVEL_MAXIMO or limiares[-1] > XP_MAXIMO:
+                raise ValueError(f"no máximo {NIVEL_MAXIMO} níveis e {XP_MAXIMO} de XP")
+            self.limiares = limiares
+        else:
+            self.limiares = [0]
+            self._estender(NIVEIS_PRECALCULADOS)
+
+    @classmethod
+    def de_config(cls, config):
+        config = dict(config or {})
+        return cls(**{chave: config[chave] for chave in ("tipo", "base", "expoente", "passo", "limiares")
+                      if chave in config})
+
+    def para_config(self) -> dict:
+        if self.tipo == "potencia":
+            return {"tipo": "potencia", "base": self.base, "expoente": self.expoente}
+        if self.tipo == "linear":
+            return {"tipo": "linear", "passo": self.passo}
+        return {"tipo": "tabela", "limiares": list(self.limiares)}
+
+    def __eq__(self, outra):
+        return isinstance(outra, CurvaNivel) and self.para_config() == outra.para_config()
+
+    def _formula(self, xp: int) -> int:
+        # Fórmula original; só usada para montar a tabela
+        if self.tipo == "linear":
+            return xp // self.passo + 1
+        return int((xp / self.base) ** self.expoente) + 1
+
+    def _estender(self, ate_nivel: int):
+        ate_nivel = min(ate_nivel, NIVEL_MAXIMO)
+        while not self.completa and len(self.limiares) < ate_nivel:
+            nivel = len(self.limiares) + 1
+            if self.tipo == "linear":
+                self.limiares.append(self.passo * (nivel - 1))
+            else:
+                xp = self._limiar_potencia(nivel)
+                if xp is None:
+                    self.completa = True
+                    break
+                self.limiares.append(xp)
+        if len(self.limiares) >= NIVEL_MAXIMO:
+            self.completa = True
+
+    def _limiar_potencia(self, nivel: int):
+        # Menor XP inteiro com _formula(xp) >= nivel (ou None se passar de
+        # XP_MAXIMO): a inversa dá um palpite e a busca binária sobre inteiros
+        # corrige o arredondamento do float
+        baixo = self.limiares[-1] + 1
+        if self._formula(XP_MAXIMO) < nivel:
+            return None
+        alto = min(max(math.ceil(self.base * (nivel - 1) ** (1 / self.expoente)), baixo), XP_MAXIMO)
+        while self._formula(alto) < nivel:
+            baixo, alto = alto + 1, min(alto * 2, XP_MAXIMO)
+        while baixo < alto:
+            meio = (baixo + alto) // 2
+            if self._formula(meio) >= nivel:
+                alto = meio
+            else:
+                baixo = meio + 1
+        return alto
+
+    def limiar(self, nivel: int) -> int:
+        # XP mínimo do nível; depois do fim da curva, não há próximo nível
+        if nivel <= 1:
+            return 0
+        if nivel > len(self.limiares):
+            self._estender(max(nivel, len(self.limiares) * 2))
+            if nivel > len(self.limiares):
+                return math.inf
+        return self.limiares[nivel - 1]
+
+    def nivel_de(self, xp: int) -> int:
+        while not self.completa and xp >= self.limiares[-1]:
+            self._estender(len(self.limiares) * 2)
+        return max(bisect_right(self.limiares, xp), 1)
+
+    def progresso(self, xp: int, nivel: int = None):
+        # (XP dentro do nível, XP que o nível pede); no último nível da tabela a barra fica cheia
+        if nivel is None:
+            nivel = self.nivel_de(xp)
+        inicio = self.limiar(nivel)
+        fim = self.limiar(nivel + 1)
+        if fim == math.inf:
+            return 1, 1
+        necessario = fim - inicio
+        return min(max(xp - inicio, 0), necessario), necessario
+
+
+# ========================
+# ARMAZÉM COMPACTO
+# ========================
+# ids ordenados (int64) e arrays paralelos de XP (int64) e nível (int32),
+# 20 bytes por membro. O slot de um id sai de busca binária sobre `ids` (um
+# dict id -> slot custaria de novo ~100 bytes por membro); membro novo entra na
+# posição ordenada, o que desloca os seis arrays: ~1ms por membro novo com 1M
+# membros, contra ~15µs de uma mensagem de quem já está no armazém. Acontece
+# uma vez por membro, então a troca vale a memória economizada.
+# Mais 20 bytes de atividade desde que o bot subiu (não vai para o snapshot),
+# usados pela AnaliseXP para "ativos" e "top movers" sem percorrer o diário:
+# último ganho em segundos epoch (uint32) e XP ganho na janela de análise atual
+# e na anterior (int64). Total ~40 bytes por membro (bench_xp_memoria.py),
+# contra ~240 dos dois dicts com chave str.
+XP_AUSENTE = -1
+NIVEL_AUSENTE = 0
+
+
+class ArmazemXP:
+    def __init__(self):
+        self.ids = array("q")
+        self.xp = array("q")
+        self.nivel = array("i")
+        self.ultimo = array("I")
+        self.ganho = array("q")
+        self.ganho_anterior = array("q")
+        self.com_xp = 0
+
+    def __len__(self):
+        return len(self.ids)
+
+    def carregar_json(self, xp: dict, nivel: dict):
+        xp = {int(uid): valor for uid, valor in (xp or {}).items()}
+        nivel = {int(uid): valor for uid, valor in (nivel or {}).items()}
+        ids = sorted(xp.keys() | nivel.keys())
+        self.ids = array("q", ids)
+        self.xp = array("q", [xp.get(uid, XP_AUSENTE) for uid in ids])
+        self.nivel = array("i", [nivel.get(uid, NIVEL_AUSENTE) for uid in ids])
+        self.ultimo = array("I", [0]) * len(ids)
+        self.ganho = array("q", [0]) * len(ids)
+        self.ganho_anterior = array("q", [0]) * len(ids)
+        self.com_xp = len(xp)
+
+    def para_json(self, uids=None):
+        # ({"123": xp}, {"123": nivel}) de todos, ou só de `uids`
+        ids, xp, nivel = self.ids, self.xp, self.nivel
+        if uids is None:
+            # Caminho rápido (zip/compress em C); NIVEL_AUSENTE é 0, então o próprio nível serve de filtro
+            chaves = list(map(str, ids))
+            if self.com_xp == len(ids):
+                xp_json = dict(zip(chaves, xp))
+            else:
+                xp_json = dict(compress(zip(chaves, xp), (v != XP_AUSENTE for v in xp)))
+            return xp_json, dict(compress(zip(chaves, nivel), nivel))
+        slots = [i for i in map(self.slot, uids) if i >= 0]
+        return ({str(ids[i]): xp[i] for i in slots if xp[i] != XP_AUSENTE},
+                {str(ids[i]): nivel[i] for i in slots if nivel[i] != NIVEL_AUSENTE})
+
+    def slot(self, uid: int) -> int:
+        i = bisect_left(self.ids, uid)
+        if i < len(self.ids) and self.ids[i] == uid:
+            return i
+        return -1
+
+    def proximo_slot(self, uid: int) -> int:
+        # Primeiro slot com id maior que `uid` (percorrer em ordem a partir de um cursor)
+        return bisect_right(self.ids, uid)
+
+    def inserir(self, uid: int) -> int:
+        # Slot do membro, criado (sem XP nem nível) se ainda não existir
+        i = bisect_left(self.ids, uid)
+        if i < len(self.ids) and self.ids[i] == uid:
+            return i
+        self.ids.insert(i, uid)
+        self.xp.insert(i, XP_AUSENTE)
+        self.nivel.insert(i, NIVEL_AUSENTE)
+        self.ultimo.insert(i, 0)
+        self.ganho.insert(i, 0)
+        self.ganho_anterior.insert(i, 0)
+        return i
+
+    def definir_xp(self, i: int, valor: int):
+        if self.xp[i] == XP_AUSENTE:
+            self.com_xp += 1
+        self.xp[i] = valor
+
+    def itens_xp(self):
+        return ((uid, valor) for uid, valor in zip(self.ids, self.xp) if valor != XP_AUSENTE)
+
+    def virar_janela(self, pulou: bool = False):
+        # pulou: passou mais de uma janela sem ninguém ganhar XP
+        self.ganho_anterior = array("q", [0]) * len(self.ids) if pulou else self.ganho
+        self.ganho = array("q", [0]) * len(self.ids)
+
+    def colunas(self) -> tuple:
+        return self.ids, self.xp, self.nivel, self.ultimo, self.ganho, self.ganho_anterior
+
+    def bytes_usados(self) -> int:
+        return sum(a.buffer_info()[1] * a.itemsize for a in self.colunas())
+
+
+class RankingXP:
+    # Membros ordenados por (-xp, uid): top K e posição de um membro em
+    # O(log n), atualizado a cada mudança de XP em vez de ordenar tudo por comando.
+    # Cada par vira um único int ((LIMITE - xp) << 64 | uid), mais leve que uma tupla.
+    LIMITE = 1 << 62
+    MASCARA = (1 << 64) - 1
+
+    def __init__(self):
+        self._ordem = SortedList()
+
+    def __len__(self):
+        return len(self._ordem)
+
+    def _chave(self, uid: int, xp: int) -> int:
+        return ((self.LIMITE - xp) << 64) | uid
+
+    def reconstruir(self, pares):
+        self._ordem = SortedList(self._chave(uid, valor) for uid, valor in pares)
+
+    def atualizar(self, uid: int, antigo, novo: int):
+        if antigo is not None:
+            self._ordem.remove(self._chave(uid, antigo))
+        self._ordem.add(self._chave(uid, novo))
+
+    def top(self, k: int) -> list:
+        return [(chave & self.MASCARA, self.LIMITE - (chave >> 64)) for chave in self._ordem.islice(0, k)]
+
+    def posicao(self, uid: int, xp: int) -> int:
+        return self._ordem.bisect_left(self._chave(uid, xp)) + 1
+
+
+class MotorXP:
+    def __init__(self, curva: CurvaNivel, janela: float = 86400):
+        self.curva = curva
+        self.ranking = RankingXP()
+        self.armazem = ArmazemXP()
+        self.sujos = set()
+        self.incrementos = 0
+        self.subidas = 0
+        # Para a análise: janela dos "top movers", XP movimentado (soma dos |deltas|)
+        # e uma versão que muda quando tudo precisa ser recalculado
+        self.janela = janela
+        self._inicio_janela = time.time()
+        self.xp_movimentado = 0
+        self.versao = 0
+
+    def carregar(self, xp: dict, nivel: dict):
+        # A partir do formato salvo ({"123": 450})
+        self.armazem.carregar_json(xp, nivel)
+        self.sujos = set()
+        self.ranking.reconstruir(self.armazem.itens_xp())
+        self._inicio_janela = time.time()
+        self.versao += 1
+
+    def exportar(self, uids=None):
+        return self.armazem.para_json(uids)
+
+    def limiar(self, nivel: int) -> int:
+        return self.curva.limiar(nivel)
+
+    def nivel_de(self, xp: int) -> int:
+        return self.curva.nivel_de(xp)
+
+    def progresso(self, uid: int):
+        return self.curva.progresso(self.xp_de(uid), self.nivel_do(uid))
+
+    def xp_de(self, uid: int) -> int:
+        i = self.armazem.slot(uid)
+        return self.armazem.xp[i] if i >= 0 and self.armazem.xp[i] != XP_AUSENTE else 0
+
+    def nivel_do(self, uid: int) -> int:
+        i = self.armazem.slot(uid)
+        if i >= 0 and self.armazem.nivel[i] != NIVEL_AUSENTE:
+            return self.armazem.nivel[i]
+        return self.nivel_de(self.xp_de(uid))
+
+    def posicao(self, uid: int) -> int:
+        # Posição no ranking; quem não tem XP fica no fim
+        i = self.armazem.slot(uid)
+        if i < 0 or self.armazem.xp[i] == XP_AUSENTE:
+            return len(self.ranking)
+        return self.ranking.posicao(uid, self.armazem.xp[i])
+
+    def adicionar(self, uid: int, ganho: int, agora: float = None):
+        # Soma XP; devolve o novo nível se o membro subiu, senão None
+        if agora is None:
+            agora = time.time()
+        self._conferir_janela(agora)
+        armazem = self.armazem
+        i = armazem.inserir(uid)
+        antigo = armazem.xp[i]
+        if antigo == XP_AUSENTE:
+            antigo = None
+        xp = (antigo or 0) + ganho
+        armazem.definir_xp(i, xp)
+        armazem.ultimo[i] = int(agora)
+        armazem.ganho[i] += ganho
+        self.xp_movimentado += ganho
+        self.ranking.atualizar(uid, antigo, xp)
+        self.sujos.add(uid)
+        self.incrementos += 1
+        anterior = armazem.nivel[i] or 1
+        # Limiar do próximo nível: índice na tabela da curva
+        if xp < self.curva.limiar(anterior + 1):
+            return None
+        nivel = self.nivel_de(xp)
+        if nivel <= anterior:
+            return None
+        armazem.nivel[i] = nivel
+        self.subidas += 1
+        return nivel
+
+    def definir(self, uid: int, xp: int) -> int:
+        # XP absoluto (penalidades, edição manual); o nível acompanha, inclusive para baixo
+        nivel = self.nivel_de(xp)
+        i = self.armazem.inserir(uid)
+        antigo = self.armazem.xp[i]
+        if antigo == XP_AUSENTE:
+            antigo = None
+        self.ranking.atualizar(uid, antigo, xp)
+        self.armazem.definir_xp(i, xp)
+        self.armazem.ganho[i] += xp - (antigo or 0)
+        self.xp_movimentado += abs(xp - (antigo or 0))
+        self.armazem.nivel[i] = nivel
+        self.sujos.add(uid)
+        return nivel
+
+    def aplicar_mesclagem(self, base_xp: dict, remoto_xp: dict, base_nivel: dict, remoto_nivel: dict):
+        # Mesmas regras de persistencia.MESCLAGEM_POR_CHAVE: XP aditivo, e nível
+        # pelo maior só onde o remoto mudou desde a base (mesclar_maximo)
+        armazem = self.armazem
+        for uid_str, valor in remoto_xp.items():
+            delta = valor - base_xp.get(uid_str, 0)
+            if delta:
+                uid = int(uid_str)
+                i = armazem.inserir(uid)
+                antigo = None if armazem.xp[i] == XP_AUSENTE else armazem.xp[i]
+                armazem.definir_xp(i, (antigo or 0) + delta)
+                armazem.ganho[i] += delta
+                self.xp_movimentado += abs(delta)
+                self.ranking.atualizar(uid, antigo, armazem.xp[i])
+        for uid_str, valor in remoto_nivel.items():
+            if valor == base_nivel.get(uid_str):
+                continue
+            uid = int(uid_str)
+            i = armazem.inserir(uid)
+            if valor > armazem.nivel[i]:
+                armazem.nivel[i] = valor
+
+    def trocar_curva(self, curva: CurvaNivel):
+        self.curva = curva
+        self.versao += 1
+
+    def renivelar(self) -> int:
+        # Recalcula o nível de todos numa passada (curva ou taxa mudou); o nível
+        # pode descer. Devolve quantos mudaram, que vão para `sujos`.
+        nivel_de = self.curva.nivel_de
+        armazem = self.armazem
+        mudaram = 0
+        for i, xp in enumerate(armazem.xp):
+            nivel = nivel_de(xp if xp != XP_AUSENTE else 0)
+            if armazem.nivel[i] != nivel:
+                armazem.nivel[i] = nivel
+                self.sujos.add(armazem.ids[i])
+                mudaram += 1
+        self.versao += 1
+        return mudaram
+
+    def _conferir_janela(self, agora: float):
+        passadas = int((agora - self._inicio_janela) // self.janela)
+        if passadas >= 1:
+            self.armazem.virar_janela(pulou=passadas > 1)
+            self._inicio_janela += passadas * self.janela
+            self.versao += 1
+
+    def fotografia(self) -> dict:
+        # Cópia dos arrays (memcpy) para analisar fora do loop do bot
+        agora = time.time()
+        self._conferir_janela(agora)
+        ids, xp, nivel, ultimo, ganho, ganho_anterior = (coluna[:] for coluna in self.armazem.colunas())
+        return {"ids": ids, "xp": xp, "nivel": nivel, "ultimo": ultimo, "ganho": ganho,
+                "ganho_anterior": ganho_anterior, "agora": agora, "desde": self._inicio_janela - self.janela,
+                "versao": self.versao, "movimentado": self.xp_movimentado}
+
+    def retirar_sujos(self) -> set:
+        sujos, self.sujos = self.sujos, set()
+        return sujos
+
+    def estatisticas(self) -> dict:
+        return {
+            "membros": self.armazem.com_xp,
+            "pendentes": len(self.sujos),
+            "incrementos": self.incrementos,
+            "subidas_de_nivel": self.subidas,
+            "bytes_armazem": self.armazem.bytes_usados(),
+            "curva": self.curva.para_config()
+        }
+
+
+# ========================
+# COOLDOWN DE XP
+# ========================
+# Estilo MEE6: no máximo um ganho de XP por membro a cada `segundos`. A tabela
+# guarda só até quando cada membro está bloqueado (uid -> instante); a checagem
+# é um get no dict, e as entradas vencidas saem de forma preguiçosa numa
+# varredura quando a tabela dobra de tamanho desde a anterior.
+class CooldownXP:
+    def __init__(self, segundos: float = 0):
+        self.segundos = 0.0
+        self._ate = {}
+        self._proxima_varredura = 1024
+        self.liberados = 0
+        self.bloqueados = 0
+        self.configurar(segundos)
+
+    def configurar(self, segundos):
+        self.segundos = max(float(segundos or 0), 0.0)
+        if not self.segundos:
+            self._ate = {}
+
+    def liberar(self, uid: int, agora: float) -> bool:
+        # True se o membro pode ganhar XP agora (e já abre a próxima janela)
+        if not self.segundos:
+            return True
+        ate = self._ate.get(uid)
+        if ate is not None and agora < ate:
+            self.bloqueados += 1
+            return False
+        self._ate[uid] = agora + self.segundos
+        self.liberados += 1
+        if len(self._ate) >= self._proxima_varredura:
+            self._varrer(agora)
+        return True
+
+    def _varrer(self, agora: float):
+        self._ate = {uid: ate for uid, ate in self._ate.items() if ate > agora}
+        self._proxima_varredura = max(2 * len(self._ate), 1024)
+
+    def estatisticas(self) -> dict:
+        return {
+            "segundos": self.segundos,
+            "na_tabela": len(self._ate),
+            "liberados": self.liberados,
+            "bloqueados": self.bloqueados
+        }
+
+
+# ========================
+# EFEITOS DE SUBIDA DE NÍVEL
+# ========================
+# O on_message só enfileira; um worker dedicado faz o anúncio e a troca de
+# cargo. Subidas que chegam dentro de `janela` segundos viram um lote: uma
+# mensagem por canal (cada membro com o maior nível alcançado) e uma edição por
+# membro com todos os cargos novos. Fila cheia descarta e conta.
+#
+# anunciar(canal_id, [(membro, nivel), ...]) e aplicar_cargos(membro, {cargo_id, ...})
+# são corrotinas de quem usa (o bot); erros são contados e registrados.
+class FilaEfeitosNivel:
+    def __init__(self, anunciar, aplicar_cargos, tamanho: int = 1000, janela: float = 3.0):
+        self.anunciar = anunciar
+        self.aplicar_cargos = aplicar_cargos
+        self.tamanho = tamanho
+        self.janela = janela
+        self._fila = None
+        self._tarefa = None
+        self.enfileirados = 0
+        self.descartados = 0
+        self.lotes = 0
+        self.anuncios = 0
+        self.edicoes_membro = 0
+        self.falhas = 0
+
+    def iniciar(self):
+        if self._tarefa is None:
+            self._fila = asyncio.Queue(maxsize=self.tamanho)
+            self._tarefa = asyncio.create_task(self._executar())
+
+    def publicar(self, membro, nivel: int, canal_id=None, cargo_id=None) -> bool:
+        if self._fila is None:
+            return False
+        try:
+            self._fila.put_nowait((membro, nivel, canal_id, cargo_id))
+        except asyncio.QueueFull:
+            self.descartados += 1
+            return False
+        self.enfileirados += 1
+        return True
+
+    async def _executar(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            lote = [await self._fila.get()]
+            fim = loop.time() + self.janela
+            while True:
+                restante = fim - loop.time()
+                if restante <= 0:
+                    break
+                try:
+                    lote.append(await asyncio.wait_for(self._fila.get(), restante))
+                except asyncio.TimeoutError:
+                    break
+            await self._processar(lote)
+
+    async def _processar(self, lote: list):
+        self.lotes += 1
+        por_canal = {}
+        por_membro = {}
+        for membro, nivel, canal_id, cargo_id in lote:
+            if canal_id:
+                subidas = por_canal.setdefault(canal_id, {})
+                subidas[membro.id] = (membro, max(nivel, subidas.get(membro.id, (None, 0))[1]))
+            if cargo_id:
+                por_membro.setdefault(membro.id, (membro, set()))[1].add(cargo_id)
+
+        for canal_id, subidas in por_canal.items():
+            try:
+                await self.anunciar(canal_id, list(subidas.values()))
+                self.anuncios += 1
+            except Exception as e:
+                self.falhas += 1
+                print(f"⚠️ Falha ao anunciar subida de nível no canal {canal_id}: {e}")
+        for membro, cargos in por_membro.values():
+            try:
+                await self.aplicar_cargos(membro, cargos)
+                self.edicoes_membro += 1
+            except Exception as e:
+                self.falhas += 1
+                print(f"⚠️ Falha ao dar cargo de nível para {membro}: {e}")
+
+    def estatisticas(self) -> dict:
+        return {
+            "na_fila": self._fila.qsize() if self._fila is not None else 0,
+            "tamanho_maximo": self.tamanho,
+            "enfileirados": self.enfileirados,
+            "descartados": self.descartados,
+            "lotes": self.lotes,
+            "anuncios": self.anuncios,
+            "edicoes_membro": self.edicoes_membro,
+            "falhas": self.falhas
+        }
+
+
+# ========================
+# ANÁLISE DO XP
+# ========================
+# Resumo para o painel (histograma de níveis, percentis, ativos, quem mais
+# ganhou XP na janela) calculado sobre uma fotografia dos arrays só com
+# operações que iteram em C (sorted, Counter, sum, map, heapq sobre zip), sem
+# laço Python por membro. Fica guardado até o XP movimentado desde o cálculo
+# passar de `limiar` (fração do XP total) ou a versão do motor mudar.
+PERCENTIS = (25, 50, 75, 90, 99)
+JANELAS_ATIVOS = {"1h": 3600, "24h": 86400, "7d": 7 * 86400}
+
+
+class AnaliseXP:
+    def __init__(self, limiar: float = 0.01, top: int = 10):
+        self.limiar = limiar
+        self.top = top
+        self.resultado = None
+        self.calculos = 0
+        self._versao = None
+        self._movimentado = 0
+        self._total = 0
+
+    def valido(self, motor: MotorXP) -> bool:
+        return (self.resultado is not None and self._versao == motor.versao
+                and motor.xp_movimentado - self._movimentado <= self.limiar * max(self._total, 1))
+
+    def calcular(self, foto: dict) -> dict:
+        inicio = time.perf_counter()
+        ordenado = sorted(foto["xp"])
+        presentes = ordenado[bisect_left(ordenado, 0):]
+        n = len(presentes)
+        total = sum(presentes)
+
+        # Nível não gravado vale 1 (mesmo padrão do SQLite)
+        contagem = Counter(foto["nivel"])
+        ausentes = contagem.pop(NIVEL_AUSENTE, 0)
+        if ausentes:
+            contagem[1] += ausentes
+
+        ultimos = sorted(foto["ultimo"])
+        agora = int(foto["agora"])
+        ativos = {nome: len(ultimos) - bisect_left(ultimos, max(agora - segundos, 1))
+                  for nome, segundos in JANELAS_ATIVOS.items()}
+
+        movimento = map(add, foto["ganho"], foto["ganho_anterior"])
+        maiores = heapq.nlargest(self.top, zip(movimento, foto["ids"]))
+        ms = (time.perf_counter() - inicio) * 1000
+
+        resultado = {
+            "membros": n,
+            "xp_total": total,
+            "xp_medio": round(total / n, 1) if n else 0,
+            "percentis": {f"p{p}": presentes[min(n - 1, p * n // 100)] for p in PERCENTIS} if n else {},
+            "xp_maximo": presentes[-1] if n else 0,
+            "histograma_niveis": sorted(contagem.items()),
+            "ativos": ativos,
+            "top_ganhos": [{"uid": str(uid), "ganho": ganho} for ganho, uid in maiores if ganho > 0],
+            "janela_desde": foto["desde"],
+            "calculado_em": foto["agora"],
+            "calculo_ms": round(ms, 1)
+        }
+        self.resultado = resultado
+        self._versao = foto["versao"]
+        self._movimentado = foto["movimentado"]
+        self._total = total
+        self.calculos += 1
+        return resultado
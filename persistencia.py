@@ -0,0 +1,1522 @@
+import asyncio
+import base64
+import gzip
+import json
+import os
+import sqlite3
+import struct
+import sys
+import threading
+import time
+import zlib
+from array import array
+
+import aiohttp
+
+
+# ========================
+# MÉTRICAS
+# ========================
+class ContadorLatencia:
+    def __init__(self):
+        self.quantidade = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def registrar(self, ms: float):
+        self.quantidade += 1
+        self.total_ms += ms
+        if ms > self.max_ms:
+            self.max_ms = ms
+
+    def resumo(self) -> dict:
+        media = self.total_ms / self.quantidade if self.quantidade else 0.0
+        return {
+            "quantidade": self.quantidade,
+            "media_ms": round(media, 1),
+            "max_ms": round(self.max_ms, 1),
+            "total_ms": round(self.total_ms, 1)
+        }
+
+
+# ========================
+# FORMATOS DO SNAPSHOT
+# ========================
+# "json": JSON compacto; "gzip": JSON compacto comprimido; "binario": tabelas
+# uid -> inteiro (xp, nivel) empacotadas como arrays int64 e o resto em JSON,
+# tudo comprimido com zlib. A leitura detecta o formato pelos primeiros bytes,
+# então arquivos antigos (JSON indentado) continuam sendo lidos.
+FORMATOS_SNAPSHOT = ("json", "gzip", "binario")
+_MAGICO_GZIP = b"\x1f\x8b"
+_MAGICO_BINARIO = b"RCB1"
+
+
+def _json_compacto(valor) -> bytes:
+    return json.dumps(valor, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _chave_inteira(chave: str) -> bool:
+    # Só chaves que voltam iguais de int() -> str() e cabem em int64; "05" ou "²"
+    # deixam a tabela no JSON
+    return (chave.isascii() and chave.isdigit() and len(chave) <= 19
+            and str(int(chave)) == chave and int(chave) < 2 ** 63)
+
+
+def _eh_tabela_inteira(valor) -> bool:
+    if not isinstance(valor, dict) or not valor:
+        return False
+    if set(map(type, valor.values())) != {int} or not all(map(_chave_inteira, valor.keys())):
+        return False
+    return -2 ** 63 <= min(valor.values()) and max(valor.values()) < 2 ** 63
+
+
+def _array_para_bytes(a: array) -> bytes:
+    if sys.byteorder == "big":
+        a = array(a.typecode, a)
+        a.byteswap()
+    return a.tobytes()
+
+
+def _bytes_para_array(typecode: str, raw: bytes) -> array:
+    a = array(typecode)
+    a.frombytes(raw)
+    if sys.byteorder == "big":
+        a.byteswap()
+    return a
+
+
+def _codificar_binario(documento: dict) -> bytes:
+    tabelas = {k: v for k, v in documento.items() if _eh_tabela_inteira(v)}
+    resto = _json_compacto({k: v for k, v in documento.items() if k not in tabelas})
+    partes = [struct.pack("<I", len(resto)), resto, struct.pack("<H", len(tabelas))]
+    for nome, tabela in tabelas.items():
+        nome_b = nome.encode("utf-8")
+        ids = array("q", map(int, tabela.keys()))
+        valores = array("q", tabela.values())
+        partes += [struct.pack("<H", len(nome_b)), nome_b, struct.pack("<I", len(ids)),
+                   _array_para_bytes(ids), _array_para_bytes(valores)]
+    return _MAGICO_BINARIO + zlib.compress(b"".join(partes), 1)
+
+
+def _decodificar_binario(raw: bytes) -> dict:
+    corpo = zlib.decompress(raw[len(_MAGICO_BINARIO):])
+    (tamanho,) = struct.unpack_from("<I", corpo, 0)
+    pos = 4
+    documento = json.loads(corpo[pos:pos + tamanho].decode("utf-8"))
+    pos += tamanho
+    (n_tabelas,) = struct.unpack_from("<H", corpo, pos)
+    pos += 2
+    for _ in range(n_tabelas):
+        (tam_nome,) = struct.unpack_from("<H", corpo, pos)
+        pos += 2
+        nome = corpo[pos:pos + tam_nome].decode("utf-8")
+        pos += tam_nome
+        (n,) = struct.unpack_from("<I", corpo, pos)
+        pos += 4
+        ids = _bytes_para_array("q", corpo[pos:pos + 8 * n])
+        pos += 8 * n
+        valores = _bytes_para_array("q", corpo[pos:pos + 8 * n])
+        pos += 8 * n
+        documento[nome] = dict(zip(map(str, ids), valores))
+    return documento
+
+
+def codificar_snapshot(documento: dict, formato: str = "json") -> bytes:
+    if formato == "gzip":
+        return gzip.compress(_json_compacto(documento), compresslevel=6, mtime=0)
+    if formato == "binario":
+        return _codificar_binario(documento)
+    return _json_compacto(documento)
+
+
+def decodificar_snapshot(raw: bytes) -> dict:
+    if raw[:2] == _MAGICO_GZIP:
+        return json.loads(gzip.decompress(raw).decode("utf-8"))
+    if raw[:4] == _MAGICO_BINARIO:
+        return _decodificar_binario(raw)
+    return json.loads(raw.decode("utf-8"))
+
+
+# ========================
+# CLIENTE DA API DO GITHUB
+# ========================
+# Devolvido por ClienteGitHub.carregar quando o GitHub responde 304
+NAO_MUDOU = object()
+
+
+class ConflitoGitHub(Exception):
+    # Arquivos que mudaram no GitHub desde a última leitura/gravação nossa
+    def __init__(self, caminhos):
+        super().__init__(f"Conflito em {', '.join(caminhos)}")
+        self.caminhos = list(caminhos)
+
+
+class ClienteGitHub:
+    # Cliente assíncrono com uma única ClientSession (keep-alive) para todas as
+    # chamadas. Para cada arquivo guarda o SHA devolvido pelo último GET/PUT
+    # bem-sucedido e o reaproveita no próximo PUT; só busca de novo quando o
+    # GitHub recusa (409/422).
+    #
+    # `commit_multiplo` grava vários arquivos num único commit pela Git Data API
+    # (blobs -> tree -> commit -> ref), guardando o commit/tree da ponta do branch
+    # para não precisar consultá-la antes de cada gravação.
+
+    def __init__(self, url_repo: str, token: str, branch: str):
+        self.url_repo = url_repo.rstrip("/")
+        self.url_conteudo = f"{self.url_repo}/contents"
+        self.token = token
+        self.branch = branch
+        self.shas = {}
+        self.etags = {}
+        self.respostas_304 = 0
+        self.limite_restante = None
+        self.commit_ponta = None
+        self.tree_ponta = None
+        self.chamadas = 0
+        self.commits_multiplos = 0
+        self.latencia = {"cache": ContadorLatencia(), "refetch": ContadorLatencia(), "commit": ContadorLatencia()}
+        self._sessao = None
+
+    def _headers(self):
+        return {"Authorization": f"token {self.token}", "Accept": "application/vnd.github.v3+json"}
+
+    def _url(self, caminho: str) -> str:
+        return f"{self.url_conteudo}/{caminho}"
+
+    def _obter_sessao(self) -> aiohttp.ClientSession:
+        if self._sessao is None or self._sessao.closed:
+            conector = aiohttp.TCPConnector(limit=8, keepalive_timeout=60, ttl_dns_cache=300)
+            self._sessao = aiohttp.ClientSession(
+                connector=conector,
+                headers=self._headers(),
+                timeout=aiohttp.ClientTimeout(total=30)
+            )
+        return self._sessao
+
+    def _anotar_limite(self, resposta):
+        restante = resposta.headers.get("X-RateLimit-Remaining")
+        if restante is None:
+            return
+        self.limite_restante = int(restante)
+        if resposta.status in (403, 429) and self.limite_restante == 0:
+            print(f"⚠️ Limite da API do GitHub esgotado; libera em {resposta.headers.get('X-RateLimit-Reset')}")
+
+    async def fechar(self):
+        if self._sessao is not None and not self._sessao.closed:
+            await self._sessao.close()
+        self._sessao = None
+
+    async def carregar(self, caminho: str, etag: str = None):
+        # Retorna os bytes do arquivo, ou None se não existir / falhar. Com etag,
+        # manda If-None-Match e devolve NAO_MUDOU se o GitHub responder 304
+        self.chamadas += 1
+        sessao = self._obter_sessao()
+        async with sessao.get(self._url(caminho), params={"ref": self.branch},
+                              headers={"If-None-Match": etag} if etag else None,
+                              timeout=aiohttp.ClientTimeout(total=15)) as r:
+            self._anotar_limite(r)
+            if r.status == 304:
+                self.respostas_304 += 1
+                return NAO_MUDOU
+            if r.status != 200:
+                if r.status != 404:
+                    print(f"⚠️ GitHub GET {caminho} retornou {r.status}")
+                return None
+            js = await r.json(content_type=None)
+            self.etags[caminho] = r.headers.get("ETag")
+        self.shas[caminho] = js.get("sha")
+        conteudo_b64 = js.get("content", "")
+        if not conteudo_b64:
+            return None
+        return base64.b64decode(conteudo_b64)
+
+    async def listar(self, pasta: str, etag: str = None):
+        # Listagem de uma pasta: (status, {caminho: sha}, etag); 304 se nada mudou
+        self.chamadas += 1
+        sessao = self._obter_sessao()
+        async with sessao.get(self._url(pasta), params={"ref": self.branch},
+                              headers={"If-None-Match": etag} if etag else None,
+                              timeout=aiohttp.ClientTimeout(total=15)) as r:
+            self._anotar_limite(r)
+            if r.status == 304:
+                self.respostas_304 += 1
+                return 304, None, etag
+            if r.status != 200:
+                return r.status, None, None
+            itens = await r.json(content_type=None)
+            return 200, {i["path"]: i["sha"] for i in itens if i.get("type", "file") == "file"}, r.headers.get("ETag")
+
+    async def _buscar_sha(self, caminho: str):
+        self.chamadas += 1
+        sessao = self._obter_sessao()
+        async with sessao.get(self._url(caminho), params={"ref": self.branch},
+                              timeout=aiohttp.ClientTimeout(total=15)) as r:
+            self._anotar_limite(r)
+            self.shas[caminho] = (await r.json(content_type=None)).get("sha") if r.status == 200 else None
+
+    async def _put(self, caminho: str, conteudo: bytes, mensagem: str):
+        payload = {
+            "message": mensagem,
+            "content": base64.b64encode(conteudo).decode("utf-8"),
+            "branch": self.branch
+        }
+        if self.shas.get(caminho):
+            payload["sha"] = self.shas[caminho]
+        self.chamadas += 1
+        sessao = self._obter_sessao()
+        async with sessao.put(self._url(caminho), json=payload) as put:
+            self._anotar_limite(put)
+            if put.status in (200, 201):
+                return put.status, await put.json(content_type=None)
+            return put.status, await put.text()
+
+    async def salvar(self, caminho: str, conteudo: bytes, mensagem: str, forcar: bool = True) -> bool:
+        # Sem forcar, um SHA recusado vira ConflitoGitHub em vez de sobrescrever
+        inicio = time.perf_counter()
+        rota = "cache"
+        if caminho not in self.shas:
+            rota = "refetch"
+            await self._buscar_sha(caminho)
+        status, corpo = await self._put(caminho, conteudo, mensagem)
+        if status in (409, 422) and rota == "cache" and not forcar:
+            raise ConflitoGitHub([caminho])
+        if status in (409, 422) and rota == "cache":
+            # SHA em cache desatualizado (alguém gravou o arquivo por fora)
+            rota = "refetch"
+            await self._buscar_sha(caminho)
+            status, corpo = await self._put(caminho, conteudo, mensagem)
+        if status in (200, 201):
+            self.shas[caminho] = corpo.get("content", {}).get("sha")
+            self.etags.pop(caminho, None)
+            # O PUT cria um commit novo; acompanha a ponta para o próximo commit_multiplo
+            commit = corpo.get("commit") or {}
+            self.commit_ponta = commit.get("sha")
+            self.tree_ponta = (commit.get("tree") or {}).get("sha")
+            self.latencia[rota].registrar((time.perf_counter() - inicio) * 1000)
+            return True
+        print(f"❌ Erro ao salvar {caminho} no GitHub: {status}, {str(corpo)[:400]}")
+        return False
+
+    async def _git(self, metodo: str, rota: str, payload=None):
+        self.chamadas += 1
+        sessao = self._obter_sessao()
+        async with sessao.request(metodo, f"{self.url_repo}/git/{rota}", json=payload) as r:
+            self._anotar_limite(r)
+            if r.status in (200, 201):
+                return r.status, await r.json(content_type=None)
+            return r.status, await r.text()
+
+    async def _buscar_ponta(self) -> bool:
+        status, ref = await self._git("GET", f"ref/heads/{self.branch}")
+        if status != 200:
+            print(f"⚠️ GitHub GET ref {self.branch} retornou {status}")
+            return False
+        status, commit = await self._git("GET", f"commits/{ref['object']['sha']}")
+        if status != 200:
+            print(f"⚠️ GitHub GET commit da ponta retornou {status}")
+            return False
+        self.commit_ponta = commit["sha"]
+        self.tree_ponta = commit["tree"]["sha"]
+        return True
+
+    async def _criar_blob(self, conteudo: bytes):
+        status, corpo = await self._git("POST", "blobs", {
+            "content": base64.b64encode(conteudo).decode("utf-8"),
+            "encoding": "base64"
+        })
+        return corpo["sha"] if status == 201 else None
+
+    async def _arquivos_alterados(self, caminhos) -> list:
+        # Quais caminhos têm no GitHub um SHA diferente do último que vimos
+        pastas = {os.path.dirname(c) for c in caminhos}
+        remotos = {}
+        for pasta in pastas:
+            status, itens, _ = await self.listar(pasta)
+            if status == 200:
+                remotos.update(itens)
+            elif status != 404:
+                raise RuntimeError(f"GitHub GET {pasta} retornou {status}")
+        return [c for c in caminhos if remotos.get(c) != self.shas.get(c) and remotos.get(c) is not None]
+
+    async def commit_multiplo(self, arquivos: dict, mensagem: str, forcar: bool = True) -> bool:
+        # arquivos: {caminho: bytes}. Todos entram no mesmo commit e o branch só
+        # anda uma vez, então ninguém vê metade da gravação. Sem forcar, se algum
+        # desses arquivos mudou por fora levanta ConflitoGitHub.
+        inicio = time.perf_counter()
+        caminhos = list(arquivos)
+        if self.commit_ponta is None:
+            if not await self._buscar_ponta():
+                return False
+            # A ponta veio agora, não da nossa última gravação: o que estiver nela
+            # pode ser de outra instância, então confere antes de montar a tree
+            if not forcar:
+                alterados = await self._arquivos_alterados(caminhos)
+                if alterados:
+                    raise ConflitoGitHub(alterados)
+        blobs = await asyncio.gather(*(self._criar_blob(arquivos[c]) for c in caminhos))
+        if not all(blobs):
+            print("❌ Erro ao criar blobs no GitHub")
+            return False
+        entradas = [{"path": c, "mode": "100644", "type": "blob", "sha": b} for c, b in zip(caminhos, blobs)]
+
+        for tentativa in range(2):
+            status, tree = await self._git("POST", "trees", {"base_tree": self.tree_ponta, "tree": entradas})
+            if status != 201:
+                print(f"❌ Erro ao criar tree no GitHub: {status}, {str(tree)[:400]}")
+                return False
+            status, commit = await self._git("POST", "commits", {
+                "message": mensagem, "tree": tree["sha"], "parents": [self.commit_ponta]
+            })
+            if status != 201:
+                print(f"❌ Erro ao criar commit no GitHub: {status}, {str(commit)[:400]}")
+                return False
+            status, corpo = await self._git("PATCH", f"refs/heads/{self.branch}", {"sha": commit["sha"], "force": False})
+            if status == 200:
+                self.commit_ponta = commit["sha"]
+                self.tree_ponta = tree["sha"]
+                self.shas.update(zip(caminhos, blobs))
+                for caminho in caminhos:
+                    self.etags.pop(caminho, None)
+                self.commits_multiplos += 1
+                self.latencia["commit"].registrar((time.perf_counter() - inicio) * 1000)
+                return True
+            # 422: a ponta andou (gravação por fora); refaz tree/commit sobre a nova ponta
+            if status != 422 or tentativa == 1 or not await self._buscar_ponta():
+                break
+            if not forcar:
+                alterados = await self._arquivos_alterados(caminhos)
+                if alterados:
+                    raise ConflitoGitHub(alterados)
+        print(f"❌ Erro ao atualizar {self.branch} no GitHub: {status}, {str(corpo)[:400]}")
+        return False
+
+    def estatisticas(self) -> dict:
+        return {
+            "shas_em_cache": sorted(c for c, sha in self.shas.items() if sha),
+            "commit_ponta": self.commit_ponta,
+            "chamadas_api": self.chamadas,
+            "respostas_304": self.respostas_304,
+            "limite_restante": self.limite_restante,
+            "commits_multiplos": self.commits_multiplos,
+            "latencia_cache": self.latencia["cache"].resumo(),
+            "latencia_refetch": self.latencia["refetch"].resumo(),
+            "latencia_commit": self.latencia["commit"].resumo()
+        }
+
+
+# ========================
+# CACHE LOCAL DO SNAPSHOT
+# ========================
+class CacheSnapshot:
+    # Cópia em disco dos arquivos lidos/gravados no GitHub, com o SHA e o ETag
+    # de cada um, para o bot subir sem baixar nada e só conferir depois.
+    # Métodos síncronos: o backend chama via asyncio.to_thread.
+
+    def __init__(self, pasta: str):
+        self.pasta = pasta
+        self.indice = None
+        self._trava = threading.Lock()
+
+    def _arquivo(self, caminho: str) -> str:
+        return os.path.join(self.pasta, caminho.replace("/", "__"))
+
+    def _abrir(self):
+        if self.indice is None:
+            try:
+                with open(os.path.join(self.pasta, "indice.json"), "r", encoding="utf-8") as f:
+                    self.indice = json.load(f)
+            except (OSError, ValueError):
+                self.indice = {}
+
+    def _gravar_atomico(self, destino: str, conteudo: bytes):
+        temporario = destino + ".tmp"
+        with open(temporario, "wb") as f:
+            f.write(conteudo)
+        os.replace(temporario, destino)
+
+    def ler(self, caminho: str):
+        # (bytes, sha, etag) ou None
+        with self._trava:
+            self._abrir()
+            meta = self.indice.get(caminho)
+            if meta is None:
+                return None
+            try:
+                with open(self._arquivo(caminho), "rb") as f:
+                    return f.read(), meta.get("sha"), meta.get("etag")
+            except OSError:
+                return None
+
+    def gravar(self, arquivos: dict):
+        # arquivos: {caminho: (bytes, sha, etag)}
+        with self._trava:
+            self._abrir()
+            os.makedirs(self.pasta, exist_ok=True)
+            for caminho, (conteudo, sha, etag) in arquivos.items():
+                self._gravar_atomico(self._arquivo(caminho), conteudo)
+                self.indice[caminho] = {"sha": sha, "etag": etag}
+            self._salvar_indice()
+
+    def etag_de(self, chave: str):
+        with self._trava:
+            self._abrir()
+            return (self.indice.get(chave) or {}).get("etag")
+
+    def definir_etag(self, chave: str, etag):
+        with self._trava:
+            self._abrir()
+            self.indice.setdefault(chave, {})["etag"] = etag
+            os.makedirs(self.pasta, exist_ok=True)
+            self._salvar_indice()
+
+    def _salvar_indice(self):
+        self._gravar_atomico(os.path.join(self.pasta, "indice.json"),
+                             json.dumps(self.indice, ensure_ascii=False).encode("utf-8"))
+
+
+# ========================
+# MESCLAGEM EM CONFLITO (TRÊS VIAS)
+# ========================
+# Em conflito temos três versões de cada chave: base (o que vimos por último no
+# GitHub), local (memória) e remoto (o que está lá agora). As funções aplicam
+# no local, no próprio objeto, o que o remoto mudou desde a base.
+
+def _eh_numero(v) -> bool:
+    return isinstance(v, (int, float)) and not isinstance(v, bool)
+
+
+def _chave_registro(registro) -> str:
+    return json.dumps(registro, sort_keys=True, ensure_ascii=False)
+
+
+def mesclar_valor(local, base, remoto):
+    # Genérico: quem mudou em relação à base vence; se os dois mudaram, dicts
+    # são mesclados chave a chave e no resto fica o local
+    if remoto == base:
+        return local
+    if local == base:
+        return remoto
+    if isinstance(local, dict) and isinstance(remoto, dict):
+        base = base if isinstance(base, dict) else {}
+        for chave in set(remoto) | set(base):
+            if chave not in remoto:
+                if chave in local and local[chave] == base.get(chave):
+                    del local[chave]
+            elif chave not in local:
+                if remoto[chave] != base.get(chave):
+                    local[chave] = remoto[chave]
+            else:
+                local[chave] = mesclar_valor(local[chave], base.get(chave), remoto[chave])
+    return local
+
+
+def mesclar_contadores(local: dict, base: dict, remoto: dict) -> dict:
+    # Aditivo (XP): soma no local o quanto cada contador andou no remoto
+    for chave, valor in remoto.items():
+        if _eh_numero(valor):
+            delta = valor - (base.get(chave, 0) if _eh_numero(base.get(chave, 0)) else 0)
+            if delta:
+                local[chave] = local.get(chave, 0) + delta
+    return local
+
+
+def mesclar_maximo(local: dict, base: dict, remoto: dict) -> dict:
+    for chave, valor in remoto.items():
+        if valor != base.get(chave) and _eh_numero(valor):
+            local[chave] = max(local.get(chave, valor), valor)
+    return local
+
+
+def mesclar_uniao(local: list, base: list, remoto: list) -> list:
+    # Logs e históricos: acrescenta o que só o remoto tem
+    vistos = {_chave_registro(r) for r in local} | {_chave_registro(r) for r in base}
+    for registro in remoto:
+        if _chave_registro(registro) not in vistos:
+            local.append(registro)
+    return local
+
+
+def mesclar_por_id(local: list, base: list, remoto: list, campo: str = "id") -> list:
+    # Entradas da fila, pedidos e cupons: identificados por `campo`
+    base_ids = {r.get(campo): r for r in base}
+    remoto_ids = {r.get(campo): r for r in remoto}
+    removidos = set(base_ids) - set(remoto_ids)
+    local[:] = [r for r in local if r.get(campo) not in removidos]
+    posicoes = {r.get(campo): i for i, r in enumerate(local)}
+    for id_, registro in remoto_ids.items():
+        if id_ not in posicoes:
+            if id_ not in base_ids:
+                local.append(registro)
+        elif registro != base_ids.get(id_) and local[posicoes[id_]] == base_ids.get(id_):
+            local[posicoes[id_]] = registro
+    return local
+
+
+def _mesclar_perfil_fidelidade(local: dict, base: dict, remoto: dict) -> dict:
+    for chave in set(remoto) | set(base):
+        if chave == "pontos":
+            delta = remoto.get("pontos", 0) - base.get("pontos", 0)
+            local["pontos"] = local.get("pontos", 0) + delta
+        elif chave == "cupons":
+            mesclar_por_id(local.setdefault("cupons", []), base.get("cupons", []), remoto.get("cupons", []), "token")
+        elif chave == "historico":
+            mesclar_uniao(local.setdefault("historico", []), base.get("historico", []), remoto.get("historico", []))
+        elif chave in remoto:
+            local[chave] = mesclar_valor(local.get(chave), base.get(chave), remoto[chave])
+    return local
+
+
+def _mesclar_fidelidade(local: dict, base: dict, remoto: dict) -> dict:
+    for uid, perfil in remoto.items():
+        if uid not in local:
+            if perfil != base.get(uid):
+                local[uid] = perfil
+        elif perfil != base.get(uid):
+            _mesclar_perfil_fidelidade(local[uid], base.get(uid, {}), perfil)
+    return local
+
+
+def _mesclar_fila(local: dict, base: dict, remoto: dict) -> dict:
+    for chave in set(remoto) | set(base):
+        if chave in ("entradas", "historico"):
+            mesclar_por_id(local.setdefault(chave, []), base.get(chave, []), remoto.get(chave, []))
+        elif chave in remoto:
+            local[chave] = mesclar_valor(local.get(chave), base.get(chave), remoto[chave])
+    return local
+
+
+def _mesclar_lista(local, base, remoto, funcao):
+    return funcao(local if isinstance(local, list) else [], base or [], remoto or [])
+
+
+def _mesclar_dict(local, base, remoto, funcao):
+    return funcao(local if isinstance(local, dict) else {}, base or {}, remoto or {})
+
+
+MESCLAGEM_POR_CHAVE = {
+    "xp": lambda local, base, remoto: _mesclar_dict(local, base, remoto, mesclar_contadores),
+    "nivel": lambda local, base, remoto: _mesclar_dict(local, base, remoto, mesclar_maximo),
+    "logs": lambda local, base, remoto: _mesclar_lista(local, base, remoto, mesclar_uniao),
+    "fila": lambda local, base, remoto: _mesclar_dict(local, base, remoto, _mesclar_fila),
+    "fidelidade": lambda local, base, remoto: _mesclar_dict(local, base, remoto, _mesclar_fidelidade),
+    "pedidos_fidelidade_pendentes": lambda local, base, remoto: _mesclar_lista(local, base, remoto, mesclar_por_id),
+}
+
+
+def mesclar_documento(dados: dict, base: dict, remoto: dict):
+    # Aplica em `dados` as mudanças de `remoto` desde `base`, chave a chave
+    for chave in (set(remoto) | set(base)) - {"_diario_seq"}:
+        mesclar = MESCLAGEM_POR_CHAVE.get(chave)
+        if mesclar is None:
+            if chave not in remoto:
+                if dados.get(chave) == base.get(chave):
+                    dados.pop(chave, None)
+                continue
+            mesclado = mesclar_valor(dados.get(chave), base.get(chave), remoto[chave])
+        else:
+            mesclado = mesclar(dados.get(chave), base.get(chave), remoto.get(chave))
+        if dados.get(chave) is not mesclado:
+            dados[chave] = mesclado
+
+
+# ========================
+# BACKENDS DE ARMAZENAMENTO
+# ========================
+# `alterados` é o conjunto de caminhos tocados desde a última gravação, como
+# ("xp", "123") ou ("config",); ("*",) significa "tudo". Cada backend decide
+# quanto do documento precisa reescrever a partir disso.
+
+class BackendArmazenamento:
+    nome = "base"
+    # True quando o que foi carregado precisa ser regravado num formato novo
+    migracao_pendente = False
+    # True quando carregar() serviu uma cópia local que ainda precisa ser conferida
+    verificacao_pendente = False
+
+    async def carregar(self):
+        # Retorna o documento `dados` salvo, ou None se não houver nada
+        raise NotImplementedError
+
+    async def salvar(self, dados: dict, alterados: set, mensagem: str, arquivo_logs=()) -> bool:
+        # arquivo_logs: registros antigos de log que saíram de `dados["logs"]` e
+        # precisam ir para o arquivo histórico junto com esta gravação
+        raise NotImplementedError
+
+    async def fechar(self):
+        pass
+
+    async def verificar(self, dados: dict) -> list:
+        # Confere a cópia local com a fonte e troca em `dados` o que mudou por
+        # fora; devolve as chaves substituídas
+        return []
+
+    def le_inteira(self, chave: str, alterados: set) -> bool:
+        # Se salvar() vai ler `dados[chave]` inteira nesta gravação (ou só os
+        # caminhos alterados dela); quem monta `dados` sob demanda usa isso
+        return True
+
+    def seq_do_caminho(self, caminho, padrao: int) -> int:
+        # Última sequência do diário já gravada para o trecho de `dados` que contém caminho
+        return padrao
+
+    def estatisticas(self) -> dict:
+        return {"backend": self.nome}
+
+
+# Cada chave de `dados` pertence a um fragmento (arquivo próprio no repositório);
+# chaves não listadas vão para "config"
+FRAGMENTOS = ("xp", "fila", "fidelidade", "credenciais", "config", "logs")
+CHAVES_FRAGMENTO = {
+    "xp": "xp",
+    "nivel": "xp",
+    "fila": "fila",
+    "fidelidade": "fidelidade",
+    "pedidos_fidelidade_pendentes": "fidelidade",
+    "recompensas_fidelidade": "fidelidade",
+    "credenciais": "credenciais",
+    "logs": "logs",
+}
+
+
+def fragmento_da_chave(chave: str) -> str:
+    return CHAVES_FRAGMENTO.get(chave, "config")
+
+
+def fragmentos_alterados(alterados: set) -> set:
+    if ("*",) in alterados:
+        return set(FRAGMENTOS)
+    return {fragmento_da_chave(c[0]) for c in alterados if c[0] != "_diario_seq"}
+
+
+def particionar_logs(registros) -> dict:
+    # {data "AAAA-MM-DD": [registros]} pela data do "ts" de cada registro
+    particoes = {}
+    for registro in registros:
+        particoes.setdefault(str(registro.get("ts", ""))[:10] or "sem-data", []).append(registro)
+    return particoes
+
+
+class BackendGitHub(BackendArmazenamento):
+    # Um arquivo JSON por fragmento (xp, fila, fidelidade, credenciais, config,
+    # logs) dentro de pasta_fragmentos; cada um com SHA próprio, e só os
+    # fragmentos sujos são enviados. Com mais de um fragmento sujo a gravação
+    # vira um único commit pela Git Data API; um só usa o PUT da Contents API
+    # (uma chamada em vez de cinco). Se os fragmentos ainda não existirem, lê o
+    # arquivo único antigo e migra na próxima gravação.
+    #
+    # Com cache, carregar() sobe direto da cópia em disco e verificar() confere
+    # depois com uma listagem condicional da pasta (If-None-Match): 304 ou SHAs
+    # iguais não baixam nem decodificam nada. Até conferir, salvar() recusa
+    # gravar (as alterações ficam no diário) para não sobrescrever o remoto.
+    #
+    # Se um fragmento mudou no GitHub desde a nossa última leitura/gravação, o
+    # remoto é baixado, mesclado em `dados` (três vias contra a versão base
+    # guardada em `bases`) e a gravação é refeita.
+    #
+    # Logs arquivados viram arquivos gzip imutáveis em logs/AAAA-MM-DD/, um por
+    # lote, no mesmo commit dos fragmentos.
+    nome = "github"
+    tentativas_conflito = 3
+    # Chamado como ao_mesclar(base, remoto) depois de cada mesclagem, para quem
+    # mantém cópias derivadas de `dados` (ex.: o motor de XP)
+    ao_mesclar = None
+
+    def __init__(self, cliente: ClienteGitHub, arquivo_legado: str, pasta_fragmentos: str, formato: str = "json",
+                 cache: CacheSnapshot = None):
+        if formato not in FORMATOS_SNAPSHOT:
+            raise ValueError(f"Formato de snapshot desconhecido: {formato}")
+        self.cliente = cliente
+        self.cache = cache
+        self.formato = formato
+        self.bytes_enviados = 0
+        self.arquivo_legado = arquivo_legado
+        self.pasta_fragmentos = pasta_fragmentos.strip("/")
+        self.sujos = set()
+        self.seq_fragmentos = {}
+        self.gravacoes_fragmento = {f: 0 for f in FRAGMENTOS}
+        # Bytes da última versão de cada fragmento sincronizada com o GitHub
+        self.bases = {}
+        self.logs_arquivados = 0
+        self.conflitos = {f: 0 for f in FRAGMENTOS}
+        self.latencia_mesclagem = ContadorLatencia()
+
+    def caminho_fragmento(self, fragmento: str) -> str:
+        return f"{self.pasta_fragmentos}/{fragmento}.json"
+
+    def _arquivos_de_log(self, registros) -> dict:
+        arquivos = {}
+        for data, lote in particionar_logs(registros).items():
+            nome = f"{lote[0].get('n', 0):010d}-{lote[-1].get('n', 0):010d}.jsonl.gz"
+            linhas = b"".join(_json_compacto(r) + b"\n" for r in lote)
+            arquivos[f"{self.pasta_fragmentos}/logs/{data}/{nome}"] = gzip.compress(linhas, mtime=0)
+        return arquivos
+
+    def _montar(self, conteudos) -> dict:
+        dados = {}
+        for fragmento, raw in zip(FRAGMENTOS, conteudos):
+            if raw is None:
+                continue
+            self.bases[fragmento] = raw
+            documento = decodificar_snapshot(raw)
+            self.seq_fragmentos[fragmento] = documento.pop("_diario_seq", 0)
+            dados.update(documento)
+        dados["_diario_seq"] = max(self.seq_fragmentos.values(), default=0)
+        return dados
+
+    async def _carregar_do_cache(self):
+        caminhos = [self.caminho_fragmento(f) for f in FRAGMENTOS]
+        lidos = await asyncio.to_thread(lambda: [self.cache.ler(c) for c in caminhos])
+        if not any(lidos):
+            return None
+        for caminho, lido in zip(caminhos, lidos):
+            if lido is not None and lido[1]:
+                self.cliente.shas[caminho] = lido[1]
+        self.verificacao_pendente = True
+        print("⚡ Dados servidos do cache local; conferindo com o GitHub em segundo plano.")
+        return self._montar([lido[0] if lido else None for lido in lidos])
+
+    async def carregar(self):
+        if self.cache is not None:
+            dados = await self._carregar_do_cache()
+            if dados is not None:
+                return dados
+
+        conteudos = await asyncio.gather(
+            *(self.cliente.carregar(self.caminho_fragmento(f)) for f in FRAGMENTOS)
+        )
+        if not any(c is not None for c in conteudos):
+            raw = await self.cliente.carregar(self.arquivo_legado)
+            if raw is None:
+                return None
+            print(f"📦 Fragmentos não encontrados; usando {self.arquivo_legado} e migrando na próxima gravação.")
+            dados = decodificar_snapshot(raw)
+            seq = dados.get("_diario_seq", 0)
+            self.seq_fragmentos = {f: seq for f in FRAGMENTOS}
+            self.sujos = set(FRAGMENTOS)
+            self.migracao_pendente = True
+            return dados
+
+        dados = self._montar(conteudos)
+        await self._guardar_no_cache({self.caminho_fragmento(f): raw for f, raw in zip(FRAGMENTOS, conteudos)
+                                      if raw is not None})
+        return dados
+
+    async def _guardar_no_cache(self, arquivos: dict):
+        if self.cache is None or not arquivos:
+            return
+        try:
+            await asyncio.to_thread(self.cache.gravar, {
+                c: (raw, self.cliente.shas.get(c), self.cliente.etags.get(c)) for c, raw in arquivos.items()
+            })
+        except OSError as e:
+            print(f"⚠️ Não foi possível atualizar o cache local: {e}")
+
+    async def verificar(self, dados: dict) -> list:
+        if not self.verificacao_pendente:
+            return []
+        etag_listagem = await asyncio.to_thread(self.cache.etag_de, "_listagem")
+        status, remotos, etag = await self.cliente.listar(self.pasta_fragmentos, etag_listagem)
+        if status == 304:
+            mudaram = []
+        elif status == 200:
+            mudaram = [f for f in FRAGMENTOS
+                       if remotos.get(self.caminho_fragmento(f)) != self.cliente.shas.get(self.caminho_fragmento(f))]
+        elif status == 404:
+            # A pasta sumiu do repositório: o que temos localmente vira a versão oficial
+            print("⚠️ Fragmentos não existem mais no GitHub; serão regravados a partir do cache.")
+            self.sujos = set(FRAGMENTOS)
+            mudaram = []
+        else:
+            raise RuntimeError(f"GitHub GET {self.pasta_fragmentos} retornou {status}")
+
+        substituidas = []
+        novos = {}
+        for fragmento in mudaram:
+            caminho = self.caminho_fragmento(fragmento)
+            if remotos.get(caminho) is None:
+                # Apagado por fora: mantém a cópia local e regrava
+                self.sujos.add(fragmento)
+                continue
+            cacheado = await asyncio.to_thread(self.cache.ler, caminho)
+            raw = await self.cliente.carregar(caminho, cacheado[2] if cacheado else None)
+            if raw is NAO_MUDOU:
+                continue
+            if raw is None:
+                raise RuntimeError(f"Não foi possível baixar {caminho}")
+            self.bases[fragmento] = raw
+            documento = decodificar_snapshot(raw)
+            self.seq_fragmentos[fragmento] = documento.pop("_diario_seq", 0)
+            for chave in [k for k in dados if k != "_diario_seq" and fragmento_da_chave(k) == fragmento]:
+                del dados[chave]
+            dados.update(documento)
+            substituidas.extend(documento)
+            novos[caminho] = raw
+        await self._guardar_no_cache(novos)
+        if etag and status != 404:
+            await asyncio.to_thread(self.cache.definir_etag, "_listagem", etag)
+        self.verificacao_pendente = False
+        return substituidas
+
+    def seq_do_caminho(self, caminho, padrao: int) -> int:
+        return self.seq_fragmentos.get(fragmento_da_chave(caminho[0]), 0)
+
+    def le_inteira(self, chave: str, alterados: set) -> bool:
+        return fragmento_da_chave(chave) in (self.sujos | fragmentos_alterados(alterados))
+
+    def _serializar(self, dados: dict, fragmento: str) -> bytes:
+        # O Flask altera `dados` na sua própria thread; se isso acontecer durante
+        # o dumps, basta tentar de novo
+        for tentativa in range(3):
+            try:
+                documento = {k: v for k, v in dados.items()
+                             if k != "_diario_seq" and fragmento_da_chave(k) == fragmento}
+                documento["_diario_seq"] = dados.get("_diario_seq", 0)
+                return codificar_snapshot(documento, self.formato)
+            except RuntimeError:
+                if tentativa == 2:
+                    raise
+
+    def _marcar_gravado(self, fragmento: str, seq: int, conteudo: bytes):
+        self.bases[fragmento] = conteudo
+        self.sujos.discard(fragmento)
+        self.seq_fragmentos[fragmento] = seq
+        self.gravacoes_fragmento[fragmento] += 1
+        self.bytes_enviados += len(conteudo)
+
+    async def salvar(self, dados: dict, alterados: set, mensagem: str, arquivo_logs=()) -> bool:
+        self.sujos |= fragmentos_alterados(alterados)
+        if arquivo_logs:
+            self.sujos.add("logs")
+        if self.verificacao_pendente:
+            print("⏳ Gravação adiada: cache local ainda não conferido com o GitHub.")
+            return False
+        seq = dados.get("_diario_seq", 0)
+        conteudos = {f: self._serializar(dados, f) for f in FRAGMENTOS if f in self.sujos}
+        if not conteudos:
+            return True
+        extras = self._arquivos_de_log(arquivo_logs)
+
+        for tentativa in range(self.tentativas_conflito):
+            try:
+                if not await self._enviar(conteudos, mensagem, extras):
+                    return False
+                break
+            except ConflitoGitHub as e:
+                if tentativa == self.tentativas_conflito - 1:
+                    print(f"❌ {e}: desistindo após {self.tentativas_conflito} tentativas")
+                    return False
+                await self._resolver_conflito(dados, e.caminhos, conteudos)
+        for fragmento, conteudo in conteudos.items():
+            self._marcar_gravado(fragmento, seq, conteudo)
+        self.logs_arquivados += len(arquivo_logs)
+        self.bytes_enviados += sum(len(c) for c in extras.values())
+        self.migracao_pendente = False
+        await self._guardar_no_cache({self.caminho_fragmento(f): c for f, c in conteudos.items()})
+        return True
+
+    async def _enviar(self, conteudos: dict, mensagem: str, extras: dict) -> bool:
+        # Na migração do arquivo antigo ainda não há base para mesclar: sobrescreve
+        forcar = self.migracao_pendente
+        arquivos = {self.caminho_fragmento(f): c for f, c in conteudos.items()}
+        arquivos.update(extras)
+        if len(arquivos) > 1:
+            return await self.cliente.commit_multiplo(arquivos, mensagem, forcar=forcar)
+        caminho, conteudo = next(iter(arquivos.items()))
+        return await self.cliente.salvar(caminho, conteudo, mensagem, forcar=forcar)
+
+    async def _resolver_conflito(self, dados: dict, caminhos, conteudos: dict):
+        inicio = time.perf_counter()
+        por_caminho = {self.caminho_fragmento(f): f for f in FRAGMENTOS}
+        for caminho in caminhos:
+            fragmento = por_caminho.get(caminho)
+            if fragmento is None:
+                # Lote de log já gravado numa tentativa anterior: o conteúdo é o mesmo
+                await self.cliente.carregar(caminho)
+                continue
+            raw = await self.cliente.carregar(caminho)
+            if raw is None:
+                raise RuntimeError(f"Não foi possível baixar {caminho} para mesclar")
+            remoto = decodificar_snapshot(raw)
+            remoto.pop("_diario_seq", None)
+            if fragmento in self.bases:
+                base = decodificar_snapshot(self.bases[fragmento])
+                base.pop("_diario_seq", None)
+            else:
+                # Sem base conhecida não dá para saber o que mudou: o local vence
+                base = remoto
+            mesclar_documento(dados, base, remoto)
+            if self.ao_mesclar is not None:
+                self.ao_mesclar(base, remoto)
+            self.bases[fragmento] = raw
+            self.conflitos[fragmento] += 1
+            conteudos[fragmento] = self._serializar(dados, fragmento)
+        ms = (time.perf_counter() - inicio) * 1000
+        self.latencia_mesclagem.registrar(ms)
+        print(f"🔀 Conflito com gravação externa em {', '.join(caminhos)}; mesclado em {ms:.0f}ms")
+
+    async def fechar(self):
+        await self.cliente.fechar()
+
+    def estatisticas(self) -> dict:
+        return {
+            "backend": self.nome,
+            "formato": self.formato,
+            "conflitos_por_fragmento": self.conflitos,
+            "latencia_mesclagem": self.latencia_mesclagem.resumo(),
+            "bytes_enviados": self.bytes_enviados,
+            "logs_arquivados": self.logs_arquivados,
+            "fragmentos_sujos": sorted(self.sujos),
+            "cache_local": self.cache.pasta if self.cache is not None else None,
+            "verificacao_pendente": self.verificacao_pendente,
+            "gravacoes_por_fragmento": self.gravacoes_fragmento,
+            **self.cliente.estatisticas()
+        }
+
+
+ESQUEMA_SQLITE = """
+CREATE TABLE IF NOT EXISTS xp (
+    uid INTEGER PRIMARY KEY,
+    xp INTEGER NOT NULL DEFAULT 0,
+    nivel INTEGER NOT NULL DEFAULT 1
+);
+CREATE INDEX IF NOT EXISTS idx_xp_xp ON xp (xp DESC);
+CREATE TABLE IF NOT EXISTS fidelidade (
+    uid TEXT PRIMARY KEY,
+    pontos INTEGER NOT NULL DEFAULT 0,
+    ultimo_pedido_ts REAL,
+    perfil TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS cupons (
+    token TEXT PRIMARY KEY,
+    uid TEXT NOT NULL,
+    recompensa_id TEXT,
+    usado INTEGER NOT NULL DEFAULT 0,
+    expirado INTEGER NOT NULL DEFAULT 0,
+    criado_em_ts REAL,
+    cupom TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_cupons_uid ON cupons (uid);
+CREATE TABLE IF NOT EXISTS fila (
+    id TEXT PRIMARY KEY,
+    posicao INTEGER NOT NULL,
+    entrada TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_fila_posicao ON fila (posicao);
+CREATE TABLE IF NOT EXISTS logs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts TEXT,
+    entrada TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_logs_ts ON logs (ts);
+CREATE TABLE IF NOT EXISTS documentos (
+    chave TEXT PRIMARY KEY,
+    valor TEXT NOT NULL
+);
+"""
+
+# Chaves de `dados` que têm tabela própria; o resto vai para `documentos`
+TABELAS_SQLITE = {"xp", "nivel", "fidelidade", "fila", "logs"}
+
+
+def _json(valor) -> str:
+    return json.dumps(valor, ensure_ascii=False, separators=(",", ":"))
+
+
+class BackendSQLite(BackendArmazenamento):
+    # Banco local em modo WAL com tabelas e índices por domínio. Só as linhas
+    # dos caminhos alterados são regravadas. As consultas rodam numa thread
+    # separada; a montagem das linhas (leitura de `dados`) roda no loop do bot.
+    # A tabela logs guarda o histórico inteiro (id = "n" do registro); só os
+    # últimos logs_em_memoria voltam para `dados["logs"]` ao carregar.
+    nome = "sqlite"
+
+    def __init__(self, arquivo: str, logs_em_memoria: int = 500):
+        self.arquivo = arquivo
+        self.logs_em_memoria = logs_em_memoria
+        self._conexao = None
+        self._lock = threading.Lock()
+        self._ultimo_log = 0
+        self.linhas_gravadas = 0
+
+    def _conectar(self):
+        if self._conexao is None:
+            pasta = os.path.dirname(self.arquivo)
+            if pasta:
+                os.makedirs(pasta, exist_ok=True)
+            con = sqlite3.connect(self.arquivo, check_same_thread=False)
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute("PRAGMA synchronous=NORMAL")
+            con.executescript(ESQUEMA_SQLITE)
+            self._conexao = con
+        return self._conexao
+
+    async def carregar(self):
+        return await asyncio.to_thread(self._carregar)
+
+    def _carregar(self):
+        with self._lock:
+            con = self._conectar()
+            dados = {}
+            for chave, valor in con.execute("SELECT chave, valor FROM documentos"):
+                dados[chave] = json.loads(valor)
+
+            linhas_xp = con.execute("SELECT uid, xp, nivel FROM xp").fetchall()
+            if linhas_xp:
+                dados["xp"] = {str(uid): xp for uid, xp, _ in linhas_xp}
+                dados["nivel"] = {str(uid): nivel for uid, _, nivel in linhas_xp}
+
+            fidelidade = {}
+            for uid, perfil in con.execute("SELECT uid, perfil FROM fidelidade"):
+                perfil = json.loads(perfil)
+                perfil["cupons"] = []
+                fidelidade[uid] = perfil
+            for uid, cupom in con.execute("SELECT uid, cupom FROM cupons ORDER BY criado_em_ts, rowid"):
+                if uid in fidelidade:
+                    fidelidade[uid]["cupons"].append(json.loads(cupom))
+            if fidelidade:
+                dados["fidelidade"] = fidelidade
+
+            entradas = [json.loads(e) for (e,) in con.execute("SELECT entrada FROM fila ORDER BY posicao")]
+            if "fila" in dados:
+                dados["fila"]["entradas"] = entradas
+
+            logs = [{"n": n, "ts": ts, "entrada": entrada} for n, ts, entrada in
+                    con.execute("SELECT id, ts, entrada FROM logs ORDER BY id DESC LIMIT ?", (self.logs_em_memoria,))]
+            if logs:
+                dados["logs"] = logs[::-1]
+            self._ultimo_log = logs[0]["n"] if logs else 0
+        return dados or None
+
+    def le_inteira(self, chave: str, alterados: set) -> bool:
+        return ("*",) in alterados or (chave,) in alterados
+
+    def _preparar(self, dados: dict, alterados: set, arquivo_logs=()):
+        # Monta a lista de (sql, parâmetros, executemany) a partir dos caminhos alterados
+        ops = []
+        if ("*",) in alterados:
+            inteiras = set(dados.keys()) | TABELAS_SQLITE
+        else:
+            inteiras = {c[0] for c in alterados if len(c) == 1}
+        parciais = {}
+        for caminho in alterados:
+            if len(caminho) > 1 and caminho[0] not in inteiras:
+                parciais.setdefault(caminho[0], set()).add(caminho[1])
+
+        xp = dados.get("xp", {})
+        niveis = dados.get("nivel", {})
+        sql_xp = "INSERT OR REPLACE INTO xp (uid, xp, nivel) VALUES (?, ?, ?)"
+        if "xp" in inteiras or "nivel" in inteiras:
+            uids = set(xp) | set(niveis)
+            ops.append(("DELETE FROM xp", (), False))
+        else:
+            uids = parciais.get("xp", set()) | parciais.get("nivel", set())
+        linhas, removidos = [], []
+        for uid in uids:
+            try:
+                chave = int(uid)
+            except (TypeError, ValueError):
+                continue
+            if uid in xp or uid in niveis:
+                linhas.append((chave, xp.get(uid, 0), niveis.get(uid, 1)))
+            else:
+                removidos.append((chave,))
+        if linhas:
+            ops.append((sql_xp, linhas, True))
+        if removidos:
+            ops.append(("DELETE FROM xp WHERE uid = ?", removidos, True))
+
+        fidelidade = dados.get("fidelidade", {})
+        if "fidelidade" in inteiras:
+            ops.append(("DELETE FROM fidelidade", (), False))
+            ops.append(("DELETE FROM cupons", (), False))
+            uids = set(fidelidade)
+        else:
+            uids = parciais.get("fidelidade", set())
+        for uid in uids:
+            ops.append(("DELETE FROM cupons WHERE uid = ?", (uid,), False))
+            perfil = fidelidade.get(uid)
+            if perfil is None:
+                ops.append(("DELETE FROM fidelidade WHERE uid = ?", (uid,), False))
+                continue
+            sem_cupons = {k: v for k, v in perfil.items() if k != "cupons"}
+            ops.append(("INSERT OR REPLACE INTO fidelidade (uid, pontos, ultimo_pedido_ts, perfil) VALUES (?, ?, ?, ?)",
+                        (uid, perfil.get("pontos", 0), perfil.get("ultimo_pedido_ts"), _json(sem_cupons)), False))
+            cupons = [(c.get("token"), uid, c.get("recompensa_id"), int(bool(c.get("usado"))),
+                       int(bool(c.get("expirado"))), c.get("criado_em_ts"), _json(c))
+                      for c in perfil.get("cupons", []) if c.get("token")]
+            if cupons:
+                ops.append(("INSERT OR REPLACE INTO cupons (token, uid, recompensa_id, usado, expirado, criado_em_ts, cupom) "
+                            "VALUES (?, ?, ?, ?, ?, ?, ?)", cupons, True))
+
+        if "fila" in inteiras or "fila" in parciais:
+            fila = dados.get("fila", {})
+            ops.append(("DELETE FROM fila", (), False))
+            entradas = [(e.get("id"), i, _json(e)) for i, e in enumerate(fila.get("entradas", []))]
+            if entradas:
+                ops.append(("INSERT OR REPLACE INTO fila (id, posicao, entrada) VALUES (?, ?, ?)", entradas, True))
+            resto = {k: v for k, v in fila.items() if k != "entradas"}
+            ops.append(("INSERT OR REPLACE INTO documentos (chave, valor) VALUES (?, ?)", ("fila", _json(resto)), False))
+
+        ultimo_log = self._ultimo_log
+        if "logs" in inteiras or "logs" in parciais or arquivo_logs:
+            # Registros já gravados são ignorados pelo id; os arquivados podem
+            # ainda não ter entrado se saíram do anel entre duas gravações
+            novos = [registro for registro in list(arquivo_logs) + list(dados.get("logs", []))
+                     if registro.get("n", 0) > self._ultimo_log]
+            if novos:
+                ops.append(("INSERT OR IGNORE INTO logs (id, ts, entrada) VALUES (?, ?, ?)",
+                            [(registro["n"], registro.get("ts"), registro.get("entrada")) for registro in novos], True))
+                ultimo_log = max(registro["n"] for registro in novos)
+
+        for chave in (inteiras | set(parciais)) - TABELAS_SQLITE:
+            if chave == "*":
+                continue
+            if chave in dados:
+                ops.append(("INSERT OR REPLACE INTO documentos (chave, valor) VALUES (?, ?)",
+                            (chave, _json(dados[chave])), False))
+            else:
+                ops.append(("DELETE FROM documentos WHERE chave = ?", (chave,), False))
+        return ops, ultimo_log
+
+    def _executar(self, ops):
+        with self._lock:
+            con = self._conectar()
+            linhas = 0
+            with con:
+                for sql, parametros, varios in ops:
+                    if varios:
+                        con.executemany(sql, parametros)
+                        linhas += len(parametros)
+                    else:
+                        con.execute(sql, parametros)
+                        linhas += 1
+            self.linhas_gravadas += linhas
+
+    async def salvar(self, dados: dict, alterados: set, mensagem: str, arquivo_logs=()) -> bool:
+        for tentativa in range(3):
+            try:
+                ops, ultimo_log = self._preparar(dados, alterados, arquivo_logs)
+                break
+            except RuntimeError:
+                if tentativa == 2:
+                    raise
+        await asyncio.to_thread(self._executar, ops)
+        self._ultimo_log = ultimo_log
+        return True
+
+    async def fechar(self):
+        with self._lock:
+            if self._conexao is not None:
+                self._conexao.close()
+                self._conexao = None
+
+    def estatisticas(self) -> dict:
+        tamanho = os.path.getsize(self.arquivo) if os.path.exists(self.arquivo) else 0
+        return {"backend": self.nome, "arquivo": self.arquivo, "tamanho_bytes": tamanho,
+                "linhas_gravadas": self.linhas_gravadas}
+
+
+# ========================
+# DIÁRIO LOCAL (APPEND-ONLY)
+# ========================
+def aplicar_operacao(dados: dict, op: dict):
+    # Todas as operações são idempotentes: reaplicar uma que já está no
+    # snapshot não muda o resultado
+    caminho = op["caminho"]
+    alvo = dados
+    for chave in caminho[:-1]:
+        alvo = alvo.setdefault(chave, {})
+    ultima = caminho[-1]
+    if op["op"] == "set":
+        alvo[ultima] = op["valor"]
+    elif op["op"] == "del":
+        alvo.pop(ultima, None)
+    elif op["op"] == "append":
+        lista = alvo.setdefault(ultima, [])
+        valor = op["valor"]
+        if _numerado(valor) and lista and _numerado(lista[-1]):
+            # Registros numerados (logs): "n" crescente, o que não passa do último já entrou
+            if valor["n"] > lista[-1]["n"]:
+                lista.append(valor)
+        elif valor not in lista:
+            lista.append(valor)
+
+
+def _numerado(valor) -> bool:
+    return isinstance(valor, dict) and isinstance(valor.get("n"), int)
+
+
+class Diario:
+    # Cada alteração vira uma linha JSON com número de sequência, gravada e
+    # sincronizada (fdatasync) na hora. O snapshot enviado ao GitHub guarda a
+    # última sequência que contém; ao iniciar, reaplica-se só o que veio depois.
+
+    def __init__(self, arquivo: str):
+        self.arquivo = arquivo
+        self.seq = 0
+        self.registradas = 0
+        self._lock = threading.Lock()
+        self._fd = None
+
+    def _abrir(self):
+        if self._fd is None:
+            pasta = os.path.dirname(self.arquivo)
+            if pasta:
+                os.makedirs(pasta, exist_ok=True)
+            self._fd = os.open(self.arquivo, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+        return self._fd
+
+    def registrar(self, op: str, caminho, valor=None):
+        return self.registrar_varios([(op, caminho, valor)])
+
+    def registrar_varios(self, operacoes):
+        # Várias (op, caminho, valor) numa única escrita e sincronização
+        with self._lock:
+            linhas = []
+            for op, caminho, valor in operacoes:
+                self.seq += 1
+                entrada = {"seq": self.seq, "op": op, "caminho": list(caminho)}
+                if op != "del":
+                    entrada["valor"] = valor
+                linhas.append(json.dumps(entrada, ensure_ascii=False, separators=(",", ":")) + "\n")
+            if not linhas:
+                return self.seq
+            fd = self._abrir()
+            os.write(fd, "".join(linhas).encode("utf-8"))
+            if hasattr(os, "fdatasync"):
+                os.fdatasync(fd)
+            else:
+                os.fsync(fd)
+            self.registradas += len(linhas)
+            return self.seq
+
+    def registrar_caminho(self, dados: dict, caminho):
+        # Registra o valor atual de dados[caminho...] (ou a remoção, se não existir mais)
+        alvo = dados
+        for chave in caminho[:-1]:
+            alvo = alvo.get(chave) if isinstance(alvo, dict) else None
+            if alvo is None:
+                break
+        if isinstance(alvo, dict) and caminho[-1] in alvo:
+            return self.registrar("set", caminho, alvo[caminho[-1]])
+        return self.registrar("del", caminho)
+
+    def _ler(self):
+        entradas = []
+        if not os.path.exists(self.arquivo):
+            return entradas
+        with open(self.arquivo, "r", encoding="utf-8") as f:
+            for linha in f:
+                linha = linha.strip()
+                if not linha:
+                    continue
+                try:
+                    entradas.append(json.loads(linha))
+                except ValueError:
+                    # Última linha cortada por uma queda no meio da escrita
+                    break
+        return entradas
+
+    def reaplicar(self, dados: dict, desde=0) -> int:
+        # desde: sequência já contida no snapshot, ou uma função caminho -> sequência
+        # quando partes diferentes do snapshot foram gravadas em momentos diferentes
+        seq_de = desde if callable(desde) else (lambda caminho: desde)
+        aplicadas = 0
+        with self._lock:
+            maior = 0
+            for entrada in self._ler():
+                if entrada["seq"] > seq_de(entrada["caminho"]):
+                    aplicar_operacao(dados, entrada)
+                    aplicadas += 1
+                maior = max(maior, entrada["seq"])
+            self.seq = max(self.seq, maior, dados.get("_diario_seq", 0))
+        return aplicadas
+
+    def compactar(self, ate_seq: int):
+        # Descarta as entradas que já estão no snapshot enviado (seq <= ate_seq)
+        with self._lock:
+            if self.seq <= ate_seq:
+                restantes = []
+            else:
+                restantes = [e for e in self._ler() if e["seq"] > ate_seq]
+            temporario = self.arquivo + ".tmp"
+            with open(temporario, "w", encoding="utf-8") as f:
+                for entrada in restantes:
+                    f.write(json.dumps(entrada, ensure_ascii=False, separators=(",", ":")) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+            os.replace(temporario, self.arquivo)
+
+    def estatisticas(self) -> dict:
+        tamanho = os.path.getsize(self.arquivo) if os.path.exists(self.arquivo) else 0
+        return {"seq": self.seq, "registradas": self.registradas, "tamanho_bytes": tamanho}
+
+
+# ========================
+# GRAVAÇÃO ADIADA (WRITE-BEHIND)
+# ========================
+class GerenciadorPersistencia:
+    # As alterações só marcam os dados como "sujos"; uma tarefa no loop do bot
+    # grava no máximo uma vez por intervalo, ou antes disso se acumular
+    # max_alteracoes. marcar_alterado e salvar_agora podem ser chamados de
+    # qualquer thread (ex.: Flask); a gravação em si sempre roda no loop do bot.
+
+    def __init__(self, gravar, intervalo: float = 30.0, max_alteracoes: int = 50):
+        self._gravar = gravar
+        self.intervalo = intervalo
+        self.max_alteracoes = max_alteracoes
+        self._lock = threading.Lock()
+        self._lock_gravacao = None
+        self._evento = None
+        self._loop = None
+        self._tarefa = None
+        self._rodando = False
+        self._pendentes = 0
+        self._primeira_alteracao = None
+        self._ultima_mensagem = None
+        self._alterados = set()
+        self._nao_antes_de = 0.0
+        self.iniciado = False
+        self.alteracoes = 0
+        self.gravacoes = 0
+        self.falhas = 0
+        self.coalescidas = 0
+
+    def marcar_alterado(self, mensagem: str = "Atualização do bot", caminhos=None):
+        with self._lock:
+            self._alterados.update(caminhos or [("*",)])
+            self._pendentes += 1
+            self.alteracoes += 1
+            self._ultima_mensagem = mensagem
+            if self._primeira_alteracao is None:
+                self._primeira_alteracao = time.monotonic()
+            acordar = self._pendentes == 1 or self._pendentes >= self.max_alteracoes
+        if acordar and self._rodando:
+            self._loop.call_soon_threadsafe(self._evento.set)
+
+    def anexar(self, caminhos):
+        # Caminhos que seguem junto com a próxima gravação sem contar como
+        # alteração: não agendam nem antecipam gravação nenhuma (ex.: logs)
+        with self._lock:
+            self._alterados.update(caminhos)
+
+    async def gravar_agora(self, mensagem: str = "Atualização do bot", caminhos=None) -> bool:
+        self.marcar_alterado(mensagem, caminhos)
+        if not self.iniciado:
+            return False
+        return await self.descarregar()
+
+    def salvar_agora(self, mensagem: str = "Atualização do bot", caminhos=None, timeout: float = 60) -> bool:
+        # Ponte para threads fora do loop do bot (Flask): agenda a gravação no
+        # loop e espera o resultado
+        self.marcar_alterado(mensagem, caminhos)
+        if not self.iniciado:
+            return False
+        try:
+            if asyncio.get_running_loop() is self._loop:
+                self._loop.create_task(self.descarregar())
+                return True
+        except RuntimeError:
+            pass
+        futuro = asyncio.run_coroutine_threadsafe(self.descarregar(), self._loop)
+        try:
+            return futuro.result(timeout)
+        except Exception as e:
+            print(f"❌ Erro na gravação imediata: {e}")
+            return False
+
+    def iniciar(self):
+        if self._rodando:
+            return False
+        self._loop = asyncio.get_running_loop()
+        self._evento = asyncio.Event()
+        self._lock_gravacao = asyncio.Lock()
+        self._rodando = True
+        self.iniciado = True
+        self._tarefa = self._loop.create_task(self._executar())
+        return True
+
+    async def parar(self):
+        if not self._rodando:
+            return
+        self._rodando = False
+        self._evento.set()
+        await self._tarefa
+        await self.descarregar(final=True)
+
+    def estatisticas(self) -> dict:
+        with self._lock:
+            return {
+                "alteracoes": self.alteracoes,
+                "gravacoes": self.gravacoes,
+                "falhas": self.falhas,
+                "coalescidas": self.coalescidas,
+                "pendentes": self._pendentes,
+                "intervalo_segundos": self.intervalo,
+                "max_alteracoes": self.max_alteracoes
+            }
+
+    def _tempo_ate_gravar(self):
+        # None = nada pendente; 0 = gravar já; >0 = segundos até a próxima janela
+        with self._lock:
+            if not self._pendentes:
+                return None
+            agora = time.monotonic()
+            if agora < self._nao_antes_de:
+                return self._nao_antes_de - agora
+            if self._pendentes >= self.max_alteracoes:
+                return 0.0
+            return max(0.0, self.intervalo - (agora - self._primeira_alteracao))
+
+    async def _executar(self):
+        while self._rodando:
+            # Limpar o evento antes de medir evita perder um aviso no meio do caminho
+            self._evento.clear()
+            espera = self._tempo_ate_gravar()
+            if espera == 0.0:
+                await self.descarregar()
+                continue
+            try:
+                await asyncio.wait_for(self._evento.wait(), espera)
+            except asyncio.TimeoutError:
+                pass
+
+    async def descarregar(self, final: bool = False) -> bool:
+        # final: grava também o que só foi anexado (no desligamento)
+        async with self._lock_gravacao:
+            with self._lock:
+                pendentes = self._pendentes
+                mensagem = self._ultima_mensagem or "Atualização do bot"
+                alterados = self._alterados
+                if not pendentes and not (final and alterados):
+                    return True
+                self._pendentes = 0
+                self._alterados = set()
+                self._primeira_alteracao = None
+
+            if pendentes > 1:
+                mensagem = f"{mensagem} (+{pendentes - 1} alterações)"
+            try:
+                ok = await self._gravar(mensagem, alterados)
+            except Exception as e:
+                print(f"❌ Erro na gravação adiada: {e}")
+                ok = False
+
+            with self._lock:
+                if ok:
+                    self.gravacoes += 1
+                    self.coalescidas += max(pendentes - 1, 0)
+                else:
+                    # Devolve as alterações e espera um intervalo inteiro antes de tentar de novo
+                    self.falhas += 1
+                    self._pendentes += pendentes
+                    self._alterados |= alterados
+                    if self._primeira_alteracao is None:
+                        self._primeira_alteracao = time.monotonic()
+                    self._nao_antes_de = time.monotonic() + self.intervalo
+            if ok and pendentes > 1:
+                print(f"💾 {pendentes} alterações agrupadas em uma gravação")
+            return ok
@@ -0,0 +1,100 @@
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from niveis import NIVEL_MAXIMO, CurvaNivel, MotorXP, RankingXP
+from persistencia import mesclar_documento
+
+
+def test_curva_padrao_igual_a_formula():
+    curva = CurvaNivel()
+    rnd = random.Random(1)
+    for xp in list(range(0, 50_000)) + [rnd.randrange(10 ** 8) for _ in range(5_000)]:
+        assert curva.nivel_de(xp) == int((xp / 100) ** 0.6) + 1
+
+
+@pytest.mark.parametrize("base, expoente", [(100, 0.2), (1, 0.5), (1, 1.0), (1_000_000, 0.2)])
+def test_curva_extrema_termina_e_respeita_o_teto(base, expoente):
+    curva = CurvaNivel(base=base, expoente=expoente)
+    nivel = curva.nivel_de(10 ** 20)
+    assert nivel <= NIVEL_MAXIMO
+    assert curva.limiar(nivel + 1) == float("inf")
+    assert all(b > a for a, b in zip(curva.limiares, curva.limiares[1:]))
+
+
+@pytest.mark.parametrize("config", [{"expoente": 0.1}, {"expoente": 0.12}, {"expoente": 2}, {"base": 0},
+                                    {"tipo": "linear", "passo": 0},
+                                    {"tipo": "tabela", "limiares": list(range(1, NIVEL_MAXIMO + 1))}])
+def test_curva_recusa_parametros_fora_dos_limites(config):
+    with pytest.raises(ValueError):
+        CurvaNivel.de_config(config)
+
+
+def _ordenado(xp: dict) -> list:
+    return sorted(xp.items(), key=lambda par: (-par[1], par[0]))
+
+
+def test_ranking_igual_a_ordenacao_completa():
+    # XP de poucos valores distintos para forçar empates (desempate pelo id)
+    rnd = random.Random(7)
+    xp = {rnd.randrange(10 ** 17, 10 ** 18): rnd.randrange(50) for _ in range(2_000)}
+    ranking = RankingXP()
+    ranking.reconstruir(xp.items())
+    for rodada in range(20):
+        for uid in rnd.sample(list(xp), 100):
+            novo = max(0, xp[uid] + rnd.randrange(-20, 21))
+            ranking.atualizar(uid, xp[uid], novo)
+            xp[uid] = novo
+        for _ in range(10):
+            uid = rnd.randrange(10 ** 17, 10 ** 18)
+            xp[uid] = rnd.randrange(50)
+            ranking.atualizar(uid, None, xp[uid])
+        esperado = _ordenado(xp)
+        assert ranking.top(25) == esperado[:25]
+        posicoes = {uid: i + 1 for i, (uid, _) in enumerate(esperado)}
+        for uid in rnd.sample(list(xp), 200):
+            assert ranking.posicao(uid, xp[uid]) == posicoes[uid]
+
+
+def test_motor_ranking_acompanha_adicionar_e_definir():
+    rnd = random.Random(3)
+    motor = MotorXP(CurvaNivel())
+    motor.carregar({str(uid): rnd.randrange(100) for uid in range(1, 500)}, {})
+    xp = {uid: motor.xp_de(uid) for uid in range(1, 500)}
+    for _ in range(5_000):
+        uid = rnd.randrange(1, 600)
+        if rnd.random() < 0.8:
+            ganho = rnd.randrange(1, 10)
+            motor.adicionar(uid, ganho)
+            xp[uid] = xp.get(uid, 0) + ganho
+        else:
+            xp[uid] = rnd.randrange(100)
+            motor.definir(uid, xp[uid])
+    esperado = _ordenado(xp)
+    assert motor.ranking.top(50) == esperado[:50]
+    for i, (uid, _) in enumerate(esperado):
+        assert motor.posicao(uid) == i + 1
+
+
+def test_mesclagem_no_motor_preserva_rebaixamento_local():
+    # Membro 5 rebaixado localmente (penalidade); o conflito é só no membro 6.
+    # Motor e snapshot mesclado pelo persistencia precisam concordar.
+    curva = CurvaNivel()
+    base = {"xp": {"5": curva.limiar(10), "6": 100}, "nivel": {"5": 10, "6": curva.nivel_de(100)}}
+    remoto = {"xp": {"5": curva.limiar(10), "6": 5_000}, "nivel": {"5": 10, "6": curva.nivel_de(5_000)}}
+    motor = MotorXP(curva)
+    motor.carregar(dict(base["xp"]), dict(base["nivel"]))
+    motor.definir(5, curva.limiar(2))
+    assert motor.nivel_do(5) == 2
+
+    xp, nivel = motor.exportar()
+    local = {"xp": xp, "nivel": nivel}
+    mesclar_documento(local, base, remoto)
+    motor.aplicar_mesclagem(base["xp"], remoto["xp"], base["nivel"], remoto["nivel"])
+
+    assert motor.nivel_do(5) == 2
+    assert motor.exportar() == (local["xp"], local["nivel"])
@@ -0,0 +1,76 @@
+import asyncio
+import copy
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from github_local import iniciar_servidor
+from persistencia import BackendGitHub, ClienteGitHub, Diario, codificar_snapshot, decodificar_snapshot
+
+
+def _backend(servidor):
+    url = f"http://127.0.0.1:{servidor.server_address[1]}/repos/teste/dados"
+    return BackendGitHub(ClienteGitHub(url, "teste", "main"), "data.json", "data")
+
+
+def test_commit_multiplo_sem_ponta_mescla_gravacao_concorrente():
+    # B carrega pela Contents API (sem ponta conhecida), A grava xp e fila, e a
+    # primeira gravação de vários fragmentos de B precisa mesclar, não sobrescrever
+    servidor, repositorio = iniciar_servidor(porta=0)
+
+    async def cenario():
+        a, b = _backend(servidor), _backend(servidor)
+        inicial = {"xp": {"1": 100}, "nivel": {"1": 1},
+                   "fila": {"entradas": [{"id": "a"}], "historico": []}, "config": {}}
+        await a.salvar(copy.deepcopy(inicial), {("*",)}, "Carga inicial")
+
+        dados_a = await a.carregar()
+        dados_b = await b.carregar()
+        assert b.cliente.commit_ponta is None
+
+        dados_a["xp"]["1"] += 10
+        dados_a["fila"]["entradas"].append({"id": "b"})
+        assert await a.salvar(dados_a, {("xp", "1"), ("fila",)}, "A")
+
+        dados_b["xp"]["1"] += 5
+        dados_b["fila"]["entradas"].append({"id": "c"})
+        assert await b.salvar(dados_b, {("xp", "1"), ("fila",)}, "B")
+        conflitos = sum(b.estatisticas()["conflitos_por_fragmento"].values())
+        await a.fechar()
+        await b.fechar()
+        return conflitos
+
+    try:
+        conflitos = asyncio.run(cenario())
+        arquivos = repositorio.arquivos_do_branch("main")
+        xp = decodificar_snapshot(repositorio.blobs[arquivos["data/xp.json"]])
+        fila = decodificar_snapshot(repositorio.blobs[arquivos["data/fila.json"]])
+    finally:
+        servidor.shutdown()
+    assert conflitos >= 1
+    assert xp["xp"]["1"] == 115
+    assert sorted(e["id"] for e in fila["fila"]["entradas"]) == ["a", "b", "c"]
+
+
+def test_reaplicar_diario_duas_vezes_nao_duplica_logs(tmp_path):
+    diario = Diario(str(tmp_path / "diario.jsonl"))
+    for n in (1, 2, 3):
+        diario.registrar("append", ("logs",), {"n": n, "entrada": f"log {n}"})
+    diario.registrar("append", ("historico",), "a")
+    diario.registrar("append", ("historico",), "b")
+    dados = {}
+    diario.reaplicar(dados)
+    diario.reaplicar(dados)
+    assert [r["n"] for r in dados["logs"]] == [1, 2, 3]
+    assert dados["historico"] == ["a", "b"]
+
+
+def test_binario_preserva_chaves_que_nao_sao_inteiros_canonicos():
+    documento = {
+        "xp": {"123456789012345678": 10, "9223372036854775807": 1},
+        "cargos_nivel": {"05": 111, "10": 222},
+        "outra": {"²": 3},
+        "grande": {"9223372036854775808": 1},
+    }
+    assert decodificar_snapshot(codificar_snapshot(documento, "binario")) == documento